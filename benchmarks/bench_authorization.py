@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# bench_authorization.py
+#
+# Benchmark of the authorization hot paths on an in-memory SQLite database:
+# permission and role checks on cold and warm users, node access, the JWT payload
+# and token verification, the removal of expired roles and the role forms.
+# Every combination of the given role counts, hierarchy depths and user counts is
+# measured and the results are written as JSON, for comparison across versions.
+#
+#   python -m benchmarks.bench_authorization --roles 10,100 --depth 1,5 --users 100
+import argparse
+import itertools
+import json
+import sys
+
+from benchmarks.utils import build_policy, get_metadata, setup_database, timed
+from boot_django import boot_django
+
+
+def run(roles, depth, users, repeat, seed):
+    from django.contrib.auth import get_user_model
+    from django.utils.timezone import now
+    from rest_framework_jwt.utils import jwt_encode_payload
+
+    from rbaca.api.serializers import ExpandedTokenVerification
+    from rbaca.api.utils import jwt_payload_handler
+    from rbaca.backends import RoleBackend
+    from rbaca.cache import clear_user_cache
+    from rbaca.forms import RoleExpirationForm, RoleForm, UserRoleForm
+    from rbaca.models import RoleExpiration
+
+    created_users, created_roles = build_policy(roles, depth, users, seed)
+    user_model = get_user_model()
+    user = created_users[0]
+    role = user.roles.order_by("id").first()
+    perm = "%s.%s" % (
+        role.permissions.first().content_type.app_label,
+        role.permissions.first().codename,
+    )
+    backend = RoleBackend()
+    token = jwt_encode_payload(jwt_payload_handler(user))
+    other_role = next(
+        r for r in created_roles if r.senior_role_id is None and r != role
+    )
+    user_roles = user_model._meta.get_field("roles").remote_field.through
+    assignments = list(user_roles.objects.values_list("user_id", "role_id"))
+    expirations = list(
+        RoleExpiration.objects.values_list("user_id", "role_id", "expiration_date")
+    )
+
+    def cold_user():
+        return user_model._default_manager.get(pk=user.pk)
+
+    def restore_expirations():
+        user_roles.objects.all().delete()
+        user_roles.objects.bulk_create(
+            user_roles(user_id=user_id, role_id=role_id)
+            for user_id, role_id in assignments
+        )
+        RoleExpiration.objects.all().delete()
+        RoleExpiration.objects.bulk_create(
+            RoleExpiration(user_id=user_id, role_id=role_id, expiration_date=date)
+            for user_id, role_id, date in expirations
+        )
+
+    def clear():
+        clear_user_cache(user)
+
+    return {
+        "benchmark": "authorization",
+        "roles": roles,
+        "depth": depth,
+        "users": users,
+        "has_perm_cold_ms": timed(lambda: cold_user().has_perm(perm), repeat),
+        "has_perm_warm_ms": timed(lambda: user.has_perm(perm), repeat),
+        "has_role_cold_ms": timed(lambda: cold_user().has_role(role.name), repeat),
+        "has_role_warm_ms": timed(lambda: user.has_role(role.name), repeat),
+        "get_node_access_ms": timed(
+            lambda: backend.get_node_access(user), repeat, setup=clear
+        ),
+        "jwt_payload_handler_ms": timed(
+            lambda: jwt_payload_handler(user), repeat, setup=clear
+        ),
+        "token_verification_ms": timed(
+            lambda: ExpandedTokenVerification(
+                data={"token": token, "node": "test_node_1"}
+            ).is_valid(),
+            repeat,
+        ),
+        "remove_expired_roles_ms": timed(
+            RoleExpiration.manage.remove_expired_roles,
+            max(1, repeat // 10),
+            setup=restore_expirations,
+        ),
+        "role_form_ms": timed(
+            lambda: RoleForm(
+                data={
+                    "name": "new_role",
+                    "senior_role": role.id,
+                    "incompatible_roles": [other_role.id],
+                }
+            ).is_valid(),
+            repeat,
+        ),
+        "user_role_form_ms": timed(
+            lambda: UserRoleForm(
+                instance=user,
+                data={"roles": list(user.roles.values_list("id", flat=True))},
+            ).is_valid(),
+            repeat,
+        ),
+        "role_expiration_form_ms": timed(
+            lambda: RoleExpirationForm(
+                user,
+                allow_superroles=True,
+                data={"role": other_role.id, "expiration_date": now().date()},
+            ).is_valid(),
+            repeat,
+        ),
+    }
+
+
+def parse_counts(value):
+    return [int(count) for count in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--roles", type=parse_counts, default=[10, 100])
+    parser.add_argument("--depth", type=parse_counts, default=[1, 5])
+    parser.add_argument("--users", type=parse_counts, default=[100, 1000])
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    boot_django()
+    setup_database()
+    results = [
+        run(roles, depth, users, args.repeat, args.seed)
+        for roles, depth, users in itertools.product(args.roles, args.depth, args.users)
+    ]
+    json.dump({"meta": get_metadata(), "results": results}, sys.stdout, indent=2)
+    sys.stdout.write("\n")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# bench_constraints.py
+#
+# Benchmark of the separation of duty constraint engine with many roles and a dense
+# incompatibility relation. Runs offline without a database.
+#
+#   python -m benchmarks.bench_constraints --roles 10000 --density 0.05
+import argparse
+import json
+import random
+import sys
+from time import perf_counter
+
+from benchmarks.utils import timed
+from boot_django import boot_django
+
+
+def naive_is_conflict_free(pairs, role_ids):
+    """
+    Reference implementation of `is_conflict_free` with python sets, for comparison.
+    Stops at the first conflict, like the engine.
+    """
+    return not any(
+        (role_id, other_id) in pairs for role_id in role_ids for other_id in role_ids
+    )
+
+
+def naive_conflicts(pairs, role_ids):
+    """
+    Reference implementation of `get_conflicts` with python sets, for comparison.
+    Enumerates every conflict, like the engine.
+    """
+    return sorted(
+        {
+            (min(role_id, other_id), max(role_id, other_id))
+            for role_id in role_ids
+            for other_id in role_ids
+            if (role_id, other_id) in pairs
+        }
+    )
+
+
+def run(roles, density, selection, held, repeat, seed):
+    from rbaca.constraints import ConstraintEngine
+
+    rng = random.Random(seed)
+    role_ids = list(range(1, roles + 1))
+    pairs = {
+        (role_id, other_id)
+        for role_id in role_ids
+        for other_id in rng.sample(role_ids, int(roles * density))
+        if role_id != other_id
+    }
+    symmetric_pairs = pairs | {(other_id, role_id) for role_id, other_id in pairs}
+
+    start = perf_counter()
+    engine = ConstraintEngine(pairs, role_ids=role_ids)
+    build_ms = (perf_counter() - start) * 1000
+
+    selected = rng.sample(role_ids, selection)
+    held_roles = rng.sample(role_ids, held)
+
+    return {
+        "benchmark": "constraints",
+        "roles": roles,
+        "density": density,
+        "pairs": len(pairs),
+        "selection": selection,
+        "held": held,
+        "build_ms": build_ms,
+        "is_conflict_free_ms": timed(lambda: engine.is_conflict_free(selected), repeat),
+        "naive_is_conflict_free_ms": timed(
+            lambda: naive_is_conflict_free(symmetric_pairs, selected), repeat
+        ),
+        "get_conflicts_ms": timed(lambda: engine.get_conflicts(selected), repeat),
+        "naive_conflicts_ms": timed(
+            lambda: naive_conflicts(symmetric_pairs, selected), repeat
+        ),
+        "get_assignable_roles_ms": timed(
+            lambda: engine.get_assignable_roles(held_roles), repeat
+        ),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--roles", type=int, default=10000)
+    parser.add_argument("--density", type=float, default=0.05)
+    parser.add_argument("--selection", type=int, default=300)
+    parser.add_argument("--held", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    boot_django()
+    json.dump(run(**vars(args)), sys.stdout, indent=2)
+    sys.stdout.write("\n")
@@ -0,0 +1,97 @@
+# utils.py
+#
+# Helpers shared by the benchmarks: timing, an isolated in-memory database and
+# generated datasets of a given shape.
+import platform
+from io import StringIO
+from time import perf_counter
+
+
+def timed(func, repeat, setup=None):
+    """
+    Run a function several times and return the mean duration in milliseconds.
+    The optional setup function runs before each call and is not timed.
+    """
+    total = 0.0
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = perf_counter()
+        func()
+        total += perf_counter() - start
+    return total * 1000 / repeat
+
+
+def get_metadata():
+    """
+    Describe the environment the results were measured in, for comparing runs.
+    """
+    import django
+    from django.db import connection
+
+    try:
+        from importlib.metadata import version
+
+        rbaca_version = version("django-rbaca")
+    except Exception:
+        rbaca_version = None
+
+    return {
+        "rbaca": rbaca_version,
+        "django": django.get_version(),
+        "python": platform.python_version(),
+        "database": connection.vendor,
+    }
+
+
+def setup_database():
+    """
+    Create the tables in a fresh in-memory test database, leaving the configured one alone.
+    """
+    from django.db import connection
+
+    connection.creation.create_test_db(verbosity=0, keepdb=False)
+
+
+def clear_policy():
+    """
+    Delete all users and roles created by a previous benchmark case.
+    """
+    from django.contrib.auth import get_user_model
+
+    from rbaca.models import Role
+
+    get_user_model()._default_manager.all().delete()
+    Role.objects.all().delete()
+
+
+def build_policy(roles, depth, users, seed=0):
+    """
+    Generate a dataset with `rbaca_generate`: hierarchies of the given depth, one
+    hierarchy and an expiration, about half of them in the past, for every user.
+
+    Returns:
+        Tuple[List[User], List[Role]]: The users and the roles.
+    """
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+
+    from rbaca.models import Role
+
+    clear_policy()
+    call_command(
+        "rbaca_generate",
+        roles=roles,
+        depth=depth,
+        cluster_size=1,
+        users=users,
+        roles_per_user=1,
+        sessions=0,
+        expirations=1,
+        seed=seed,
+        stdout=StringIO(),
+    )
+    return (
+        list(get_user_model()._default_manager.order_by("pk")),
+        list(Role.objects.order_by("id")),
+    )
@@ -0,0 +1,13 @@
+def changeset():
+    """
+    Batch role administration changes into a single transaction with a single invalidation.
+    See `rbaca.changesets.changeset`.
+
+    Example:
+        with rbaca.changeset() as changes:
+            changes.grant(role, perms)
+            changes.assign(users, role)
+    """
+    from rbaca.changesets import changeset
+
+    return changeset()
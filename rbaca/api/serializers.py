@@ -2,6 +2,8 @@ from rest_framework import serializers
 from rest_framework_jwt.serializers import VerifyAuthTokenSerializer
 from rest_framework_jwt.utils import check_payload, check_user
 
+from rbaca.models import AuditEntry
+
 
 class ExpandedTokenVerification(VerifyAuthTokenSerializer):
     node = serializers.CharField()
@@ -13,8 +15,14 @@ class ExpandedTokenVerification(ExpandedTokenVerification):
 
     This serializer is used to verify JWT tokens with additional node access
     information.
+
+    Attributes:
+        user (User): The user of a valid token, also set if the token has no access
+            to the requested node.
     """
 
+    user = None
+
     def _check_node_access(self, payload, node):
         """
         Check if the token payload contains access to the specified node.
@@ -63,6 +71,28 @@ class ExpandedTokenVerification(ExpandedTokenVerification):
 
         payload = check_payload(token=token)
         user = check_user(payload=payload)
+        self.user = user
         node_access = self._check_node_access(payload=payload, node=node)
 
         return {"token": token, "user": user, "node_access": node_access}
+
+
+class AuditEntrySerializer(serializers.ModelSerializer):
+    """
+    Serializer for the entries of the role administration audit trail.
+    """
+
+    class Meta:
+        model = AuditEntry
+        fields = [
+            "id",
+            "actor",
+            "action",
+            "target_id",
+            "target_name",
+            "roles_before",
+            "roles_after",
+            "permissions_before",
+            "permissions_after",
+            "date",
+        ]
@@ -5,8 +5,10 @@ from rest_framework_jwt.settings import api_settings
 from rest_framework_jwt.utils import get_username_field, unix_epoch
 
 from rbaca.backends import RoleBackend
+from rbaca.instrumentation import instrumented
 
 
+@instrumented("api.jwt_payload_handler")
 def jwt_payload_handler(user):
     """
     Custom JWT payload handler.
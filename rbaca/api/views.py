@@ -1,8 +1,15 @@
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import ListAPIView
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import BasePermission
 from rest_framework.response import Response
 from rest_framework_jwt.views import BaseJSONWebTokenAPIView
 
-from rbaca.api.serializers import ExpandedTokenVerification
+from rbaca.api.serializers import AuditEntrySerializer, ExpandedTokenVerification
+from rbaca.decisions import log_decision
+from rbaca.instrumentation import instrumented
+from rbaca.models import AccessDecision, AuditEntry
 
 
 class VerifyNodeAcces(BaseJSONWebTokenAPIView):
@@ -24,6 +31,7 @@ class VerifyNodeAcces(BaseJSONWebTokenAPIView):
 
     serializer_class = ExpandedTokenVerification
 
+    @instrumented("api.verify_node_access")
     def post(self, request, *args, **kwargs):
         """
         Handle POST requests for verifying node access.
@@ -47,6 +55,73 @@ class VerifyNodeAcces(BaseJSONWebTokenAPIView):
         serializer = self.get_serializer(data=request.data)
 
         if serializer.is_valid():
+            user = serializer.validated_data["user"]
+            log_decision(AccessDecision.NODE, user.pk, request.data["node"], True)
             return super().post(request, *args, **kwargs)
 
+        user_id = serializer.user.pk if serializer.user is not None else None
+        log_decision(AccessDecision.NODE, user_id, request.data.get("node", ""), False)
         return Response(serializer.errors, status=status.HTTP_403_FORBIDDEN)
+
+
+class CanViewAuditEntries(BasePermission):
+    """
+    Allow access to users with the "rbaca.view_auditentry" permission.
+    """
+
+    def has_permission(self, request, view):
+        return request.user.has_perm("rbaca.view_auditentry")
+
+
+class AuditEntryPagination(CursorPagination):
+    """
+    Cursor pagination of the audit trail, newest entries first.
+
+    A cursor keeps its position while new entries are written, and every page is read with
+    an index range scan instead of an offset.
+    """
+
+    ordering = "-id"
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+
+class AuditEntryList(ListAPIView):
+    """
+    View to read the role administration audit trail.
+
+    The entries can be filtered by the `actor`, `action` and `target_id` query parameters.
+    Follow the `next` link of a response to read the next page.
+
+    Example:
+        ```
+        GET /audit-trail/?target_id=42&page_size=50
+        ```
+    """
+
+    serializer_class = AuditEntrySerializer
+    pagination_class = AuditEntryPagination
+    permission_classes = [CanViewAuditEntries]
+    filters = ("actor", "action", "target_id")
+
+    def get_queryset(self):
+        """
+        Get the audit entries matching the query parameters.
+
+        Returns:
+            QuerySet[AuditEntry]: The matching audit entries.
+
+        Raises:
+            ValidationError: If a query parameter is not a valid value of its field.
+        """
+        try:
+            return AuditEntry.objects.filter(
+                **{
+                    name: self.request.query_params[name]
+                    for name in self.filters
+                    if name in self.request.query_params
+                }
+            )
+        except ValueError as error:
+            raise ValidationError(str(error))
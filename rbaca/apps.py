@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class RbacaConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "rbaca"
+
+    def ready(self):
+        from rbaca import signals  # noqa: F401
@@ -0,0 +1,201 @@
+import atexit
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+from django.conf import settings
+from django.core.signals import request_finished, setting_changed
+from django.db import transaction
+from django.utils.timezone import now
+
+from rbaca.buffers import WriteBehindBuffer
+
+_trail = None
+_trail_lock = Lock()
+_actor = ContextVar("rbaca_audit_actor", default=None)
+
+
+class AuditTrail(WriteBehindBuffer):
+    """
+    An in-process buffer of role administration changes that is written to the database in
+    batches with `bulk_create`.
+
+    Changes are buffered once their transaction committed, so rolled back changes leave no
+    entry and the administration itself only pays for reading the previous state. Unlike
+    the decision log, the audit trail is lossless: once the buffer is full, the thread
+    recording a change writes the buffer itself, entries whose write failed are written
+    again with the next flush, and the remaining entries are written when the process exits.
+    Entries are only lost if the process is killed without running its exit handlers.
+    """
+
+    def __init__(self, buffer_size=10000, batch_size=500, flush_interval=5.0):
+        super().__init__(
+            "rbaca.AuditEntry",
+            buffer_size=buffer_size,
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+            lossless=True,
+            name="rbaca.audit",
+        )
+
+
+def _use_audit_trail():
+    """
+    Check if role administration changes are audited.
+
+    Returns:
+        bool: True if `USE_AUDIT_TRAIL` is enabled, otherwise False.
+    """
+    return getattr(settings, "USE_AUDIT_TRAIL", False)
+
+
+def get_audit_trail():
+    """
+    Get the audit trail of this process, created from the `AUDIT_TRAIL_*` settings on first use.
+
+    Returns:
+        Union[AuditTrail, None]: The audit trail, or None if `USE_AUDIT_TRAIL` is disabled.
+    """
+    global _trail
+
+    if not _use_audit_trail():
+        return None
+
+    if _trail is None:
+        with _trail_lock:
+            if _trail is None:
+                _trail = AuditTrail(
+                    buffer_size=getattr(settings, "AUDIT_TRAIL_BUFFER_SIZE", 10000),
+                    batch_size=getattr(settings, "AUDIT_TRAIL_BATCH_SIZE", 500),
+                    flush_interval=getattr(settings, "AUDIT_TRAIL_FLUSH_INTERVAL", 5.0),
+                )
+    return _trail
+
+
+@contextmanager
+def audit_actor(user):
+    """
+    Attribute the changes made within the context to the given user.
+
+    Args:
+        user (Union[User, None]): The user making the changes.
+
+    Example:
+        with audit_actor(request.user):
+            user.assign_roles(role)
+    """
+    token = _actor.set(user)
+
+    try:
+        yield
+    finally:
+        _actor.reset(token)
+
+
+def get_actor_id():
+    """
+    Get the id of the user the current changes are attributed to.
+
+    Returns:
+        Union[int, None]: The id of the authenticated actor, otherwise None.
+    """
+    actor = _actor.get()
+
+    if actor is None or not actor.is_authenticated:
+        return None
+    return actor.pk
+
+
+def record_change(
+    action,
+    target,
+    roles_before=None,
+    roles_after=None,
+    permissions_before=None,
+    permissions_after=None,
+):
+    """
+    Record a role administration change once the current transaction committed, if
+    `USE_AUDIT_TRAIL` is enabled.
+
+    Args:
+        action (str): The kind of change, see `AuditEntry.ACTION_CHOICES`.
+        target (Union[Role, User]): The changed role or user.
+        roles_before (Iterable[int], optional): The role ids of the user before the change.
+        roles_after (Iterable[int], optional): The role ids of the user after the change.
+        permissions_before (Iterable[int], optional): The permission ids of the role before
+            the change.
+        permissions_after (Iterable[int], optional): The permission ids of the role after
+            the change.
+    """
+    trail = get_audit_trail()
+
+    if trail is None:
+        return
+
+    row = {
+        "actor_id": get_actor_id(),
+        "action": action,
+        "target_id": str(target.pk),
+        "target_name": str(target)[:255],
+        "roles_before": _as_sorted_ids(roles_before),
+        "roles_after": _as_sorted_ids(roles_after),
+        "permissions_before": _as_sorted_ids(permissions_before),
+        "permissions_after": _as_sorted_ids(permissions_after),
+        "date": now(),
+    }
+    transaction.on_commit(lambda: trail.append(row))
+
+
+def _as_sorted_ids(ids):
+    """
+    Sort ids for storing them in an audit entry.
+
+    Args:
+        ids (Union[Iterable[int], None]): The ids.
+
+    Returns:
+        Union[List[int], None]: The sorted ids, or None if no ids were given.
+    """
+    return None if ids is None else sorted(ids)
+
+
+def flush_audit_trail(**kwargs):
+    """
+    Write the buffered audit entries at the end of a request if no background thread
+    flushes them.
+    """
+    trail = _trail
+
+    if trail is not None and not trail.flush_interval:
+        trail.flush()
+
+
+def close_audit_trail():
+    """
+    Write the buffered audit entries and stop the background thread.
+    """
+    trail = _trail
+
+    if trail is not None:
+        trail.close()
+
+
+def reset_audit_trail(**kwargs):
+    """
+    Close and drop the audit trail, so it is created from the settings again.
+    """
+    global _trail
+
+    if kwargs.get("setting", "AUDIT_TRAIL").startswith(
+        ("USE_AUDIT_TRAIL", "AUDIT_TRAIL")
+    ):
+        with _trail_lock:
+            if _trail is not None:
+                _trail.close()
+            _trail = None
+
+
+request_finished.connect(flush_audit_trail, dispatch_uid="rbaca_flush_audit_trail")
+setting_changed.connect(reset_audit_trail, dispatch_uid="rbaca_reset_audit_trail")
+atexit.register(close_audit_trail)
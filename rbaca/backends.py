@@ -2,11 +2,93 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import BaseBackend
 from django.contrib.auth.models import Permission
-
-from rbaca.models import Role, Session
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils.timezone import now
+
+from rbaca.cache import (
+    clear_user_cache,
+    get_pending_invalidations,
+    get_policy_generation,
+    get_session_entry,
+    is_shared_cache,
+)
+from rbaca.instrumentation import instrumented, record_cache
+from rbaca.models import (
+    EffectivePermission,
+    Role,
+    RoleValidity,
+    Session,
+    _cache_session,
+    _use_role_inheritance,
+    _use_role_validity,
+    _use_session_cache,
+    _use_session_role_ids,
+    _user_roles_through,
+)
 
 UserModel = get_user_model()
 
+_role_permissions = None
+
+
+def get_role_permission_map():
+    """
+    Get the names of the permissions conferred by each role for the current policy generation.
+    If `USE_ROLE_INHERITANCE` is enabled, the permissions of the junior roles are included.
+
+    The map is loaded with at most two queries and shared between calls until the policy changes.
+    Maps loaded inside a transaction are not shared, since they may contain uncommitted changes,
+    and neither are maps of a process-local cache, which never sees the changes made by other
+    processes. Within a change set, whose changes only replace the policy generation once it
+    completes, the map is always loaded.
+
+    Returns:
+        Dict[int, FrozenSet[str]]: The permission names in the form app_label.codename,
+        keyed by the role id.
+    """
+    global _role_permissions
+    generation = (
+        get_policy_generation()
+        if is_shared_cache() and get_pending_invalidations() is None
+        else None
+    )
+
+    if generation is not None and _role_permissions is not None:
+        if _role_permissions[0] == generation:
+            return _role_permissions[1]
+
+    role_permissions = {}
+
+    for role_id, app_label, codename in Role.permissions.through.objects.values_list(
+        "role_id", "permission__content_type__app_label", "permission__codename"
+    ):
+        role_permissions.setdefault(role_id, set()).add(f"{app_label}.{codename}")
+
+    if _use_role_inheritance():
+        senior_roles = dict(
+            Role.objects.filter(senior_role__isnull=False).values_list(
+                "id", "senior_role_id"
+            )
+        )
+
+        for role_id, permissions in list(role_permissions.items()):
+            senior_role_id, seen = senior_roles.get(role_id), {role_id}
+
+            while senior_role_id is not None and senior_role_id not in seen:
+                seen.add(senior_role_id)
+                role_permissions.setdefault(senior_role_id, set()).update(permissions)
+                senior_role_id = senior_roles.get(senior_role_id)
+
+    role_permissions = {
+        role_id: frozenset(permissions)
+        for role_id, permissions in role_permissions.items()
+    }
+
+    if generation is not None and not transaction.get_connection().in_atomic_block:
+        _role_permissions = (generation, role_permissions)
+    return role_permissions
+
 
 class RoleBackend(BaseBackend):
     """
@@ -15,6 +97,7 @@ class RoleBackend(BaseBackend):
     This backend extends Django's authentication system to provide role-based access control.
     """
 
+    @instrumented("backend.authenticate")
     def authenticate(self, request, username=None, password=None, **kwargs):
         """
         Authenticate a user based on the provided username and password.
@@ -65,24 +148,103 @@ class RoleBackend(BaseBackend):
         if getattr(settings, "USE_SESSIONS", False):
             session = user_obj.get_active_session()
             if session:
-                session_roles_field = Session._meta.get_field("active_roles")
-                session_roles_query = (
-                    "role__%s" % session_roles_field.related_query_name()
-                )
-                permissions = Permission.objects.filter(
-                    **{session_roles_query: session}
-                )
+                roles = self._get_valid_roles(user_obj, session.active_roles.all())
+
+                if _use_role_inheritance():
+                    permissions = Permission.objects.filter(
+                        role__in=self._get_inherited_roles(roles)
+                    )
+                elif _use_role_validity():
+                    permissions = Permission.objects.filter(role__in=roles)
+                else:
+                    session_roles_field = Session._meta.get_field("active_roles")
+                    session_roles_query = (
+                        "role__%s" % session_roles_field.related_query_name()
+                    )
+                    permissions = Permission.objects.filter(
+                        **{session_roles_query: session}
+                    )
             else:
                 permissions = Permission.objects.none()
+        elif (
+            getattr(settings, "USE_EFFECTIVE_PERMISSIONS", False)
+            and not _use_role_validity()
+        ):
+            permissions = Permission.objects.filter(effectivepermission__user=user_obj)
+        elif _use_role_inheritance():
+            permissions = Permission.objects.filter(
+                role__in=self._get_inherited_roles(
+                    self._get_valid_roles(user_obj, user_obj.roles.all())
+                )
+            )
+        elif _use_role_validity():
+            permissions = Permission.objects.filter(
+                role__in=self._get_valid_roles(user_obj, user_obj.roles.all())
+            )
         else:
             user_roles_field = get_user_model()._meta.get_field("roles")
             user_roles_query = "role__%s" % user_roles_field.related_query_name()
             permissions = Permission.objects.filter(**{user_roles_query: user_obj})
         return permissions
 
+    def _get_valid_roles(self, user_obj, roles):
+        """
+        Exclude the roles whose assignment to the user is outside of its validity window,
+        if `USE_ROLE_VALIDITY` is enabled.
+
+        Args:
+            user_obj (User): The user the roles are assigned to.
+            roles (QuerySet[Role]): The roles to filter.
+
+        Returns:
+            QuerySet[Role]: The roles with a currently valid assignment.
+        """
+        if _use_role_validity():
+            roles = roles.exclude(
+                id__in=RoleValidity.manage.get_invalid_role_ids(user_obj)
+            )
+        return roles
+
+    def _expire_cache(self, user_obj):
+        """
+        Drop the cached permissions and roles of the user once one of their role assignments
+        became valid or invalid since they were cached, if `USE_ROLE_VALIDITY` is enabled.
+
+        Args:
+            user_obj (User): The user whose caches are checked.
+        """
+        if not _use_role_validity():
+            return
+
+        if hasattr(user_obj, "_validity_cache_expires"):
+            expires = user_obj._validity_cache_expires
+
+            if expires is None or now() < expires:
+                return
+
+            clear_user_cache(user_obj)
+
+        user_obj._validity_cache_expires = RoleValidity.manage.get_next_boundary(
+            user_obj
+        )
+
+    def _get_inherited_roles(self, roles):
+        """
+        Get the given roles together with all of their junior roles.
+
+        Args:
+            roles (QuerySet[Role]): The roles to resolve.
+
+        Returns:
+            QuerySet[Role]: The roles and all of their junior roles.
+        """
+        closure = Role.manage.get_junior_closure(roles.values_list("id", flat=True))
+        return Role.objects.filter(id__in=set().union(*closure.values()))
+
     def _get_user_roles(self, user_obj):
         """
-        Get the roles associated with the user.
+        Get the roles associated with the user. If `USE_ROLE_INHERITANCE` is enabled,
+        the junior roles of the assigned roles are included.
 
         Args:
             user_obj (User): The user for which roles are retrieved.
@@ -100,6 +262,11 @@ class RoleBackend(BaseBackend):
         else:
             roles = user_obj.roles.all()
 
+        roles = self._get_valid_roles(user_obj, roles)
+
+        if _use_role_inheritance():
+            roles = self._get_inherited_roles(roles)
+
         return roles
 
     def _get_permissions(self, user_obj, obj):
@@ -116,21 +283,106 @@ class RoleBackend(BaseBackend):
         if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
             return set()
 
+        self._expire_cache(user_obj)
         perm_cache_name = "_%s_perm_cache" % "roles"
+        hit = hasattr(user_obj, perm_cache_name)
+        record_cache("permissions", hit)
 
-        if not hasattr(user_obj, perm_cache_name):
+        if not hit:
             if user_obj.is_superuser:
-                perms = Permission.objects.all()
+                perms = self._get_permission_names(Permission.objects.all())
             else:
-                perms = getattr(self, "_get_%s_permissions" % "roles")(user_obj)
-            perms = perms.values_list("content_type__app_label", "codename").order_by()
-            setattr(
-                user_obj,
-                perm_cache_name,
-                {f"{ct}.{name}" for ct, name in perms},
-            )
+                perms = self._get_session_cached(
+                    user_obj,
+                    "permissions",
+                    lambda: self._get_role_permission_names(user_obj),
+                )
+            setattr(user_obj, perm_cache_name, perms)
         return getattr(user_obj, perm_cache_name)
 
+    def _get_role_permission_names(self, user_obj):
+        """
+        Get the names of the permissions associated with the user's roles. If `USE_SESSIONS`
+        and `USE_SESSION_ROLE_IDS` are enabled, they are resolved from the role ids stored on the
+        active session and the cached role permission map, without joining roles and permissions.
+
+        Args:
+            user_obj (User): The user for which permissions are retrieved.
+
+        Returns:
+            Set[str]: The names of the permissions.
+        """
+        if (
+            getattr(settings, "USE_SESSIONS", False)
+            and _use_session_role_ids()
+            and not _use_role_validity()
+        ):
+            session = user_obj.get_active_session()
+
+            if session is None:
+                return set()
+
+            role_permissions = get_role_permission_map()
+            return set().union(
+                *(
+                    role_permissions.get(role_id, ())
+                    for role_id in session.active_role_ids
+                )
+            )
+
+        return self._get_permission_names(
+            getattr(self, "_get_%s_permissions" % "roles")(user_obj)
+        )
+
+    def _get_permission_names(self, perms):
+        """
+        Get the names of permissions in the form app_label.codename.
+
+        Args:
+            perms (QuerySet[Permission]): The permissions.
+
+        Returns:
+            Set[str]: The names of the permissions.
+        """
+        perms = perms.values_list("content_type__app_label", "codename").order_by()
+        return {f"{ct}.{name}" for ct, name in perms}
+
+    def _get_session_cached(self, user_obj, key, compute):
+        """
+        Get a value derived from the active session of the user. If `USE_SESSIONS` and
+        `USE_SESSION_CACHE` are enabled, the value is cached across requests along with the session.
+
+        Args:
+            user_obj (User): The user owning the session.
+            key (str): The name of the value in the cached session entry.
+            compute (Callable[[], Set[str]]): Computes the value on a cache miss.
+
+        Returns:
+            Set[str]: The value.
+        """
+        if (
+            not getattr(settings, "USE_SESSIONS", False)
+            or not _use_session_cache()
+            or _use_role_validity()
+        ):
+            return compute()
+
+        session = user_obj.get_active_session()
+
+        if session is None:
+            return compute()
+
+        entry = get_session_entry(user_obj.pk)
+        hit = entry is not None and entry["session_id"] == session.pk and key in entry
+        record_cache("session_%s" % key, hit)
+
+        if hit:
+            return entry[key]
+
+        value = compute()
+        _cache_session(user_obj, session, **{key: value})
+        return value
+
     def _get_roles(self, user_obj, obj):
         """
         Get roles for the user based on roles.
@@ -146,17 +398,39 @@ class RoleBackend(BaseBackend):
         if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
             return set()
 
+        self._expire_cache(user_obj)
         roles_cache_name = "_%s_cache" % "roles"
+        hit = hasattr(user_obj, roles_cache_name)
+        record_cache("roles", hit)
 
-        if not hasattr(user_obj, roles_cache_name):
+        if not hit:
             if user_obj.is_superuser:
-                roles = Role.objects.all()
+                roles = self._get_role_names(Role.objects.all())
             else:
-                roles = getattr(self, "_get_%s_roles" % "user")(user_obj)
-            roles = roles.values_list("name").order_by()
-            setattr(user_obj, roles_cache_name, {"%s" % (name) for name in roles})
+                roles = self._get_session_cached(
+                    user_obj,
+                    "roles",
+                    lambda: self._get_role_names(
+                        getattr(self, "_get_%s_roles" % "user")(user_obj)
+                    ),
+                )
+            setattr(user_obj, roles_cache_name, roles)
         return getattr(user_obj, roles_cache_name)
 
+    def _get_role_names(self, roles):
+        """
+        Get the names of roles.
+
+        Args:
+            roles (QuerySet[Role]): The roles.
+
+        Returns:
+            Set[str]: The names of the roles.
+        """
+        roles = roles.values_list("name").order_by()
+        return {"%s" % (name) for name in roles}
+
+    @instrumented("backend.get_user_permissions")
     def get_user_permissions(self, user_obj, obj=None):
         """
         Get the permissions granted to the user.
@@ -170,6 +444,7 @@ class RoleBackend(BaseBackend):
         """
         return self._get_permissions(user_obj, obj)
 
+    @instrumented("backend.get_role_permissions")
     def get_role_permissions(self, user_obj, obj=None):
         """
         Get the permissions granted to the user based on roles.
@@ -183,6 +458,7 @@ class RoleBackend(BaseBackend):
         """
         return self._get_permissions(user_obj, obj)
 
+    @instrumented("backend.get_user_roles")
     def get_user_roles(self, user_obj, obj=None):
         """
         Get the roles granted to the user.
@@ -196,6 +472,7 @@ class RoleBackend(BaseBackend):
         """
         return self._get_roles(user_obj, obj)
 
+    @instrumented("backend.get_all_permissions")
     def get_all_permissions(self, user_obj, obj=None):
         """
         Get all permissions granted to the user.
@@ -209,10 +486,15 @@ class RoleBackend(BaseBackend):
         """
         if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
             return set()
-        if not hasattr(user_obj, "_roles_perm_cache"):
+        self._expire_cache(user_obj)
+        hit = hasattr(user_obj, "_roles_perm_cache")
+        record_cache("all_permissions", hit)
+
+        if not hit:
             user_obj._perm_cache = super().get_all_permissions(user_obj)
         return user_obj._perm_cache
 
+    @instrumented("backend.has_role")
     def has_role(self, user_obj, role):
         """
         Check if the user has a specific role.
@@ -226,6 +508,7 @@ class RoleBackend(BaseBackend):
         """
         return role in self.get_user_roles(user_obj)
 
+    @instrumented("backend.has_perm")
     def has_perm(self, user_obj, perm, obj=None):
         """
         Check if the user has a specific permission.
@@ -240,6 +523,7 @@ class RoleBackend(BaseBackend):
         """
         return user_obj.is_active and super().has_perm(user_obj, perm, obj=obj)
 
+    @instrumented("backend.has_module_perms")
     def has_module_perms(self, user_obj, app_label):
         """
         Check if the user has permissions for a specific app (module).
@@ -256,6 +540,7 @@ class RoleBackend(BaseBackend):
             for perm in self.get_all_permissions(user_obj)
         )
 
+    @instrumented("backend.get_user")
     def get_user(self, user_id):
         """
         Retrieve a user by their ID.
@@ -272,6 +557,100 @@ class RoleBackend(BaseBackend):
             return None
         return user if self.user_can_authenticate(user) else None
 
+    @instrumented("backend.with_perm")
+    def with_perm(self, perm, is_active=True, include_superusers=True, obj=None):
+        """
+        Get all users that own a specific permission through their roles.
+
+        Args:
+            perm (Union[Permission, str]): The permission to look for.
+            is_active (bool): Filter by the active status of the users, None to skip the filter.
+            include_superusers (bool): Decides if superusers are included in the result.
+            obj (Object): The object for which the permission is checked.
+
+        Returns:
+            QuerySet[User]: The users owning the permission.
+
+        Raises:
+            ValueError: If the permission string is not in the form app_label.codename.
+            TypeError: If the permission is neither a string nor a Permission.
+        """
+        if isinstance(perm, str):
+            try:
+                app_label, codename = perm.split(".")
+            except ValueError:
+                raise ValueError(
+                    "Permission name should be in the form "
+                    "app_label.permission_codename."
+                )
+            perm_query = {
+                "content_type__app_label": app_label,
+                "codename": codename,
+            }
+        elif isinstance(perm, Permission):
+            perm_query = {"pk": perm.pk}
+        else:
+            raise TypeError(
+                "The `perm` argument must be a string or a permission instance."
+            )
+
+        if obj is not None:
+            return UserModel._default_manager.none()
+
+        if (
+            getattr(settings, "USE_EFFECTIVE_PERMISSIONS", False)
+            and not getattr(settings, "USE_SESSIONS", False)
+            and not _use_role_validity()
+        ):
+            user_ids = EffectivePermission.objects.filter(
+                permission__in=Permission.objects.filter(**perm_query)
+            ).values("user_id")
+        else:
+            roles = Role.objects.filter(
+                **{"permissions__%s" % key: value for key, value in perm_query.items()}
+            )
+
+            if _use_role_inheritance():
+                roles = Role.objects.filter(
+                    id__in=Role.manage.get_senior_role_ids(
+                        roles.values_list("id", flat=True)
+                    )
+                )
+
+            if getattr(settings, "USE_SESSIONS", False):
+                session_roles = Session.active_roles.through.objects.filter(
+                    session__in=Session.manage.get_active_sessions(), role__in=roles
+                )
+                user_field, role_field = "session__user", "role"
+                assignments = session_roles
+            else:
+                through, user_field, role_field = _user_roles_through()
+                assignments = through.objects.filter(**{"%s__in" % role_field: roles})
+
+            if _use_role_validity():
+                assignments = assignments.filter(
+                    ~Exists(
+                        RoleValidity.manage.get_invalid().filter(
+                            user=OuterRef(user_field), role=OuterRef(role_field)
+                        )
+                    )
+                )
+
+            user_ids = assignments.values(user_field)
+
+        user_query = Q(pk__in=user_ids)
+
+        if include_superusers:
+            user_query |= Q(is_superuser=True)
+
+        users = UserModel._default_manager.filter(user_query)
+
+        if is_active is not None:
+            users = users.filter(is_active=is_active)
+
+        return users
+
+    @instrumented("backend.get_node_access")
     def get_node_access(self, user_obj):
         """
         Get access to specific nodes based on user roles.
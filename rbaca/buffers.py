@@ -0,0 +1,162 @@
+import logging
+from collections import deque
+from threading import Event, Lock, Thread
+
+from django.apps import apps
+from django.db import DatabaseError, close_old_connections, connection
+
+
+class WriteBehindBuffer:
+    """
+    An in-process buffer of rows that is written to the database in batches with `bulk_create`.
+
+    Appending a row never touches the database unless the buffer is lossless and full. The
+    buffer is flushed by a background thread every `flush_interval` seconds, or by the
+    caller, e.g. at the end of each request, if `flush_interval` is 0. `close` writes the
+    remaining rows, e.g. when the process exits.
+
+    A lossy buffer drops its oldest rows once it is full and drops a batch whose write
+    failed. A lossless buffer is written by the appending thread once it is full and keeps
+    a batch whose write failed, to write it again with the next flush.
+
+    Attributes:
+        model (str): The label of the model the rows are written to, e.g. "rbaca.AccessDecision".
+        buffer_size (int): The maximum number of buffered rows.
+        batch_size (int): The maximum number of rows written per insert.
+        flush_interval (float): The seconds between background flushes, 0 to flush manually.
+        lossless (bool): Decides if rows are kept until they are written, see above.
+        high_water_mark (int): The number of buffered rows above which sheddable rows are skipped.
+        shed (int): The number of sheddable rows skipped above the high-water mark.
+        dropped (int): The number of rows dropped because the buffer was full.
+        failed (int): The number of rows whose write failed.
+    """
+
+    def __init__(
+        self,
+        model,
+        buffer_size=10000,
+        batch_size=500,
+        flush_interval=5.0,
+        lossless=False,
+        name="rbaca.buffers",
+    ):
+        self.model = model
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lossless = lossless
+        self.high_water_mark = buffer_size * 3 // 4
+        self.logger = logging.getLogger(name)
+        self.buffer = deque()
+        self.lock = Lock()
+        self.flush_lock = Lock()
+        self.shed = self.dropped = self.failed = 0
+        self.thread = None
+        self.thread_name = name.replace(".", "-")
+        self.stopped = Event()
+
+    def append(self, row, sheddable=False):
+        """
+        Buffer a row.
+
+        Args:
+            row (Dict[str, Any]): The field values of the row.
+            sheddable (bool, optional): Skip the row if the buffer is above its high-water mark.
+
+        Returns:
+            bool: True if the row was buffered, otherwise False.
+        """
+        with self.lock:
+            if sheddable and len(self.buffer) >= self.high_water_mark:
+                self.shed += 1
+                return False
+            if not self.lossless and len(self.buffer) >= self.buffer_size:
+                self.buffer.popleft()
+                self.dropped += 1
+            self.buffer.append(row)
+            full = len(self.buffer) >= self.buffer_size
+
+        if self.flush_interval and self.thread is None:
+            self.start()
+        if full and self.lossless:
+            self.flush()
+        return True
+
+    def flush(self):
+        """
+        Write the buffered rows in batches. Returns immediately if another thread is
+        already flushing.
+
+        Returns:
+            int: The number of written rows.
+        """
+        if not self.flush_lock.acquire(blocking=False):
+            return 0
+
+        model = apps.get_model(self.model)
+        written = 0
+
+        try:
+            while True:
+                with self.lock:
+                    batch = [
+                        self.buffer.popleft()
+                        for _ in range(min(self.batch_size, len(self.buffer)))
+                    ]
+
+                if not batch:
+                    return written
+
+                try:
+                    model.objects.bulk_create([model(**row) for row in batch])
+                except DatabaseError:
+                    self.failed += len(batch)
+                    self.logger.exception(
+                        "could not write %d %s rows", len(batch), self.model
+                    )
+
+                    if self.lossless:
+                        with self.lock:
+                            self.buffer.extendleft(reversed(batch))
+                    return written
+
+                written += len(batch)
+        finally:
+            self.flush_lock.release()
+
+    def start(self):
+        """
+        Start the background thread flushing the buffer every `flush_interval` seconds.
+        """
+        with self.lock:
+            if self.thread is not None:
+                return
+            self.thread = Thread(target=self.run, name=self.thread_name, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        """
+        Flush the buffer periodically until `stop` is called.
+        """
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+            close_old_connections()
+
+        self.flush()
+        connection.close()
+
+    def stop(self):
+        """
+        Stop the background thread after a final flush.
+        """
+        self.stopped.set()
+
+        if self.thread is not None:
+            self.thread.join()
+
+    def close(self):
+        """
+        Write the remaining rows and stop the background thread.
+        """
+        self.stop()
+        self.flush()
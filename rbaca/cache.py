@@ -0,0 +1,238 @@
+from contextvars import ContextVar
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils.timezone import now
+
+POLICY_GENERATION_KEY = "rbaca:policy_generation"
+SESSION_KEY = "rbaca:session:%s"
+
+_pending_invalidations = ContextVar("rbaca_pending_invalidations", default=None)
+
+USER_CACHE_ATTRIBUTES = (
+    "_roles_perm_cache",
+    "_roles_cache",
+    "_perm_cache",
+    "_session_cache",
+    "_validity_cache_expires",
+)
+
+
+class PendingInvalidations:
+    """
+    Invalidations collected while a change set is applied, emitted once when it completes.
+
+    Attributes:
+        policy (bool): Whether the cached policy has to be invalidated.
+        user_ids (Set[int]): The users whose effective permissions have to be refreshed.
+        role_ids (Set[int]): The roles whose users' effective permissions have to be refreshed.
+        session_user_ids (Set[int]): The users whose cached active session has to be dropped.
+    """
+
+    def __init__(self):
+        self.policy = False
+        self.user_ids = set()
+        self.role_ids = set()
+        self.session_user_ids = set()
+
+
+def get_pending_invalidations():
+    """
+    Get the invalidations collected by the change set being applied in the current context.
+
+    Returns:
+        Union[PendingInvalidations, None]: The collected invalidations, or None outside of
+        a change set.
+    """
+    return _pending_invalidations.get()
+
+
+def set_pending_invalidations(pending):
+    """
+    Start or stop collecting invalidations in the current context.
+
+    Args:
+        pending (Union[PendingInvalidations, None]): The invalidations to collect into,
+            or None to emit invalidations immediately again.
+
+    Returns:
+        Token: The token to restore the previous state with `reset_pending_invalidations`.
+    """
+    return _pending_invalidations.set(pending)
+
+
+def reset_pending_invalidations(token):
+    """
+    Restore the state before the matching `set_pending_invalidations` call.
+
+    Args:
+        token (Token): The token returned by `set_pending_invalidations`.
+    """
+    _pending_invalidations.reset(token)
+
+
+def get_cache():
+    """
+    Get the cache used by rbaca, configured by `RBACA_CACHE_ALIAS`.
+
+    Returns:
+        BaseCache: The cache backend.
+    """
+    return caches[getattr(settings, "RBACA_CACHE_ALIAS", "default")]
+
+
+def is_shared_cache():
+    """
+    Check if the cache used by rbaca is shared between processes. The local memory and dummy
+    caches are not: an invalidation in one process would never reach the others, so nothing
+    may be kept across requests based on them.
+
+    Returns:
+        bool: True if the cache is shared between processes, otherwise False.
+    """
+    return not isinstance(get_cache(), (LocMemCache, DummyCache))
+
+
+def get_policy_generation():
+    """
+    Get the token identifying the current state of the roles, their permissions,
+    the hierarchy and the incompatibilities.
+
+    Returns:
+        Union[str, None]: The current token, or None if the cache does not store values.
+    """
+    cache = get_cache()
+    generation = cache.get(POLICY_GENERATION_KEY)
+
+    if generation is None:
+        cache.add(POLICY_GENERATION_KEY, uuid4().hex, None)
+        generation = cache.get(POLICY_GENERATION_KEY)
+    return generation
+
+
+def bump_policy_generation():
+    """
+    Replace the policy generation token, which invalidates everything cached for the previous one.
+    """
+    get_cache().set(POLICY_GENERATION_KEY, uuid4().hex, None)
+
+
+def policy_changed():
+    """
+    Invalidate the cached policy immediately and again once the current transaction commits,
+    so other processes never keep data loaded before the commit. Within a change set,
+    the invalidation is deferred until the change set completes.
+    """
+    pending = get_pending_invalidations()
+
+    if pending is not None:
+        pending.policy = True
+        return
+
+    bump_policy_generation()
+    transaction.on_commit(bump_policy_generation)
+
+
+def clear_user_cache(user):
+    """
+    Drop the permission, role and session caches stored on a user instance.
+
+    Args:
+        user (User): The user whose caches are dropped.
+    """
+    for attribute in USER_CACHE_ATTRIBUTES:
+        user.__dict__.pop(attribute, None)
+
+
+def invalidate_users(users):
+    """
+    Invalidate the cached authorization data of several users at once.
+
+    Args:
+        users (Iterable[User]): The users whose caches are invalidated.
+    """
+    for user in users:
+        clear_user_cache(user)
+
+
+def get_session_entry(user_id):
+    """
+    Get the cached active session of a user, with the values derived from it.
+
+    Args:
+        user_id (int): The id of the user.
+
+    Returns:
+        Union[dict, None]: The cached entry, or None if there is no entry for the current policy
+        generation. The entry holds the `session_id` and `date_start` of the active session,
+        None for both if the user has no active session, and optionally `permissions` and `roles`.
+    """
+    entry = get_cache().get(SESSION_KEY % user_id)
+
+    if entry is None or entry["generation"] != get_policy_generation():
+        return None
+    if entry["expires_at"] <= now():
+        return None
+    return entry
+
+
+def set_session_entry(user_id, values, expires_at):
+    """
+    Cache the active session of a user, or values derived from it, until the given time.
+    Values of an existing entry for the same session are kept. Inside a transaction, the entry
+    is only written once the transaction commits.
+
+    Args:
+        user_id (int): The id of the user.
+        values (dict): The values to cache, including the `session_id` they belong to.
+        expires_at (datetime): The time the entry expires, usually the timeout of the session.
+    """
+    generation = get_policy_generation()
+
+    if generation is None:
+        return
+
+    def write():
+        timeout = (expires_at - now()).total_seconds()
+
+        if timeout <= 0:
+            return
+
+        cache = get_cache()
+        entry = cache.get(SESSION_KEY % user_id)
+
+        if (
+            entry is None
+            or entry["generation"] != generation
+            or entry["session_id"] != values["session_id"]
+        ):
+            entry = {}
+        entry.update(values, generation=generation, expires_at=expires_at)
+        cache.set(SESSION_KEY % user_id, entry, timeout)
+
+    transaction.on_commit(write)
+
+
+def invalidate_session(user_id):
+    """
+    Drop the cached active session of a user immediately and again once the current transaction
+    commits. Within a change set, the invalidation is deferred until the change set completes.
+
+    Args:
+        user_id (int): The id of the user.
+    """
+    pending = get_pending_invalidations()
+
+    if pending is not None:
+        pending.session_user_ids.add(user_id)
+        return
+
+    def delete():
+        get_cache().delete(SESSION_KEY % user_id)
+
+    delete()
+    transaction.on_commit(delete)
@@ -0,0 +1,273 @@
+from contextlib import contextmanager
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils.itercompat import is_iterable
+
+from rbaca.cache import (
+    PendingInvalidations,
+    get_pending_invalidations,
+    invalidate_session,
+    policy_changed,
+    reset_pending_invalidations,
+    set_pending_invalidations,
+)
+from rbaca.management.utils import chunked
+from rbaca.models import EffectivePermission, Role, _as_roles
+
+BATCH_SIZE = 500
+
+changeset_applied = Signal()
+"""
+Sent once after a change set was applied and its transaction committed.
+
+Args:
+    sender (Type[ChangeSet]): The ChangeSet class.
+    changeset (ChangeSet): The applied change set.
+"""
+
+
+class ChangeSet:
+    """
+    A batch of role administration changes that is validated and applied together.
+
+    The queued changes are applied in one transaction when the `changeset` context exits, in
+    the order they were queued, so a later change overrides an earlier one, e.g. a grant
+    followed by a revoke of the same permission leaves it revoked. Consecutive changes of the
+    same kind are written together: permission grants with one bulk statement, revokes with
+    one delete per role, hierarchy edits validated together by `RoleManager.set_senior_roles` and role
+    assignments validated and written per batch by `RoleManager.bulk_assign`. Changes made
+    directly through the model methods inside the context are part of the same transaction.
+    All caches are invalidated once, after everything was applied.
+
+    Example:
+        with rbaca.changeset() as changes:
+            changes.grant(role, [perm1, perm2])
+            changes.assign(User.objects.filter(department="sales"), role)
+    """
+
+    GRANT = "grant"
+    REVOKE = "revoke"
+    ASSIGN = "assign"
+    DEASSIGN = "deassign"
+    SET_SENIOR_ROLE = "set_senior_role"
+
+    def __init__(self):
+        self.changes = []
+
+    def __len__(self):
+        return len(self.changes)
+
+    def grant(self, role, perms):
+        """
+        Queue granting permissions to a role.
+
+        Args:
+            role (Role): The role to grant the permissions to.
+            perms (Union[Permission, List[Permission]]): The permissions to grant.
+        """
+        self.changes.append((self.GRANT, role, _as_permissions(perms)))
+
+    def revoke(self, role, perms):
+        """
+        Queue revoking permissions from a role.
+
+        Args:
+            role (Role): The role to revoke the permissions from.
+            perms (Union[Permission, List[Permission]]): The permissions to revoke.
+        """
+        self.changes.append((self.REVOKE, role, _as_permissions(perms)))
+
+    def assign(self, users, roles):
+        """
+        Queue assigning roles to users.
+
+        Args:
+            users (Union[QuerySet[User], List[User]]): The users to assign the roles to.
+            roles (Union[Role, List[Role]]): The roles to assign.
+        """
+        self.changes.append((self.ASSIGN, users, _as_roles(roles)))
+
+    def deassign(self, users, roles):
+        """
+        Queue deassigning roles, and all of their senior roles, from users.
+
+        Args:
+            users (Union[QuerySet[User], List[User]]): The users to deassign the roles from.
+            roles (Union[Role, List[Role]]): The roles to deassign.
+        """
+        self.changes.append((self.DEASSIGN, users, _as_roles(roles)))
+
+    def set_senior_role(self, role, senior_role):
+        """
+        Queue setting the senior role of a role.
+
+        Args:
+            role (Role): The junior role.
+            senior_role (Role): The senior role to set.
+        """
+        self.changes.append((self.SET_SENIOR_ROLE, role, senior_role))
+
+    def apply(self):
+        """
+        Validate and write the queued changes in order. Must be called inside a transaction.
+
+        Raises:
+            ValueError: If a change violates a role constraint.
+        """
+        for kind, changes in groupby(self.changes, key=itemgetter(0)):
+            changes = [change[1:] for change in changes]
+
+            if kind == self.SET_SENIOR_ROLE:
+                Role.manage.set_senior_roles(changes)
+            elif kind == self.GRANT:
+                _grant(changes)
+            elif kind == self.REVOKE:
+                _revoke(changes)
+            elif kind == self.ASSIGN:
+                for users, roles in changes:
+                    Role.manage.bulk_assign(users, roles)
+            else:
+                for users, roles in changes:
+                    Role.manage.bulk_deassign(users, roles)
+
+
+def _grant(grants):
+    """
+    Grant permissions to roles with one bulk statement.
+
+    Args:
+        grants (List[Tuple[Role, List[Permission]]]): The roles and the permissions to grant.
+    """
+    through = Role.permissions.through
+    through.objects.bulk_create(
+        [
+            through(role_id=role.pk, permission_id=perm.pk)
+            for role, perms in grants
+            for perm in perms
+        ],
+        ignore_conflicts=True,
+    )
+    _permissions_changed(grants)
+
+
+def _revoke(revokes):
+    """
+    Revoke permissions from roles with one delete per role and batch of `BATCH_SIZE` permissions.
+
+    Args:
+        revokes (List[Tuple[Role, List[Permission]]]): The roles and the permissions to revoke.
+    """
+    perm_ids = {}
+
+    for role, perms in revokes:
+        perm_ids.setdefault(role.pk, set()).update(perm.pk for perm in perms)
+
+    for role_id, role_perm_ids in perm_ids.items():
+        for batch in chunked(sorted(role_perm_ids), BATCH_SIZE):
+            Role.permissions.through.objects.filter(
+                role_id=role_id, permission_id__in=batch
+            ).delete()
+    _permissions_changed(revokes)
+
+
+def _permissions_changed(changes):
+    """
+    Defer the invalidations caused by changed role permissions until the change set completes.
+
+    Args:
+        changes (List[Tuple[Role, List[Permission]]]): The changed roles and permissions.
+    """
+    pending = get_pending_invalidations()
+    pending.policy = True
+    pending.role_ids.update(role.pk for role, _ in changes)
+
+
+@contextmanager
+def changeset():
+    """
+    Batch role administration changes into a single transaction with a single invalidation.
+
+    Yields a ChangeSet to queue changes on, which are applied when the block exits without an
+    exception. Invalidations caused by the changes, including direct model method calls inside
+    the block, are deferred and emitted once. If the block raises, nothing is written.
+    Nested change sets are merged into the outermost one.
+
+    Yields:
+        ChangeSet: The change set to queue changes on.
+
+    Raises:
+        ValueError: If a queued change violates a role constraint.
+    """
+    changes = ChangeSet()
+
+    if get_pending_invalidations() is not None:
+        with transaction.atomic():
+            yield changes
+            changes.apply()
+        return
+
+    pending = PendingInvalidations()
+
+    with transaction.atomic():
+        token = set_pending_invalidations(pending)
+
+        try:
+            yield changes
+            changes.apply()
+        finally:
+            reset_pending_invalidations(token)
+
+        _flush(pending)
+
+    transaction.on_commit(
+        lambda: changeset_applied.send(sender=ChangeSet, changeset=changes)
+    )
+
+
+def _flush(pending):
+    """
+    Emit the invalidations collected while a change set was applied.
+
+    Args:
+        pending (PendingInvalidations): The collected invalidations.
+    """
+    if getattr(settings, "USE_EFFECTIVE_PERMISSIONS", False):
+        user_ids = set(pending.user_ids)
+
+        if pending.role_ids:
+            user_ids |= EffectivePermission.manage.get_role_user_ids(pending.role_ids)
+
+        if user_ids:
+            EffectivePermission.manage.refresh_users(user_ids)
+
+    if pending.policy:
+        policy_changed()
+
+    for user_id in pending.session_user_ids:
+        invalidate_session(user_id)
+
+
+def _as_permissions(perms):
+    """
+    Normalize a permission or an iterable of permissions to a list of permissions.
+
+    Args:
+        perms (Union[Permission, List[Permission]]): The permission(s) to normalize.
+
+    Returns:
+        List[Permission]: The permissions.
+
+    Raises:
+        ValueError: If permissions are a string.
+    """
+    if isinstance(perms, str):
+        raise ValueError("perms must be instance of Permission")
+
+    if not is_iterable(perms):
+        perms = [perms]
+
+    return list(perms)
@@ -0,0 +1,287 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from rbaca.cache import (
+    get_pending_invalidations,
+    get_policy_generation,
+    is_shared_cache,
+)
+from rbaca.models import Role
+
+_engine = None
+
+
+class ConstraintEngine:
+    """
+    Separation of duty constraint engine.
+
+    The incompatibility relation of all roles is loaded once and encoded as one integer bitset
+    per role, in which each bit stands for an incompatible role. Checking a set of roles or
+    computing the assignable roles of a user then only needs bitwise operations.
+
+    Attributes:
+        generation (str): The policy generation the engine was loaded for.
+    """
+
+    def __init__(self, incompatible_pairs, role_ids=None, generation=None):
+        """
+        Build the bitsets from the incompatible role pairs.
+
+        Args:
+            incompatible_pairs (Iterable[Tuple[int, int]]): Pairs of incompatible role ids.
+                The relation is treated as symmetric.
+            role_ids (Iterable[int], optional): The ids of all roles. Loaded lazily if omitted.
+            generation (str, optional): The policy generation the pairs were loaded for.
+        """
+        self.generation = generation
+        self._bits = {}
+        self._role_ids = []
+        self._masks = {}
+        self._all_mask = None
+
+        neighbours = {}
+
+        for role_id, other_id in incompatible_pairs:
+            neighbours.setdefault(role_id, set()).add(self._bit(other_id))
+            neighbours.setdefault(other_id, set()).add(self._bit(role_id))
+
+        size = (len(self._role_ids) + 7) // 8
+
+        for role_id, bits in neighbours.items():
+            bitmap = bytearray(size)
+            for bit in bits:
+                bitmap[bit >> 3] |= 1 << (bit & 7)
+            self._masks[role_id] = int.from_bytes(bitmap, "little")
+
+        if role_ids is not None:
+            self._set_all_roles(role_ids)
+
+    @classmethod
+    def load(cls, generation=None, role_ids=None):
+        """
+        Load the incompatibility relation from the database with a single query.
+
+        Args:
+            generation (str, optional): The policy generation the engine is loaded for.
+            role_ids (Iterable[int], optional): Only load the incompatibilities of these roles.
+                An engine loaded this way only answers checks in which every conflict
+                involves one of these roles.
+
+        Returns:
+            ConstraintEngine: The loaded engine.
+        """
+        pairs = Role.incompatible_roles.through.objects.all()
+
+        if role_ids is not None:
+            role_ids = list(role_ids)
+            pairs = pairs.filter(
+                Q(from_role_id__in=role_ids) | Q(to_role_id__in=role_ids)
+            )
+        return cls(
+            pairs.values_list("from_role_id", "to_role_id"), generation=generation
+        )
+
+    def _bit(self, role_id):
+        """
+        Get the bit index of a role, assigning the next free index to unknown roles.
+
+        Args:
+            role_id (int): The id of the role.
+
+        Returns:
+            int: The bit index of the role.
+        """
+        if role_id not in self._bits:
+            self._bits[role_id] = len(self._role_ids)
+            self._role_ids.append(role_id)
+        return self._bits[role_id]
+
+    def _set_all_roles(self, role_ids):
+        """
+        Assign a bit to every role, so the assignable roles can be computed.
+
+        Args:
+            role_ids (Iterable[int]): The ids of all roles.
+        """
+        for role_id in role_ids:
+            self._bit(role_id)
+        self._all_mask = (1 << len(self._role_ids)) - 1
+
+    def _decode(self, mask):
+        """
+        Get the role ids of all bits set in a bitset.
+
+        Args:
+            mask (int): The bitset to decode.
+
+        Returns:
+            Set[int]: The ids of the roles in the bitset.
+        """
+        role_ids = set()
+
+        while mask:
+            lowest = mask & -mask
+            role_ids.add(self._role_ids[lowest.bit_length() - 1])
+            mask ^= lowest
+        return role_ids
+
+    def mask(self, role_ids):
+        """
+        Encode a set of roles as a bitset. Roles without any constraint are ignored.
+
+        Args:
+            role_ids (Iterable[int]): The ids of the roles.
+
+        Returns:
+            int: The bitset of the roles.
+        """
+        mask = 0
+
+        for role_id in role_ids:
+            if role_id in self._bits:
+                mask |= 1 << self._bits[role_id]
+        return mask
+
+    def incompatible_mask(self, role_ids):
+        """
+        Get the bitset of all roles that are incompatible with at least one of the given roles.
+
+        Args:
+            role_ids (Iterable[int]): The ids of the roles.
+
+        Returns:
+            int: The bitset of the incompatible roles.
+        """
+        mask = 0
+
+        for role_id in role_ids:
+            mask |= self._masks.get(role_id, 0)
+        return mask
+
+    def is_conflict_free(self, role_ids, other_role_ids=None):
+        """
+        Check if a set of roles contains no incompatible roles.
+
+        Args:
+            role_ids (Iterable[int]): The ids of the roles to check.
+            other_role_ids (Iterable[int], optional): If given, only conflicts between the roles
+                and these roles are considered.
+
+        Returns:
+            bool: True if no roles are incompatible, otherwise False.
+        """
+        role_ids = set(role_ids)
+        other_role_ids = role_ids if other_role_ids is None else set(other_role_ids)
+        return not self.incompatible_mask(role_ids) & self.mask(other_role_ids)
+
+    def get_conflicts(self, role_ids, other_role_ids=None):
+        """
+        Get the incompatible pairs within a set of roles.
+
+        Args:
+            role_ids (Iterable[int]): The ids of the roles to check.
+            other_role_ids (Iterable[int], optional): If given, only conflicts between the roles
+                and these roles are returned.
+
+        Returns:
+            List[Tuple[int, int]]: The sorted pairs of incompatible role ids.
+        """
+        role_ids = set(role_ids)
+        other_role_ids = role_ids if other_role_ids is None else set(other_role_ids)
+        other_mask = self.mask(other_role_ids)
+        conflicts = set()
+
+        for role_id in role_ids:
+            for other_id in self._decode(self._masks.get(role_id, 0) & other_mask):
+                conflicts.add((min(role_id, other_id), max(role_id, other_id)))
+        return sorted(conflicts)
+
+    def get_excluded_roles(self, role_ids):
+        """
+        Get the given roles together with all roles incompatible with them.
+
+        Args:
+            role_ids (Iterable[int]): The ids of the roles held by a user.
+
+        Returns:
+            Set[int]: The ids of the roles that can not be assigned additionally.
+        """
+        role_ids = set(role_ids)
+        return role_ids | self._decode(self.incompatible_mask(role_ids))
+
+    def get_assignable_roles(self, role_ids):
+        """
+        Get all roles that can be assigned to a user holding the given roles.
+        Loads the ids of all roles on first use.
+
+        Args:
+            role_ids (Iterable[int]): The ids of the roles held by a user.
+
+        Returns:
+            Set[int]: The ids of the roles that are neither held nor incompatible.
+        """
+        if self._all_mask is None:
+            self._set_all_roles(Role.objects.values_list("id", flat=True))
+
+        role_ids = set(role_ids)
+        return (
+            self._decode(
+                self._all_mask
+                & ~(self.mask(role_ids) | self.incompatible_mask(role_ids))
+            )
+            - role_ids
+        )
+
+
+def _use_shared_engine():
+    """
+    Check if the constraint engine of all roles is kept between checks.
+
+    The engine is only kept if `USE_CONSTRAINT_ENGINE_CACHE` is enabled and the cache
+    holding the policy generation is shared between processes. A per-process cache would
+    never see the changes made by other processes, so their engine would go stale.
+
+    Returns:
+        bool: True if the engine can be kept, otherwise False.
+    """
+    if not getattr(settings, "USE_CONSTRAINT_ENGINE_CACHE", False):
+        return False
+    return is_shared_cache()
+
+
+def get_constraint_engine(role_ids=None):
+    """
+    Get a constraint engine able to check the given roles.
+
+    By default, only the incompatibilities of the given roles are loaded, with one query per
+    check. If `USE_CONSTRAINT_ENGINE_CACHE` is enabled and the cache is shared between
+    processes, the engine of all roles is loaded once and kept until the roles or their
+    incompatibilities change. Engines loaded inside a transaction are not kept, since they
+    may contain uncommitted changes, and the kept engine is not used within a change set,
+    whose changes only replace the policy generation once it completes.
+
+    Args:
+        role_ids (Iterable[int], optional): The roles every checked conflict involves.
+            The incompatibilities of all roles are loaded if omitted.
+
+    Returns:
+        ConstraintEngine: The constraint engine.
+    """
+    global _engine
+
+    # Within a change set, the policy generation is only replaced once it completes.
+    if not _use_shared_engine() or get_pending_invalidations() is not None:
+        return ConstraintEngine.load(role_ids=role_ids)
+
+    generation = get_policy_generation()
+
+    if generation is not None and _engine is not None:
+        if _engine.generation == generation:
+            return _engine
+
+    engine = ConstraintEngine.load(generation=generation)
+
+    if generation is not None and not transaction.get_connection().in_atomic_block:
+        _engine = engine
+    return engine
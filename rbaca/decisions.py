@@ -0,0 +1,170 @@
+import atexit
+import random
+from threading import Lock
+
+from django.conf import settings
+from django.core.signals import request_finished, setting_changed
+from django.utils.timezone import now
+
+from rbaca.buffers import WriteBehindBuffer
+
+_log = None
+_log_lock = Lock()
+
+
+class DecisionLog(WriteBehindBuffer):
+    """
+    An in-process ring buffer of authorization decisions that is written to the database
+    in batches with `bulk_create`.
+
+    Recording a decision never touches the database and never waits for a flush. If the
+    database is slow, the buffer fills up: above its high-water mark only denied decisions
+    are kept, and once it is full the oldest decisions are dropped. Both are counted, so
+    shedding is visible instead of blocking request threads.
+
+    The buffer is flushed by a background thread every `flush_interval` seconds, or at the
+    end of each request if `flush_interval` is 0.
+
+    Attributes:
+        sample_rate (float): The share of granted decisions that is logged.
+        deny_only (bool): Decides if only denied decisions are logged.
+    """
+
+    def __init__(
+        self,
+        sample_rate=1.0,
+        deny_only=False,
+        buffer_size=10000,
+        batch_size=500,
+        flush_interval=5.0,
+    ):
+        super().__init__(
+            "rbaca.AccessDecision",
+            buffer_size=buffer_size,
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+            name="rbaca.decisions",
+        )
+        self.sample_rate = sample_rate
+        self.deny_only = deny_only
+
+    def record(self, kind, user_id, target, granted):
+        """
+        Buffer a decision, subject to the sampling rate, the deny-only mode and back-pressure.
+
+        Args:
+            kind (str): The kind of check, see `AccessDecision.KIND_CHOICES`.
+            user_id (Union[int, None]): The id of the user the decision was made for.
+            target (str): The checked permission, role or node.
+            granted (bool): Whether access was granted.
+        """
+        if granted and (
+            self.deny_only
+            or self.sample_rate < 1
+            and random.random() >= self.sample_rate
+        ):
+            return
+
+        self.append(
+            {
+                "kind": kind,
+                "user_id": user_id,
+                "target": str(target)[:255],
+                "granted": granted,
+                "date": now(),
+            },
+            sheddable=granted,
+        )
+
+
+def _use_decision_log():
+    """
+    Check if authorization decisions are logged.
+
+    Returns:
+        bool: True if `USE_DECISION_LOG` is enabled, otherwise False.
+    """
+    return getattr(settings, "USE_DECISION_LOG", False)
+
+
+def get_decision_log():
+    """
+    Get the decision log of this process, created from the `DECISION_LOG_*` settings on first use.
+
+    Returns:
+        Union[DecisionLog, None]: The decision log, or None if `USE_DECISION_LOG` is disabled.
+    """
+    global _log
+
+    if not _use_decision_log():
+        return None
+
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = DecisionLog(
+                    sample_rate=getattr(settings, "DECISION_LOG_SAMPLE_RATE", 1.0),
+                    deny_only=getattr(settings, "DECISION_LOG_DENY_ONLY", False),
+                    buffer_size=getattr(settings, "DECISION_LOG_BUFFER_SIZE", 10000),
+                    batch_size=getattr(settings, "DECISION_LOG_BATCH_SIZE", 500),
+                    flush_interval=getattr(
+                        settings, "DECISION_LOG_FLUSH_INTERVAL", 5.0
+                    ),
+                )
+    return _log
+
+
+def log_decision(kind, user_id, target, granted):
+    """
+    Log an authorization decision, if `USE_DECISION_LOG` is enabled.
+
+    Args:
+        kind (str): The kind of check, see `AccessDecision.KIND_CHOICES`.
+        user_id (Union[int, None]): The id of the user the decision was made for.
+        target (str): The checked permission, role or node.
+        granted (bool): Whether access was granted.
+    """
+    decision_log = get_decision_log()
+
+    if decision_log is not None:
+        decision_log.record(kind, user_id, target, granted)
+
+
+def flush_decisions(**kwargs):
+    """
+    Write the buffered decisions at the end of a request if no background thread flushes them.
+    """
+    decision_log = _log
+
+    if decision_log is not None and not decision_log.flush_interval:
+        decision_log.flush()
+
+
+def close_decision_log():
+    """
+    Write the buffered decisions and stop the background thread.
+    """
+    decision_log = _log
+
+    if decision_log is not None:
+        decision_log.close()
+
+
+def reset_decision_log(**kwargs):
+    """
+    Stop and drop the decision log, so it is created from the settings again.
+    """
+    global _log
+
+    if kwargs.get("setting", "DECISION_LOG").startswith(
+        ("USE_DECISION_LOG", "DECISION_LOG")
+    ):
+        with _log_lock:
+            if _log is not None:
+                _log.stop()
+            _log = None
+
+
+request_finished.connect(flush_decisions, dispatch_uid="rbaca_flush_decisions")
+setting_changed.connect(reset_decision_log, dispatch_uid="rbaca_reset_decision_log")
+atexit.register(close_decision_log)
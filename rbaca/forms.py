@@ -3,7 +3,9 @@ from django.core.exceptions import ValidationError
 from django.forms import DateInput, ModelForm
 from django.utils.translation import gettext_lazy as _
 
-from rbaca.models import Role, RoleExpiration
+from rbaca.audit import _use_audit_trail, record_change
+from rbaca.constraints import get_constraint_engine
+from rbaca.models import AuditEntry, Role, RoleExpiration, _use_role_inheritance
 
 UserModel = get_user_model()
 
@@ -60,13 +62,14 @@ class UserRoleForm(ModelForm):
         """
 
         roles = self.cleaned_data["roles"]
-        if Role.manage.check_role_compatibility(roles):
+        compatibility = Role.manage.check_role_compatibility(roles)
+        if compatibility:
             return self.cleaned_data["roles"]
         else:
             raise ValidationError(
                 "Invalid role selection."
                 + " Make sure that the user has all junior roles and that the selected"
-                + " role is compatible with the users roles"
+                + " role is compatible with the users roles (%s)." % compatibility
             )
 
 
@@ -103,10 +106,12 @@ class RoleExpirationForm(ModelForm):
         """
         super().__init__(*args, **kwargs)
         self.user = user
-        user_role_ids = user.roles.values_list("id", flat=True)
-        incompatible_role_ids = user.roles.values_list(
-            "incompatible_roles__id", flat=True
-        )
+        user_role_ids = set(user.roles.values_list("id", flat=True))
+
+        if _use_role_inheritance():
+            user_role_ids = set().union(
+                *Role.manage.get_junior_closure(user_role_ids).values()
+            )
         if allow_superroles:
             assignable_roles_ids = Role.objects.none().values_list("id", flat=True)
         else:
@@ -119,9 +124,8 @@ class RoleExpirationForm(ModelForm):
         ).values_list("id", flat=True)
 
         all_ids_to_exclude = (
-            set(incompatible_role_ids)
+            get_constraint_engine(user_role_ids).get_excluded_roles(user_role_ids)
             | set(assignable_roles_ids)
-            | set(user_role_ids)
             | set(role_ids_to_exclude)
         )
 
@@ -140,17 +144,18 @@ class RoleExpirationForm(ModelForm):
         Raises:
             ValidationError if the selected role is incompatible or if the user does not have all junior roles.
         """
-        selected_role = Role.objects.filter(id=self.cleaned_data["role"].id)
-        roles = (
-            self.user.roles.all()
-            | selected_role
-            | Role.objects.filter(
-                id__in=[role.id for role in selected_role[0].get_all_junior_roles()]
-            )
-        )
-        if Role.manage.check_role_compatibility(
-            roles, False, True
-        ) and not self.user.has_role(selected_role[0]):
+        selected_role = self.cleaned_data["role"]
+        user_role_ids = set(self.user.roles.values_list("id", flat=True))
+        closure = Role.manage.get_junior_closure(user_role_ids | {selected_role.id})
+
+        if _use_role_inheritance():
+            user_role_ids = set().union(*(closure[i] for i in user_role_ids))
+
+        role_ids = user_role_ids | closure[selected_role.id]
+
+        if get_constraint_engine(role_ids).is_conflict_free(
+            role_ids
+        ) and not self.user.has_role(selected_role):
             return self.cleaned_data["role"]
         else:
             if self.user.is_active and self.user.is_superuser:
@@ -166,22 +171,45 @@ class RoleExpirationForm(ModelForm):
     def save(self, commit=True):
         """
         Overrides the save method to ensure the selected role is added to the user's roles.
+        If `USE_ROLE_INHERITANCE` is enabled, the junior roles are conferred by the selected
+        role and are not assigned separately.
         """
         instance = super().save(commit=False)
         instance.user = self.user
         if commit:
+            audited = _use_audit_trail()
+
+            if audited:
+                user_role_ids = set(self.user.roles.values_list("id", flat=True))
+
             senior_role = self.cleaned_data["role"]
-            junior_roles = self.cleaned_data["role"].get_all_junior_roles()
+            if _use_role_inheritance():
+                junior_roles = set()
+            else:
+                junior_roles = self.cleaned_data["role"].get_all_junior_roles()
 
             for role in junior_roles:
                 if role not in self.user.roles.all():
                     self.user.roles.add(role)
-                    RoleExpiration.objects.create(
-                        expiration_date=instance.expiration_date,
+                    RoleExpiration.objects.update_or_create(
                         user=instance.user,
                         role=role,
+                        defaults={"expiration_date": instance.expiration_date},
                     )
             if senior_role not in self.user.roles.all():
                 self.user.roles.add(senior_role)
+            RoleExpiration.objects.filter(user=instance.user, role=senior_role).exclude(
+                pk=instance.pk
+            ).delete()
             instance.save()
+
+            if audited:
+                record_change(
+                    AuditEntry.ASSIGN_ROLES,
+                    self.user,
+                    roles_before=user_role_ids,
+                    roles_after=user_role_ids
+                    | {role.id for role in junior_roles}
+                    | {senior_role.id},
+                )
         return instance
@@ -0,0 +1,532 @@
+import sys
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection
+from django.utils.module_loading import import_string
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+_UNSET = object()
+_tracer = _UNSET
+
+
+class Tracer:
+    """
+    Interface for receiving authorization measurements. Subclass it and set `RBACA_TRACER`
+    to the dotted path of the subclass to forward measurements to any monitoring system.
+    """
+
+    def record(self, operation, duration, queries, error=False):
+        """
+        Record a call of an instrumented operation.
+
+        Args:
+            operation (str): The name of the operation, e.g. "backend.has_perm".
+            duration (float): The wall time of the call in seconds.
+            queries (int): The number of queries issued on the default database.
+            error (bool): Whether the call raised an exception.
+        """
+
+    def cache(self, name, hit):
+        """
+        Record a cache lookup.
+
+        Args:
+            name (str): The name of the cache, e.g. "permissions".
+            hit (bool): Whether the value was found in the cache.
+        """
+
+
+class Histogram:
+    """
+    A histogram with fixed bucket bounds, so its memory usage does not grow with the
+    number of observations.
+
+    Attributes:
+        bounds (Tuple[float]): The upper bounds of the buckets.
+        counts (List[int]): The number of observations per bucket, the last bucket counts
+            the observations above all bounds.
+        sum (float): The sum of all observations.
+    """
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+        Add an observation.
+
+        Args:
+            value (float): The observed value.
+        """
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+
+class MetricsCollector(Tracer):
+    """
+    The default tracer. Aggregates call counts, errors, queries, wall time histograms and
+    cache hits and misses in memory, per process, and renders them in the Prometheus text format.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.lock = Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Drop all collected measurements.
+        """
+        with self.lock:
+            self.operations = {}
+            self.caches = {}
+
+    def record(self, operation, duration, queries, error=False):
+        with self.lock:
+            metrics = self.operations.get(operation)
+
+            if metrics is None:
+                metrics = self.operations[operation] = {
+                    "calls": 0,
+                    "errors": 0,
+                    "queries": 0,
+                    "duration": Histogram(self.buckets),
+                }
+            metrics["calls"] += 1
+            metrics["errors"] += error
+            metrics["queries"] += queries
+            metrics["duration"].observe(duration)
+
+    def cache(self, name, hit):
+        with self.lock:
+            counts = self.caches.setdefault(name, [0, 0])
+            counts[0 if hit else 1] += 1
+
+    def snapshot(self):
+        """
+        Get a copy of the collected measurements.
+
+        Returns:
+            dict: The `operations`, with their calls, errors, queries, total duration and
+            duration bucket counts, and the `caches`, with their hits and misses.
+        """
+        with self.lock:
+            return {
+                "operations": {
+                    operation: {
+                        "calls": metrics["calls"],
+                        "errors": metrics["errors"],
+                        "queries": metrics["queries"],
+                        "duration": metrics["duration"].sum,
+                        "buckets": list(metrics["duration"].counts),
+                    }
+                    for operation, metrics in self.operations.items()
+                },
+                "caches": {
+                    name: {"hits": hits, "misses": misses}
+                    for name, (hits, misses) in self.caches.items()
+                },
+            }
+
+    def render_prometheus(self):
+        """
+        Render the collected measurements in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics.
+        """
+        snapshot = self.snapshot()
+        operations = sorted(snapshot["operations"].items())
+        caches = sorted(snapshot["caches"].items())
+        lines = []
+
+        for name, key, help_text in (
+            ("rbaca_operation_calls_total", "calls", "Calls of the operation."),
+            ("rbaca_operation_errors_total", "errors", "Calls that raised."),
+            ("rbaca_operation_queries_total", "queries", "Queries issued."),
+        ):
+            lines += ["# HELP %s %s" % (name, help_text), "# TYPE %s counter" % name]
+            lines += [
+                '%s{operation="%s"} %d' % (name, operation, metrics[key])
+                for operation, metrics in operations
+            ]
+
+        name = "rbaca_operation_duration_seconds"
+        lines += ["# HELP %s Wall time of the operation." % name]
+        lines += ["# TYPE %s histogram" % name]
+
+        for operation, metrics in operations:
+            cumulative = 0
+
+            for bound, count in zip(
+                [repr(bound) for bound in self.buckets] + ["+Inf"], metrics["buckets"]
+            ):
+                cumulative += count
+                lines.append(
+                    '%s_bucket{operation="%s",le="%s"} %d'
+                    % (name, operation, bound, cumulative)
+                )
+            lines.append(
+                '%s_sum{operation="%s"} %r' % (name, operation, metrics["duration"])
+            )
+            lines.append('%s_count{operation="%s"} %d' % (name, operation, cumulative))
+
+        for name, key, help_text in (
+            ("rbaca_cache_hits_total", "hits", "Cache lookups that found a value."),
+            ("rbaca_cache_misses_total", "misses", "Cache lookups that missed."),
+        ):
+            lines += ["# HELP %s %s" % (name, help_text), "# TYPE %s counter" % name]
+            lines += [
+                '%s{cache="%s"} %d' % (name, cache, counts[key])
+                for cache, counts in caches
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def get_tracer():
+    """
+    Get the tracer receiving the measurements. The tracer is created once from
+    `RBACA_TRACER`, which defaults to the `MetricsCollector`, and dropped when the settings change.
+
+    Returns:
+        Union[Tracer, None]: The tracer, or None if `USE_INSTRUMENTATION` is disabled.
+    """
+    global _tracer
+
+    if _tracer is _UNSET:
+        if getattr(settings, "USE_INSTRUMENTATION", False):
+            tracer = getattr(
+                settings, "RBACA_TRACER", "rbaca.instrumentation.MetricsCollector"
+            )
+            if isinstance(tracer, str):
+                tracer = import_string(tracer)
+            _tracer = tracer() if isinstance(tracer, type) else tracer
+        else:
+            _tracer = None
+    return _tracer
+
+
+def reset_tracer(**kwargs):
+    """
+    Drop the current tracer, so the next measurement creates it from the settings again.
+    """
+    global _tracer
+
+    if kwargs.get("setting") in (None, "USE_INSTRUMENTATION", "RBACA_TRACER"):
+        _tracer = _UNSET
+
+
+setting_changed.connect(reset_tracer, dispatch_uid="rbaca_reset_tracer")
+
+
+class ProfiledCall:
+    """
+    An authorization check made while a request was profiled.
+
+    Attributes:
+        operation (str): The name of the operation, e.g. "user.has_perm".
+        user_id (int): The id of the checked user.
+        arguments (str): The arguments of the check.
+        caller (str): The function that made the check, as module.function:line.
+        caches (List[Tuple[str, bool]]): The cache lookups made by the check and their results.
+        queries (List[str]): The SQL issued by the check.
+        duration (float): The wall time of the check in seconds.
+        result (object): The result of the check.
+    """
+
+    def __init__(self, operation, user_id, arguments, caller):
+        self.operation = operation
+        self.user_id = user_id
+        self.arguments = arguments
+        self.caller = caller
+        self.caches = []
+        self.queries = []
+        self.duration = 0.0
+        self.result = None
+
+    @property
+    def key(self):
+        return self.operation, self.user_id, self.arguments
+
+    @property
+    def cache_status(self):
+        """
+        Summarize the cache lookups of the check.
+
+        Returns:
+            str: "miss" if a lookup missed, "hit" if all lookups hit, otherwise "none".
+        """
+        if not self.caches:
+            return "none"
+        return "hit" if all(hit for _, hit in self.caches) else "miss"
+
+    def __str__(self):
+        return "%s(%s) for user %s by %s: %s, cache %s, %d queries, %.2fms" % (
+            self.operation,
+            self.arguments,
+            self.user_id,
+            self.caller,
+            self.result,
+            self.cache_status,
+            len(self.queries),
+            self.duration * 1000,
+        )
+
+
+class RequestProfile:
+    """
+    The authorization checks made during a single request, collected by
+    `rbaca.middleware.AuthorizationProfilerMiddleware`.
+
+    Attributes:
+        calls (List[ProfiledCall]): The checks in the order they were made. Checks made while
+            another check runs are part of the outer check.
+    """
+
+    def __init__(self):
+        self.calls = []
+        self.current = None
+
+    def get_repeated_calls(self):
+        """
+        Get the checks that were made more than once with the same user and arguments.
+
+        Returns:
+            List[Tuple[ProfiledCall, int, int]]: The first call of each repeated check, the
+            number of calls and the number of queries issued by the repetitions.
+        """
+        repeated = {}
+
+        for call in self.calls:
+            if call.key in repeated:
+                repeated[call.key][1] += 1
+                repeated[call.key][2] += len(call.queries)
+            else:
+                repeated[call.key] = [call, 1, 0]
+        return [tuple(entry) for entry in repeated.values() if entry[1] > 1]
+
+    def summary(self):
+        """
+        Summarize the checks in one line.
+
+        Returns:
+            str: The number of checks, their queries and wall time and the repeated checks.
+        """
+        repeated = self.get_repeated_calls()
+        return (
+            "%d checks, %d queries, %.2fms, %d repeated checks with %d avoidable queries"
+            % (
+                len(self.calls),
+                sum(len(call.queries) for call in self.calls),
+                sum(call.duration for call in self.calls) * 1000,
+                len(repeated),
+                sum(queries for _, _, queries in repeated),
+            )
+        )
+
+    def report(self):
+        """
+        Describe every check with its SQL, followed by the repeated checks.
+
+        Returns:
+            List[str]: The lines of the report.
+        """
+        lines = [self.summary()]
+
+        for call in self.calls:
+            lines.append(str(call))
+            lines += ["    %s" % sql for sql in call.queries]
+
+        for call, count, queries in self.get_repeated_calls():
+            lines.append(
+                "repeated %dx: %s(%s) for user %s, %d queries after the first call"
+                % (count, call.operation, call.arguments, call.user_id, queries)
+            )
+        return lines
+
+
+_profile = ContextVar("rbaca_profile", default=None)
+
+
+def activate_profile(profile):
+    """
+    Collect the authorization checks of the current context into a profile.
+
+    Args:
+        profile (RequestProfile): The profile to collect into.
+
+    Returns:
+        Token: The token to pass to `deactivate_profile`.
+    """
+    return _profile.set(profile)
+
+
+def deactivate_profile(token):
+    """
+    Stop collecting into the profile activated with the given token.
+
+    Args:
+        token (Token): The token returned by `activate_profile`.
+    """
+    _profile.reset(token)
+
+
+def instrumented(operation, profiled=False):
+    """
+    Decorate a function to record its calls, queries and wall time as the given operation.
+    If `USE_INSTRUMENTATION` is disabled and no request is profiled, the function is called
+    directly.
+
+    Args:
+        operation (str): The name of the operation.
+        profiled (bool): Decides if the calls are listed in an active `RequestProfile`. The
+            first argument of a profiled function must be the checked user.
+
+    Returns:
+        Callable: The decorator.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            tracer = get_tracer()
+            profile = _profile.get() if profiled else None
+
+            if tracer is None and profile is None:
+                return func(*args, **kwargs)
+            return _call(func, operation, tracer, profile, args, kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _call(func, operation, tracer, profile, args, kwargs):
+    """
+    Call an instrumented function and record the call.
+
+    Args:
+        func (Callable): The function.
+        operation (str): The name of the operation.
+        tracer (Union[Tracer, None]): The tracer to record to.
+        profile (Union[RequestProfile, None]): The request profile to list the call in.
+        args (tuple): The positional arguments of the call.
+        kwargs (dict): The keyword arguments of the call.
+
+    Returns:
+        object: The result of the function.
+    """
+    queries = []
+
+    def capture_queries(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    call = None
+
+    if profile is not None and profile.current is None:
+        call = profile.current = ProfiledCall(
+            operation,
+            getattr(args[0], "pk", None),
+            ", ".join(
+                [repr(arg) for arg in args[1:]]
+                + ["%s=%r" % item for item in kwargs.items()]
+            ),
+            _get_caller(),
+        )
+
+    error = False
+    start = perf_counter()
+
+    try:
+        with connection.execute_wrapper(capture_queries):
+            result = func(*args, **kwargs)
+    except BaseException:
+        error = True
+        raise
+    finally:
+        duration = perf_counter() - start
+
+        if tracer is not None:
+            tracer.record(operation, duration, len(queries), error)
+
+        if call is not None:
+            call.queries = queries
+            call.duration = duration
+            profile.current = None
+            profile.calls.append(call)
+
+    if call is not None:
+        call.result = result
+    return result
+
+
+def _get_caller():
+    """
+    Get the function that called into `django-rbaca`, skipping the models and this module.
+
+    Returns:
+        str: The caller as module.function:line.
+    """
+    frame = sys._getframe(2)
+
+    while frame is not None and frame.f_globals.get("__name__") in (
+        __name__,
+        "rbaca.models",
+    ):
+        frame = frame.f_back
+
+    if frame is None:
+        return "unknown"
+
+    code = frame.f_code
+    return "%s.%s:%d" % (
+        frame.f_globals.get("__name__"),
+        getattr(code, "co_qualname", code.co_name),
+        frame.f_lineno,
+    )
+
+
+def record_cache(name, hit):
+    """
+    Record a cache lookup, if `USE_INSTRUMENTATION` is enabled or a request is profiled.
+
+    Args:
+        name (str): The name of the cache.
+        hit (bool): Whether the value was found in the cache.
+    """
+    tracer = get_tracer()
+
+    if tracer is not None:
+        tracer.cache(name, hit)
+
+    profile = _profile.get()
+
+    if profile is not None and profile.current is not None:
+        profile.current.caches.append((name, hit))
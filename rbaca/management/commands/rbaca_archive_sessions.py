@@ -0,0 +1,89 @@
+from datetime import timedelta
+from time import monotonic
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from rbaca.models import SessionArchive
+
+
+class Command(BaseCommand):
+    """
+    Management command to move closed sessions out of the Session table.
+
+    Sessions closed more than `--days` days ago are moved, together with their role links,
+    into the SessionArchive table in batches, each within its own transaction.
+    With `--delete`, they are deleted without archiving.
+
+    Example:
+        python manage.py rbaca_archive_sessions --days 90 --batch-size 1000
+    """
+
+    help = "Archive or delete closed sessions in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=getattr(settings, "SESSION_RETENTION_DAYS", 90),
+            help="Archive sessions closed more than this many days ago.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of sessions to archive per batch.",
+        )
+        parser.add_argument(
+            "--max-seconds",
+            type=float,
+            default=None,
+            help="Stop after the batch during which this many seconds have elapsed.",
+        )
+        parser.add_argument(
+            "--delete",
+            action="store_true",
+            help="Delete the sessions instead of archiving them.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        max_seconds = options["max_seconds"]
+
+        if batch_size < 1:
+            raise CommandError("--batch-size must be a positive integer.")
+        if options["days"] < 0:
+            raise CommandError("--days must not be negative.")
+
+        before = now() - timedelta(days=options["days"])
+        batches = total = 0
+        start = monotonic()
+
+        while max_seconds is None or monotonic() - start < max_seconds:
+            batch_start = monotonic()
+            archived = SessionArchive.manage.archive_sessions(
+                before, chunk_size=batch_size, delete_only=options["delete"]
+            )
+
+            if not archived:
+                break
+
+            batches += 1
+            total += archived
+            self.stdout.write(
+                "batch %d: %d sessions in %.2fs"
+                % (batches, archived, monotonic() - batch_start)
+            )
+
+        elapsed = monotonic() - start
+        self.stdout.write(
+            "%s %d sessions in %d batches in %.2fs (%.0f sessions/s)"
+            % (
+                "deleted" if options["delete"] else "archived",
+                total,
+                batches,
+                elapsed,
+                total / elapsed if elapsed else 0,
+            )
+        )
@@ -0,0 +1,38 @@
+from time import monotonic
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rbaca.models import Session
+
+
+class Command(BaseCommand):
+    """
+    Management command to close the sessions that exceeded `SESSION_TIMEOUT_ABSOLUTE`.
+
+    Timed out sessions are already ignored when permissions are checked. This command only
+    records their end, with one bulk update per chunk, and is meant to run periodically.
+
+    Example:
+        python manage.py rbaca_close_sessions --chunk-size 1000
+    """
+
+    help = "Close timed out sessions in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of sessions to close per update.",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be a positive integer.")
+
+        start = monotonic()
+        closed = Session.manage.close_timed_out_sessions(chunk_size=chunk_size)
+
+        self.stdout.write("closed %d sessions in %.2fs" % (closed, monotonic() - start))
@@ -0,0 +1,73 @@
+from time import monotonic
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from rbaca.management.utils import chunked
+from rbaca.models import EffectivePermission
+
+
+class Command(BaseCommand):
+    """
+    Management command to verify and repair the materialized effective permissions.
+
+    The users are streamed in chunks, so the memory usage does not depend on the number of users.
+
+    Example:
+        python manage.py rbaca_effective_permissions --repair --chunk-size 1000
+    """
+
+    help = "Verify and optionally repair the materialized effective permissions."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repair",
+            action="store_true",
+            help="Write the missing rows and delete the stale rows.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of users to process per chunk.",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        repair = options["repair"]
+
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be a positive integer.")
+
+        user_ids = (
+            get_user_model()
+            ._default_manager.order_by("pk")
+            .values_list("pk", flat=True)
+            .iterator(chunk_size=chunk_size)
+        )
+        users = added = removed = 0
+        start = monotonic()
+
+        for chunk in chunked(user_ids, chunk_size):
+            chunk_added, chunk_removed = EffectivePermission.manage.refresh_users(
+                chunk, dry_run=not repair
+            )
+            users += len(chunk)
+            added += chunk_added
+            removed += chunk_removed
+
+        self.stdout.write(
+            "checked %d users in %.2fs: %d missing, %d stale rows%s"
+            % (
+                users,
+                monotonic() - start,
+                added,
+                removed,
+                " (repaired)" if repair and (added or removed) else "",
+            )
+        )
+
+        if not repair and (added or removed):
+            raise CommandError(
+                "effective permissions are out of sync, run with --repair to fix them."
+            )
@@ -0,0 +1,143 @@
+import os
+import socket
+from time import monotonic
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from rbaca.models import CommandLock, RoleExpiration
+
+LOCK_NAME = "rbaca_expire_roles"
+
+
+class Command(BaseCommand):
+    """
+    Management command to remove expired roles from users.
+
+    The expirations are processed in batches ordered by expiration date using keyset pagination.
+    Every batch is removed in its own short transaction, so a long backlog never blocks writes
+    to the role assignments. A lock row prevents concurrent runs from several schedulers.
+
+    Example:
+        python manage.py rbaca_expire_roles --batch-size 1000 --max-seconds 300
+    """
+
+    help = "Remove expired roles from users in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of expirations to process per batch.",
+        )
+        parser.add_argument(
+            "--max-seconds",
+            type=float,
+            default=None,
+            help="Stop after the batch during which this many seconds have elapsed.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the expirations that would be processed without removing them.",
+        )
+        parser.add_argument(
+            "--lock-timeout",
+            type=int,
+            default=600,
+            help="Seconds after which the lock of a crashed run is taken over.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        max_seconds = options["max_seconds"]
+        dry_run = options["dry_run"]
+        lock_timeout = options["lock_timeout"]
+
+        if batch_size < 1:
+            raise CommandError("--batch-size must be a positive integer.")
+
+        lock = None
+
+        if not dry_run:
+            lock = CommandLock.manage.acquire(
+                LOCK_NAME,
+                lock_timeout,
+                owner="%s:%d" % (socket.gethostname(), os.getpid()),
+            )
+
+            if lock is None:
+                raise CommandError("another rbaca_expire_roles run holds the lock.")
+
+        try:
+            self.expire(batch_size, max_seconds, dry_run, lock, lock_timeout)
+        finally:
+            if lock is not None:
+                CommandLock.manage.release(lock)
+
+    def expire(self, batch_size, max_seconds, dry_run, lock, lock_timeout):
+        """
+        Process the expired roles batch by batch.
+
+        Args:
+            batch_size (int): The number of expirations per batch.
+            max_seconds (Union[float, None]): The time budget of the run.
+            dry_run (bool): Only report the expirations if True.
+            lock (Union[CommandLock, None]): The held lock, refreshed after every batch.
+            lock_timeout (int): The number of seconds the lock is extended by.
+        """
+        senior_roles = RoleExpiration.manage.get_senior_role_map()
+        expired = RoleExpiration.manage.get_expired_roles().order_by(
+            "expiration_date", "id"
+        )
+        cursor = None
+        batches = total = 0
+        start = monotonic()
+
+        while max_seconds is None or monotonic() - start < max_seconds:
+            batch_start = monotonic()
+            queryset = expired
+
+            if cursor is not None:
+                queryset = queryset.filter(
+                    Q(expiration_date__gt=cursor[0])
+                    | Q(expiration_date=cursor[0], id__gt=cursor[1])
+                )
+
+            rows = list(
+                queryset.values_list("id", "user_id", "role_id", "expiration_date")[
+                    :batch_size
+                ]
+            )
+
+            if not rows:
+                break
+
+            cursor = (rows[-1][3], rows[-1][0])
+
+            if not dry_run:
+                RoleExpiration.manage.remove_role_expirations(
+                    [row[:3] for row in rows], senior_roles
+                )
+
+                if not CommandLock.manage.refresh(lock, lock_timeout):
+                    raise CommandError("the lock was taken over by another run.")
+
+            batches += 1
+            total += len(rows)
+            self.stdout.write(
+                "batch %d: %d expirations in %.2fs"
+                % (batches, len(rows), monotonic() - batch_start)
+            )
+
+        self.stdout.write(
+            "%s %d expirations in %d batches in %.2fs%s"
+            % (
+                "found" if dry_run else "removed",
+                total,
+                batches,
+                monotonic() - start,
+                " (dry run)" if dry_run else "",
+            )
+        )
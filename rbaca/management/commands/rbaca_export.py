@@ -0,0 +1,71 @@
+from time import monotonic
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from rbaca.management.utils import get_file_format, write_assignments
+from rbaca.models import _user_roles_through
+
+
+class Command(BaseCommand):
+    """
+    Management command to export the role assignments of all users as CSV or JSONL.
+
+    The assignments are streamed with a server-side cursor where the database supports it,
+    so the memory usage does not depend on the number of assignments.
+
+    Example:
+        python manage.py rbaca_export assignments.csv --chunk-size 5000
+    """
+
+    help = "Export user-role assignments as CSV or JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path", nargs="?", default="-", help="Output file, - for standard output."
+        )
+        parser.add_argument(
+            "--format",
+            choices=("csv", "jsonl"),
+            help="Format of the output, taken from the file extension by default.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=2000,
+            help="Number of assignments to fetch from the database at once.",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be a positive integer.")
+
+        path = options["path"]
+
+        try:
+            file_format = get_file_format(path, options["format"])
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        through, user_field, role_field = _user_roles_through()
+        rows = (
+            through.objects.order_by("pk")
+            .values_list(
+                "%s__%s" % (user_field, get_user_model().USERNAME_FIELD),
+                "%s__name" % role_field,
+            )
+            .iterator(chunk_size=chunk_size)
+        )
+        start = monotonic()
+
+        if path == "-":
+            count = write_assignments(self.stdout, file_format, rows)
+        else:
+            with open(path, "w", encoding="utf-8", newline="") as file:
+                count = write_assignments(file, file_format, rows)
+
+        (self.stderr if path == "-" else self.stdout).write(
+            "exported %d assignments in %.2fs" % (count, monotonic() - start)
+        )
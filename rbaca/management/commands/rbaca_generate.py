@@ -0,0 +1,276 @@
+import random
+from datetime import timedelta
+from time import monotonic
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Permission
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.utils.timezone import now
+
+from rbaca.cache import policy_changed
+from rbaca.management.utils import chunked
+from rbaca.models import (
+    EffectivePermission,
+    Role,
+    RoleExpiration,
+    Session,
+    _user_roles_through,
+)
+
+
+class Command(BaseCommand):
+    """
+    Management command to generate a synthetic dataset for scale and performance testing.
+
+    The roles form hierarchies of `--depth` roles. The most junior roles of `--cluster-size`
+    consecutive hierarchies are mutually incompatible. Every user holds `--roles-per-user`
+    hierarchies from different clusters, from a random level down to the most junior role, so
+    all generated assignments satisfy the junior and incompatibility rules. Sessions and role
+    expirations are added for a share of the users. Users are written in chunks, so the memory
+    usage does not depend on the number of users. The same seed produces the same dataset.
+
+    Example:
+        python manage.py rbaca_generate --roles 5000 --depth 5 --users 1000000 --seed 1
+    """
+
+    help = "Generate roles, users, assignments, sessions and expirations for scale testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--roles", type=int, default=100, help="Number of roles.")
+        parser.add_argument(
+            "--depth", type=int, default=3, help="Number of roles per hierarchy."
+        )
+        parser.add_argument(
+            "--cluster-size",
+            type=int,
+            default=4,
+            help="Number of hierarchies whose most junior roles are mutually incompatible.",
+        )
+        parser.add_argument(
+            "--permissions-per-role",
+            type=int,
+            default=3,
+            help="Number of permissions granted to each role.",
+        )
+        parser.add_argument("--users", type=int, default=1000, help="Number of users.")
+        parser.add_argument(
+            "--roles-per-user",
+            type=int,
+            default=2,
+            help="Number of hierarchies assigned to each user.",
+        )
+        parser.add_argument(
+            "--sessions",
+            type=float,
+            default=0.5,
+            help="Share of the users with an active session.",
+        )
+        parser.add_argument(
+            "--expirations",
+            type=float,
+            default=0.1,
+            help="Share of the users with a role expiration.",
+        )
+        parser.add_argument(
+            "--prefix", default="gen", help="Prefix of the role and user names."
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Number of users to write per chunk.",
+        )
+
+    def handle(self, *args, **options):
+        for option in ("roles", "depth", "cluster_size", "chunk_size"):
+            if options[option] < 1:
+                raise CommandError(
+                    "--%s must be a positive integer." % option.replace("_", "-")
+                )
+        for option in ("sessions", "expirations"):
+            if not 0 <= options[option] <= 1:
+                raise CommandError("--%s must be between 0 and 1." % option)
+
+        hierarchies = -(-options["roles"] // options["depth"])
+        clusters = -(-hierarchies // options["cluster_size"])
+
+        if options["roles_per_user"] > clusters:
+            raise CommandError(
+                "--roles-per-user can be at most the number of clusters (%d)."
+                % clusters
+            )
+
+        rng = random.Random(options["seed"])
+        start = monotonic()
+
+        try:
+            with transaction.atomic():
+                chains = self.generate_roles(rng, **options)
+        except IntegrityError as error:
+            raise CommandError("could not create the roles: %s" % error)
+
+        self.stdout.write(
+            "created %d roles in %d hierarchies in %.2fs"
+            % (options["roles"], len(chains), monotonic() - start)
+        )
+
+        created = 0
+
+        for chunk in chunked(range(options["users"]), options["chunk_size"]):
+            try:
+                with transaction.atomic():
+                    self.generate_users(rng, chunk, chains, **options)
+            except IntegrityError as error:
+                raise CommandError("could not create the users: %s" % error)
+
+            created += len(chunk)
+            self.stdout.write("created %d of %d users" % (created, options["users"]))
+
+        policy_changed()
+        self.stdout.write("generated the dataset in %.2fs" % (monotonic() - start))
+
+    def generate_roles(self, rng, roles, depth, cluster_size, prefix, **options):
+        """
+        Create the roles, their hierarchies, permissions and incompatibilities.
+
+        Returns:
+            List[List[int]]: The role ids of each hierarchy, from the most senior to the most
+            junior role.
+        """
+        names = ["%s_role_%d" % (prefix, index) for index in range(roles)]
+        Role.objects.bulk_create([Role(name=name) for name in names])
+        role_ids = dict(Role.objects.filter(name__in=names).values_list("name", "id"))
+        chains = [
+            [role_ids[name] for name in names[index : index + depth]]
+            for index in range(0, roles, depth)
+        ]
+
+        Role.objects.bulk_update(
+            [
+                Role(id=role_id, senior_role_id=senior_role_id)
+                for chain in chains
+                for senior_role_id, role_id in zip(chain, chain[1:])
+            ],
+            ["senior_role"],
+            batch_size=1000,
+        )
+
+        permission_ids = list(Permission.objects.values_list("id", flat=True))
+        per_role = min(options["permissions_per_role"], len(permission_ids))
+        permissions = Role.permissions.through
+        permissions.objects.bulk_create(
+            [
+                permissions(role_id=role_id, permission_id=permission_id)
+                for role_id in role_ids.values()
+                for permission_id in rng.sample(permission_ids, per_role)
+            ],
+            batch_size=1000,
+        )
+
+        incompatible = Role.incompatible_roles.through
+        incompatible.objects.bulk_create(
+            [
+                incompatible(from_role_id=chain[-1], to_role_id=other[-1])
+                for index in range(0, len(chains), cluster_size)
+                for chain in chains[index : index + cluster_size]
+                for other in chains[index : index + cluster_size]
+                if chain is not other
+            ],
+            batch_size=1000,
+        )
+        return chains
+
+    def generate_users(
+        self,
+        rng,
+        indexes,
+        chains,
+        cluster_size,
+        roles_per_user,
+        sessions,
+        expirations,
+        prefix,
+        **options
+    ):
+        """
+        Create a chunk of users with their role assignments, sessions and expirations.
+        """
+        user_model = get_user_model()
+        username_field = user_model.USERNAME_FIELD
+        password = make_password(None)
+        names = ["%s_user_%d" % (prefix, index) for index in indexes]
+        user_model._default_manager.bulk_create(
+            [
+                user_model(**{username_field: name, "password": password})
+                for name in names
+            ]
+        )
+        user_ids = dict(
+            user_model._default_manager.filter(
+                **{"%s__in" % username_field: names}
+            ).values_list(username_field, "pk")
+        )
+
+        clusters = [
+            chains[index : index + cluster_size]
+            for index in range(0, len(chains), cluster_size)
+        ]
+        through, user_field, role_field = _user_roles_through()
+        assignments = []
+        session_roles = {}
+        role_expirations = []
+        today = now().date()
+
+        for name in names:
+            user_id = user_ids[name]
+            held = []
+
+            for cluster in rng.sample(clusters, roles_per_user):
+                chain = rng.choice(cluster)
+                held.append(chain[rng.randrange(len(chain)) :])
+
+            role_ids = sorted({role_id for chain in held for role_id in chain})
+            assignments.extend(
+                through(
+                    **{"%s_id" % user_field: user_id, "%s_id" % role_field: role_id}
+                )
+                for role_id in role_ids
+            )
+
+            if rng.random() < sessions:
+                session_roles[user_id] = role_ids
+            if rng.random() < expirations:
+                role_expirations.append(
+                    RoleExpiration(
+                        user_id=user_id,
+                        role_id=rng.choice(held)[0],
+                        expiration_date=today + timedelta(days=rng.randint(-30, 30)),
+                    )
+                )
+
+        through.objects.bulk_create(assignments, batch_size=1000)
+        RoleExpiration.objects.bulk_create(role_expirations, batch_size=1000)
+        Session.objects.bulk_create(
+            [
+                Session(user_id=user_id, active_role_ids=role_ids)
+                for user_id, role_ids in session_roles.items()
+            ],
+            batch_size=1000,
+        )
+        Session.active_roles.through.objects.bulk_create(
+            [
+                Session.active_roles.through(session_id=session_id, role_id=role_id)
+                for session_id, user_id in Session.objects.filter(
+                    user_id__in=list(session_roles), date_end__isnull=True
+                ).values_list("id", "user_id")
+                for role_id in session_roles[user_id]
+            ],
+            batch_size=1000,
+        )
+
+        if getattr(settings, "USE_EFFECTIVE_PERMISSIONS", False):
+            EffectivePermission.manage.refresh_users(user_ids.values())
@@ -0,0 +1,120 @@
+import sys
+from time import monotonic
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from rbaca.management.utils import chunked, get_file_format, read_assignments
+from rbaca.models import Role
+
+
+class Command(BaseCommand):
+    """
+    Management command to import user-role assignments from CSV or JSONL.
+
+    The file is read lazily in batches. Each batch resolves its users with one query, is
+    validated against the junior and incompatibility rules and is written with one bulk insert
+    in its own transaction, so the memory usage does not depend on the size of the file.
+    If a batch fails, the batches before it stay imported.
+
+    Example:
+        python manage.py rbaca_import assignments.csv --batch-size 5000
+    """
+
+    help = "Import user-role assignments from CSV or JSONL."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "path", nargs="?", default="-", help="Input file, - for standard input."
+        )
+        parser.add_argument(
+            "--format",
+            choices=("csv", "jsonl"),
+            help="Format of the input, taken from the file extension by default.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=2000,
+            help="Number of assignments to validate and write per batch.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+
+        if batch_size < 1:
+            raise CommandError("--batch-size must be a positive integer.")
+
+        path = options["path"]
+
+        try:
+            file_format = get_file_format(path, options["format"])
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        if path == "-":
+            return self.import_assignments(sys.stdin, file_format, batch_size)
+
+        try:
+            with open(path, encoding="utf-8", newline="") as file:
+                self.import_assignments(file, file_format, batch_size)
+        except OSError as error:
+            raise CommandError(str(error))
+
+    def import_assignments(self, file, file_format, batch_size):
+        """
+        Validate and write the assignments of a file batch by batch.
+
+        Args:
+            file (TextIO): The file to read from.
+            file_format (str): The format of the file, "csv" or "jsonl".
+            batch_size (int): The number of assignments per batch.
+
+        Raises:
+            CommandError: If a line is malformed, names an unknown user or role or violates
+                a role constraint.
+        """
+        user_model = get_user_model()
+        role_ids = dict(Role.objects.values_list("name", "id"))
+        count = batches = 0
+        start = monotonic()
+
+        try:
+            for batch in chunked(read_assignments(file, file_format), batch_size):
+                user_ids = dict(
+                    user_model._default_manager.filter(
+                        **{
+                            "%s__in"
+                            % user_model.USERNAME_FIELD: {user for _, user, _ in batch}
+                        }
+                    ).values_list(user_model.USERNAME_FIELD, "pk")
+                )
+                user_role_ids = {}
+
+                for line_num, user, role in batch:
+                    if user not in user_ids:
+                        raise ValueError(
+                            "line %d: unknown user '%s'" % (line_num, user)
+                        )
+                    if role not in role_ids:
+                        raise ValueError(
+                            "line %d: unknown role '%s'" % (line_num, role)
+                        )
+                    user_role_ids.setdefault(user_ids[user], set()).add(role_ids[role])
+
+                with transaction.atomic():
+                    Role.manage.bulk_assign_user_roles(user_role_ids)
+
+                count += len(batch)
+                batches += 1
+        except ValueError as error:
+            raise CommandError(
+                "%s (%d assignments in %d batches were imported)"
+                % (error, count, batches)
+            )
+
+        self.stdout.write(
+            "imported %d assignments in %d batches in %.2fs"
+            % (count, batches, monotonic() - start)
+        )
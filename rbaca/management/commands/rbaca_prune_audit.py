@@ -0,0 +1,75 @@
+from datetime import timedelta
+from time import monotonic
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from rbaca.models import AuditEntry
+
+
+class Command(BaseCommand):
+    """
+    Management command to delete old entries of the role administration audit trail.
+
+    Entries written more than `--days` days ago are deleted in batches, so the table is
+    never locked for long and the command can be interrupted at any time.
+
+    Example:
+        python manage.py rbaca_prune_audit --days 365 --batch-size 1000
+    """
+
+    help = "Delete old audit trail entries in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=getattr(settings, "AUDIT_TRAIL_RETENTION_DAYS", 365),
+            help="Delete entries written more than this many days ago.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of entries to delete per batch.",
+        )
+        parser.add_argument(
+            "--max-seconds",
+            type=float,
+            default=None,
+            help="Stop after the batch during which this many seconds have elapsed.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        max_seconds = options["max_seconds"]
+
+        if batch_size < 1:
+            raise CommandError("--batch-size must be a positive integer.")
+        if options["days"] < 0:
+            raise CommandError("--days must not be negative.")
+
+        before = now() - timedelta(days=options["days"])
+        batches = total = 0
+        start = monotonic()
+
+        while max_seconds is None or monotonic() - start < max_seconds:
+            batch_start = monotonic()
+            deleted = AuditEntry.manage.delete_before(before, chunk_size=batch_size)
+
+            if not deleted:
+                break
+
+            batches += 1
+            total += deleted
+            self.stdout.write(
+                "batch %d: %d entries in %.2fs"
+                % (batches, deleted, monotonic() - batch_start)
+            )
+
+        elapsed = monotonic() - start
+        self.stdout.write(
+            "deleted %d entries in %d batches in %.2fs (%.0f entries/s)"
+            % (total, batches, elapsed, total / elapsed if elapsed else 0)
+        )
@@ -0,0 +1,74 @@
+from time import monotonic
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rbaca.policy import (
+    PolicyDiff,
+    PolicyError,
+    apply_policy_diff,
+    load_policy,
+    parse_policy,
+    read_policy,
+)
+
+
+class Command(BaseCommand):
+    """
+    Management command to bring roles, permissions, the role hierarchy and incompatibilities
+    in line with a declarative policy file.
+
+    The current policy is loaded with three queries and only the differences are written,
+    with bulk statements in a single change set. Roles missing from the file are kept unless
+    `--prune` is given. The node mapping is read from the `NODE_ACCESS` setting, so a
+    differing `node_access` entry is reported but has to be changed in the settings.
+
+    Example:
+        python manage.py rbaca_sync_policy policy.json --check
+    """
+
+    help = "Synchronize roles and permissions with a JSON or YAML policy file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path of the JSON or YAML policy file.")
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report the differences and fail if there are any.",
+        )
+        parser.add_argument(
+            "--prune",
+            action="store_true",
+            help="Delete roles that are missing from the policy file.",
+        )
+
+    def handle(self, *args, **options):
+        start = monotonic()
+
+        try:
+            desired = parse_policy(read_policy(options["path"]))
+        except (OSError, PolicyError) as error:
+            raise CommandError(str(error))
+
+        diff = PolicyDiff(load_policy(), desired, prune=options["prune"])
+
+        for line in diff.describe():
+            self.stdout.write(line)
+
+        if options["check"]:
+            if diff:
+                raise CommandError("the policy is out of sync.")
+            self.stdout.write("the policy is in sync")
+            return
+
+        try:
+            apply_policy_diff(diff)
+        except PolicyError as error:
+            raise CommandError(str(error))
+
+        if diff.node_access_changed:
+            self.stderr.write("node access has to be changed in NODE_ACCESS")
+
+        self.stdout.write(
+            "applied %d changes in %.2fs"
+            % (len(diff.describe()) - diff.node_access_changed, monotonic() - start)
+        )
@@ -0,0 +1,41 @@
+from time import monotonic
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rbaca.models import Session
+
+
+class Command(BaseCommand):
+    """
+    Management command to copy the active roles of all active sessions to their
+    `active_role_ids`.
+
+    The role ids of a session are only kept in sync while `USE_SESSION_ROLE_IDS` is enabled.
+    Run this command once after enabling the setting on a database with existing sessions.
+
+    Example:
+        python manage.py rbaca_sync_session_roles --chunk-size 1000
+    """
+
+    help = "Copy the active roles of active sessions to their role ids."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Number of sessions to check per chunk.",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be a positive integer.")
+
+        start = monotonic()
+        updated = Session.manage.sync_active_role_ids(chunk_size=chunk_size)
+
+        self.stdout.write(
+            "synced %d sessions in %.2fs" % (updated, monotonic() - start)
+        )
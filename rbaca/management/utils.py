@@ -0,0 +1,113 @@
+import csv
+import json
+from itertools import islice
+
+
+def chunked(iterable, chunk_size):
+    """
+    Split an iterable into lists of at most chunk_size items without materializing it.
+
+    Args:
+        iterable (Iterable): The iterable to split.
+        chunk_size (int): The maximum number of items per chunk.
+
+    Returns:
+        Generator[List]: The chunks of the iterable.
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def get_file_format(path, file_format=None):
+    """
+    Get the format of an assignment file from an explicit format or the file extension.
+
+    Args:
+        path (str): The path of the file, "-" for standard input or output, which defaults
+            to CSV.
+        file_format (str, optional): The explicit format, "csv" or "jsonl".
+
+    Returns:
+        str: The format, "csv" or "jsonl".
+
+    Raises:
+        ValueError: If the format can not be determined.
+    """
+    if file_format is None and path == "-":
+        file_format = "csv"
+    elif file_format is None:
+        file_format = path.rsplit(".", 1)[-1].lower() if "." in path else None
+
+    if file_format not in ("csv", "jsonl"):
+        raise ValueError("the format must be csv or jsonl, use --format to set it.")
+    return file_format
+
+
+def read_assignments(file, file_format):
+    """
+    Read the user-role pairs of an assignment file lazily.
+
+    CSV files need a header with the columns `user` and `role`, JSONL files hold one object
+    with the keys `user` and `role` per line.
+
+    Args:
+        file (TextIO): The file to read from.
+        file_format (str): The format of the file, "csv" or "jsonl".
+
+    Returns:
+        Generator[Tuple[int, str, str]]: The line number, username and role name of each pair.
+
+    Raises:
+        ValueError: If a line is malformed.
+    """
+    if file_format == "csv":
+        reader = csv.DictReader(file)
+
+        if reader.fieldnames is None or not {"user", "role"} <= set(reader.fieldnames):
+            raise ValueError("the CSV header must contain the columns user and role.")
+
+        for row in reader:
+            if not row["user"] or not row["role"]:
+                raise ValueError("line %d misses a user or role." % reader.line_num)
+            yield reader.line_num, row["user"], row["role"]
+        return
+
+    for line_num, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            yield line_num, str(row["user"]), str(row["role"])
+        except (ValueError, TypeError, KeyError):
+            raise ValueError("line %d is not a valid assignment." % line_num)
+
+
+def write_assignments(file, file_format, rows):
+    """
+    Write user-role pairs to an assignment file as they are produced.
+
+    Args:
+        file (TextIO): The file to write to.
+        file_format (str): The format of the file, "csv" or "jsonl".
+        rows (Iterable[Tuple[str, str]]): The username and role name of each pair.
+
+    Returns:
+        int: The number of pairs written.
+    """
+    count = 0
+
+    if file_format == "csv":
+        writer = csv.writer(file)
+        writer.writerow(("user", "role"))
+
+        for count, row in enumerate(rows, 1):
+            writer.writerow(row)
+        return count
+
+    for count, (user, role) in enumerate(rows, 1):
+        file.write(json.dumps({"user": user, "role": role}) + "\n")
+    return count
@@ -0,0 +1,44 @@
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from rbaca.instrumentation import RequestProfile, activate_profile, deactivate_profile
+
+logger = logging.getLogger("rbaca.profiler")
+
+
+class AuthorizationProfilerMiddleware:
+    """
+    Debug-only middleware that profiles the authorization checks of each request.
+
+    Every `has_perm`, `has_role` and `has_active_session` call of the request is listed with
+    its caller, its cache lookups and the SQL it issued. Repeated identical checks, which a
+    cache could have absorbed, are flagged. The report is logged to the `rbaca.profiler`
+    logger, the summary is sent in the `X-Rbaca-Profile` response header, and the profile is
+    available as `request.rbaca_profile`. The middleware is disabled unless `DEBUG` is True.
+
+    Example:
+        MIDDLEWARE = [..., "rbaca.middleware.AuthorizationProfilerMiddleware"]
+    """
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed()
+
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = request.rbaca_profile = RequestProfile()
+        token = activate_profile(profile)
+
+        try:
+            response = self.get_response(request)
+        finally:
+            deactivate_profile(token)
+
+        response["X-Rbaca-Profile"] = profile.summary()
+        logger.debug(
+            "%s %s\n%s", request.method, request.path, "\n".join(profile.report())
+        )
+        return response
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.30 on 2026-10-18 22:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("rbaca", "0002_roleexpiration_uuid"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="EffectivePermission",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "permission",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="auth.permission",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Effective permission",
+                "verbose_name_plural": "Effective permissions",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="effectivepermission",
+            constraint=models.UniqueConstraint(
+                fields=("user", "permission"), name="rbaca_unique_effective_permission"
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rbaca", "0003_effectivepermission"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CommandLock",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+                ("owner", models.CharField(blank=True, max_length=255)),
+                ("acquired_at", models.DateTimeField()),
+                ("expires_at", models.DateTimeField()),
+            ],
+            options={
+                "verbose_name": "Command lock",
+                "verbose_name_plural": "Command locks",
+            },
+        ),
+    ]
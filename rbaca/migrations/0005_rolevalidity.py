@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("rbaca", "0004_commandlock"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RoleValidity",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("valid_from", models.DateTimeField(blank=True, null=True)),
+                ("valid_until", models.DateTimeField(blank=True, null=True)),
+                (
+                    "role",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="rbaca.role"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Role validity",
+                "verbose_name_plural": "Role validities",
+                "indexes": [
+                    models.Index(
+                        fields=["user", "valid_until"],
+                        name="rbaca_rolevalidity_until_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="rolevalidity",
+            constraint=models.UniqueConstraint(
+                fields=("user", "role"), name="rbaca_unique_role_validity"
+            ),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:14
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicate_expirations(apps, schema_editor):
+    """
+    Keep only the earliest expiration of each role of a user, which is the one taking effect.
+    """
+    RoleExpiration = apps.get_model("rbaca", "RoleExpiration")
+    duplicates = (
+        RoleExpiration.objects.values("user_id", "role_id")
+        .annotate(count=Count("id"))
+        .filter(count__gt=1)
+    )
+
+    for duplicate in duplicates:
+        expirations = RoleExpiration.objects.filter(
+            user_id=duplicate["user_id"], role_id=duplicate["role_id"]
+        ).order_by("expiration_date", "id")
+        expirations.exclude(pk=expirations[0].pk).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rbaca", "0005_rolevalidity"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_expirations, reverse_code=migrations.RunPython.noop
+        ),
+        migrations.AddIndex(
+            model_name="roleexpiration",
+            index=models.Index(
+                fields=["expiration_date", "id"], name="rbaca_roleexpiration_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="session",
+            index=models.Index(
+                condition=models.Q(("date_end__isnull", True)),
+                fields=["user"],
+                name="rbaca_session_active_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="roleexpiration",
+            constraint=models.UniqueConstraint(
+                fields=("user", "role"), name="rbaca_unique_role_expiration"
+            ),
+        ),
+    ]
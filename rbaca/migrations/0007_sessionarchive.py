@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("rbaca", "0006_authorization_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SessionArchive",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("session_id", models.PositiveBigIntegerField()),
+                ("date_start", models.DateTimeField()),
+                ("date_end", models.DateTimeField()),
+                ("roles", models.JSONField(default=list)),
+            ],
+            options={
+                "verbose_name": "Session archive",
+                "verbose_name_plural": "Session archives",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="session",
+            index=models.Index(
+                fields=["date_end", "id"], name="rbaca_session_date_end_idx"
+            ),
+        ),
+        migrations.AddField(
+            model_name="sessionarchive",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("rbaca", "0007_sessionarchive"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="session",
+            name="active_role_ids",
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.AddField(
+            model_name="session",
+            name="active_roles_version",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:41
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("rbaca", "0008_session_active_role_ids"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AccessDecision",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("perm", "Permission"),
+                            ("role", "Role"),
+                            ("node", "Node"),
+                        ],
+                        max_length=4,
+                    ),
+                ),
+                ("target", models.CharField(max_length=255)),
+                ("granted", models.BooleanField()),
+                ("date", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Access decision",
+                "verbose_name_plural": "Access decisions",
+                "indexes": [
+                    models.Index(fields=["date"], name="rbaca_decision_date_idx")
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 4.2.30 on 2026-10-18 23:45
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("rbaca", "0009_accessdecision"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AuditEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "action",
+                    models.CharField(
+                        choices=[
+                            ("create_role", "Create role"),
+                            ("update_role", "Update role"),
+                            ("delete_role", "Delete role"),
+                            ("assign_roles", "Assign roles"),
+                            ("deassign_roles", "Deassign roles"),
+                            ("update_roles", "Update roles"),
+                        ],
+                        max_length=16,
+                    ),
+                ),
+                ("target_id", models.CharField(max_length=64)),
+                ("target_name", models.CharField(max_length=255)),
+                ("roles_before", models.JSONField(blank=True, null=True)),
+                ("roles_after", models.JSONField(blank=True, null=True)),
+                ("permissions_before", models.JSONField(blank=True, null=True)),
+                ("permissions_after", models.JSONField(blank=True, null=True)),
+                ("date", models.DateTimeField(default=django.utils.timezone.now)),
+                (
+                    "actor",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Audit entry",
+                "verbose_name_plural": "Audit entries",
+                "indexes": [
+                    models.Index(fields=["date"], name="rbaca_audit_date_idx"),
+                    models.Index(fields=["target_id"], name="rbaca_audit_target_idx"),
+                ],
+            },
+        ),
+    ]
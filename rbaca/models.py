@@ -6,11 +6,24 @@ from django.contrib import auth
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractBaseUser, Permission, UserManager
 from django.core.exceptions import PermissionDenied
-from django.db import models
+from django.db import IntegrityError, models, router, transaction
+from django.db.models import Q
 from django.utils.itercompat import is_iterable
 from django.utils.timezone import now
 from django.utils.translation import gettext_lazy as _
 
+from rbaca.audit import _use_audit_trail, record_change
+from rbaca.cache import (
+    get_pending_invalidations,
+    get_session_entry,
+    invalidate_users,
+    is_shared_cache,
+    policy_changed,
+    set_session_entry,
+)
+from rbaca.decisions import log_decision
+from rbaca.instrumentation import instrumented, record_cache
+
 
 class RoleManager(models.Manager):
     """
@@ -41,10 +54,308 @@ class RoleManager(models.Manager):
 
         role.delete()
 
+    @staticmethod
+    def get_junior_closure(role_ids):
+        """
+        Get the junior roles of each given role through the whole hierarchy.
+        Issues one query per hierarchy level.
+
+        Args:
+            role_ids (Iterable[int]): The ids of the roles to resolve.
+
+        Returns:
+            Dict[int, Set[int]]: The ids of each role and all of its junior roles, keyed by the role id.
+        """
+        role_ids = set(role_ids)
+        seniors = {}
+        visited = set(role_ids)
+        frontier = set(role_ids)
+
+        while frontier:
+            junior_roles = Role.objects.filter(senior_role_id__in=frontier).values_list(
+                "id", "senior_role_id"
+            )
+            frontier = set()
+            for junior_id, senior_id in junior_roles:
+                seniors[junior_id] = senior_id
+                if junior_id not in visited:
+                    visited.add(junior_id)
+                    frontier.add(junior_id)
+
+        closure = {role_id: set() for role_id in role_ids}
+
+        for role_id in visited:
+            current, seen = role_id, set()
+            while current is not None and current not in seen:
+                seen.add(current)
+                if current in closure:
+                    closure[current].add(role_id)
+                current = seniors.get(current)
+        return closure
+
+    @staticmethod
+    def get_senior_role_ids(role_ids):
+        """
+        Get the given roles together with all of their senior roles.
+        Issues one query per hierarchy level.
+
+        Args:
+            role_ids (Iterable[int]): The ids of the roles to resolve.
+
+        Returns:
+            Set[int]: The ids of the roles and all of their senior roles.
+        """
+        senior_role_ids = set(role_ids)
+        frontier = set(senior_role_ids)
+
+        while frontier:
+            frontier = (
+                set(
+                    Role.objects.filter(
+                        id__in=frontier, senior_role__isnull=False
+                    ).values_list("senior_role_id", flat=True)
+                )
+                - senior_role_ids
+            )
+            senior_role_ids |= frontier
+        return senior_role_ids
+
+    def bulk_assign(self, users, roles):
+        """
+        Assign one or more roles to many users at once. The whole batch is validated like in
+        `bulk_assign_user_roles` before the assignments are written with a single bulk insert.
+
+        Args:
+            users (Union[QuerySet[User], List[User]]): The users to assign the roles to.
+            roles (Union[Role, List[Role]]): The role(s) to assign.
+
+        Raises:
+            ValueError: If roles are a string, are incompatible with the roles of a user or if
+                a user misses a junior role.
+
+        Example:
+            Role.manage.bulk_assign(User.objects.filter(department="sales"), [Role1, Role2])
+        """
+        roles = _as_roles(roles)
+        users, user_ids = _as_users(users)
+        role_ids = {role.id for role in roles}
+
+        if not role_ids or not user_ids:
+            return
+
+        self._assign_user_roles({user_id: role_ids for user_id in user_ids}, users)
+
+    def bulk_assign_user_roles(self, user_role_ids):
+        """
+        Assign a different set of roles to each of many users at once. The batch is validated
+        against the current assignments with three queries and the constraint engine before the
+        assignments are written with a single bulk insert.
+
+        Args:
+            user_role_ids (Dict[int, Iterable[int]]): The ids of the roles to assign, keyed by
+                the user id.
+
+        Raises:
+            ValueError: If roles are incompatible with the roles of a user or if a user misses
+                a junior role.
+
+        Example:
+            Role.manage.bulk_assign_user_roles({user1.pk: [role1.pk], user2.pk: [role2.pk]})
+        """
+        user_role_ids = {
+            user_id: set(role_ids)
+            for user_id, role_ids in user_role_ids.items()
+            if role_ids
+        }
+
+        if user_role_ids:
+            self._assign_user_roles(user_role_ids)
+
+    def _assign_user_roles(self, user_role_ids, users=()):
+        """
+        Validate and write the role assignments of `bulk_assign` and `bulk_assign_user_roles`.
+        Only the assigned and held roles and their junior roles are read.
+
+        Args:
+            user_role_ids (Dict[int, Set[int]]): The ids of the roles to assign, keyed by the
+                user id.
+            users (List[User], optional): The user instances whose caches are dropped.
+
+        Raises:
+            ValueError: If roles are incompatible with the roles of a user or if a user misses
+                a junior role.
+        """
+        from rbaca.constraints import get_constraint_engine
+
+        through, user_field, role_field = _user_roles_through()
+        assigned_role_ids = {user_id: set() for user_id in user_role_ids}
+
+        for user_id, role_id in through.objects.filter(
+            **{"%s__in" % user_field: list(user_role_ids)}
+        ).values_list(user_field, role_field):
+            assigned_role_ids[user_id].add(role_id)
+
+        batch_role_ids = set().union(*user_role_ids.values())
+        junior_role_ids = {}
+
+        if _use_role_inheritance():
+            known_role_ids = set(
+                self.filter(id__in=batch_role_ids).values_list("id", flat=True)
+            )
+            closure = self.get_junior_closure(
+                known_role_ids.union(*assigned_role_ids.values())
+            )
+        else:
+            known_role_ids = set()
+            for role_id, senior_role_id in self.filter(
+                Q(id__in=batch_role_ids) | Q(senior_role_id__in=batch_role_ids)
+            ).values_list("id", "senior_role_id"):
+                if role_id in batch_role_ids:
+                    known_role_ids.add(role_id)
+                if senior_role_id in batch_role_ids:
+                    junior_role_ids.setdefault(senior_role_id, set()).add(role_id)
+            closure = {
+                role_id: {role_id}
+                for role_id in known_role_ids.union(*assigned_role_ids.values())
+            }
+
+        engine = get_constraint_engine(
+            set().union(*(closure[role_id] for role_id in known_role_ids))
+        )
+
+        for user_id, role_ids in user_role_ids.items():
+            if role_ids - known_role_ids:
+                raise ValueError(
+                    "unknown role ids for user with id '%s': %s"
+                    % (user_id, sorted(role_ids - known_role_ids))
+                )
+
+            new_role_ids = set().union(*(closure[role_id] for role_id in role_ids))
+            held_role_ids = new_role_ids.union(
+                *(closure[role_id] for role_id in assigned_role_ids[user_id])
+            )
+
+            _check_conflict_free(engine, new_role_ids, held_role_ids, user_id)
+
+            if not _use_role_inheritance() and not set().union(
+                *(junior_role_ids.get(role_id, ()) for role_id in role_ids)
+            ) <= (role_ids | assigned_role_ids[user_id]):
+                raise ValueError(
+                    "user with id '%s' needs all junior roles before assigning."
+                    % user_id
+                )
+
+        through.objects.bulk_create(
+            [
+                through(
+                    **{"%s_id" % user_field: user_id, "%s_id" % role_field: role_id}
+                )
+                for user_id, role_ids in user_role_ids.items()
+                for role_id in role_ids
+            ],
+            ignore_conflicts=True,
+        )
+        _invalidate_user_roles(users, list(user_role_ids))
+
+    def bulk_deassign(self, users, roles):
+        """
+        Deassign one or more roles, and all of their senior roles, from many users at once.
+
+        Args:
+            users (Union[QuerySet[User], List[User]]): The users to deassign the roles from.
+            roles (Union[Role, List[Role]]): The role(s) to deassign.
+
+        Raises:
+            ValueError: If roles are a string.
+
+        Example:
+            Role.manage.bulk_deassign(User.objects.filter(department="sales"), Role1)
+        """
+        roles = _as_roles(roles)
+        users, user_ids = _as_users(users)
+
+        if not roles or not user_ids:
+            return
+
+        through, user_field, role_field = _user_roles_through()
+        through.objects.filter(
+            **{
+                "%s__in" % user_field: user_ids,
+                "%s__in"
+                % role_field: self.get_senior_role_ids(role.id for role in roles),
+            }
+        ).delete()
+        _invalidate_user_roles(users, user_ids)
+
+    def set_senior_roles(self, senior_roles):
+        """
+        Set the senior roles of many roles at once, with the rules of `Role.set_senior_role`:
+        a senior role can not be incompatible with its junior role, and the junior role
+        inherits the incompatible roles of its senior role. The edits are validated together,
+        in the given order, so a junior role also inherits the incompatible roles an earlier
+        edit gave to its senior role. The incompatibilities are read with one query and
+        written with one bulk statement each.
+
+        Args:
+            senior_roles (List[Tuple[Role, Union[Role, None]]]): The (role, senior role) pairs.
+                A senior role of None removes the senior role.
+
+        Raises:
+            ValueError: If a senior role is an incompatible role of its junior role.
+        """
+        if not senior_roles:
+            return
+
+        through = Role.incompatible_roles.through
+        role_ids = {
+            role.pk for pair in senior_roles for role in pair if role is not None
+        }
+        incompatible = {role_id: set() for role_id in role_ids}
+
+        for role_id, other_id in through.objects.filter(
+            from_role_id__in=role_ids
+        ).values_list("from_role_id", "to_role_id"):
+            incompatible[role_id].add(other_id)
+
+        added, roles, changed_role_ids = set(), {}, set()
+
+        for role, senior_role in senior_roles:
+            changed_role_ids.add(role.senior_role_id)
+
+            if senior_role is not None:
+                if senior_role.pk in incompatible[role.pk]:
+                    raise ValueError("an incompatible role can not be a senior role.")
+
+                for other_id in incompatible[senior_role.pk] - incompatible[role.pk]:
+                    incompatible[role.pk].add(other_id)
+                    incompatible.get(other_id, set()).add(role.pk)
+                    added.update({(role.pk, other_id), (other_id, role.pk)})
+
+            role.senior_role = senior_role
+            roles[role.pk] = role
+            changed_role_ids.add(role.senior_role_id)
+
+        through.objects.bulk_create(
+            [through(from_role_id=a, to_role_id=b) for a, b in sorted(added)],
+            ignore_conflicts=True,
+        )
+        self.bulk_update(roles.values(), ["senior_role"])
+        policy_changed()
+
+        if (
+            getattr(settings, "USE_EFFECTIVE_PERMISSIONS", False)
+            and _use_role_inheritance()
+        ):
+            changed_role_ids.discard(None)
+            EffectivePermission.manage.refresh_roles(changed_role_ids)
+
     @staticmethod
     def check_role_compatibility(roles, check_junior=True, check_incompatible=True):
         """
-        Check compatibility of a set of roles.
+        Check compatibility of a set of roles. The missing junior roles of the whole selection are
+        fetched with one query and the incompatible pairs are resolved by the constraint engine.
+        If `USE_ROLE_INHERITANCE` is enabled,
+        junior roles are implied by their senior roles and are not required in the set.
 
         Args:
             roles (list of Role): A list of roles to check for compatibility.
@@ -52,21 +363,78 @@ class RoleManager(models.Manager):
             check_incompatible (bool): Decides if the function should check incompatible role compatibility.
 
         Returns:
-            bool: True if roles are compatible, False otherwise.
+            RoleCompatibility: The result of the check, which evaluates to True if roles are compatible.
         """
-        if check_junior:
-            junior_roles = Role.objects.filter(senior_role__in=roles)
+        roles = {role.id: role for role in roles}
 
-            if not all(junior_role in roles for junior_role in junior_roles):
-                return False
-        if check_incompatible:
-            for role in roles:
-                if (
-                    role.incompatible_roles
-                    and role.incompatible_roles.all().intersection(roles)
-                ):
-                    return False
-        return True
+        if _use_role_inheritance():
+            check_junior = False
+            role_ids = set().union(*RoleManager.get_junior_closure(roles).values())
+            if role_ids - roles.keys():
+                roles = Role.objects.in_bulk(role_ids)
+
+        missing_junior_roles = []
+        incompatible_pairs = []
+
+        if check_junior and roles:
+            missing_junior_roles = list(
+                Role.objects.filter(senior_role_id__in=list(roles)).exclude(
+                    id__in=list(roles)
+                )
+            )
+        if check_incompatible and roles:
+            from rbaca.constraints import get_constraint_engine
+
+            incompatible_pairs = get_constraint_engine(roles).get_conflicts(roles)
+
+        return RoleCompatibility(
+            incompatible_pairs=[
+                (roles[role_id], roles[other_id])
+                for role_id, other_id in incompatible_pairs
+            ],
+            missing_junior_roles=missing_junior_roles,
+        )
+
+
+class RoleCompatibility:
+    """
+    Result of a role compatibility check. Evaluates to True if the checked roles are compatible.
+
+    Attributes:
+        incompatible_pairs (List[Tuple[Role, Role]]): The pairs of checked roles that are incompatible.
+        missing_junior_roles (List[Role]): The junior roles missing from the checked roles.
+    """
+
+    def __init__(self, incompatible_pairs=(), missing_junior_roles=()):
+        self.incompatible_pairs = list(incompatible_pairs)
+        self.missing_junior_roles = list(missing_junior_roles)
+
+    def __bool__(self):
+        """
+        Return if the checked roles are compatible.
+
+        Returns:
+            bool: True if no roles are incompatible and no junior roles are missing.
+        """
+        return not self.incompatible_pairs and not self.missing_junior_roles
+
+    def __str__(self) -> str:
+        """
+        Return a description of the conflicts.
+
+        Returns:
+            str: The incompatible role pairs and the missing junior roles.
+        """
+        conflicts = [
+            "role '%s' is incompatible with '%s'" % (role.name, other.name)
+            for role, other in self.incompatible_pairs
+        ]
+        if self.missing_junior_roles:
+            conflicts.append(
+                "junior roles '%s' are missing"
+                % ", ".join(role.name for role in self.missing_junior_roles)
+            )
+        return "; ".join(conflicts)
 
 
 class Role(models.Model):
@@ -113,7 +481,6 @@ class Role(models.Model):
             perms = {perms}
 
         self.permissions.add(*perms)
-        self.save()
 
     def revoke_perms(self, perms):
         """
@@ -129,7 +496,6 @@ class Role(models.Model):
             perms = {perms}
 
         self.permissions.remove(*perms)
-        self.save()
 
     def role_perms(self):
         """
@@ -149,12 +515,16 @@ class Role(models.Model):
         Raises:
             ValueError: If given senior role is an incompatible role of the junior role.
         """
-        if self.incompatible_roles and senior_role in self.incompatible_roles.all():
+        from rbaca.constraints import get_constraint_engine
+
+        if not get_constraint_engine([self.id]).is_conflict_free(
+            [self.id], [senior_role.id]
+        ):
             raise ValueError("an incompatible role can not be a senior role.")
 
         self.senior_role = senior_role
         self.incompatible_roles.add(*senior_role.incompatible_roles.all())
-        self.save()
+        self.save(update_fields=["senior_role"])
 
     def set_incompatible_roles(self, incompatible_roles):
         """
@@ -237,198 +607,1073 @@ class SessionManager(models.Manager):
 
         Returns:
             Session: The session object created and added.
+
+        Raises:
+            ValueError: If the user does not hold all active roles or they are incompatible.
         """
-        if active_roles is not None and not is_iterable(active_roles):
-            active_roles = {active_roles}
+        if active_roles is not None:
+            active_roles = _as_roles(active_roles)
+            self.validate_active_roles(user.pk, [role.id for role in active_roles])
 
         session = self.create(user=user)
 
-        if active_roles:
-            session.active_roles.set(active_roles)
-            session.save()
+        if active_roles:
+            session.active_roles.add(*active_roles)
+
+        return session
+
+    @staticmethod
+    def validate_active_roles(user_id, role_ids, active_role_ids=()):
+        """
+        Check that a user holds all roles to activate and that they are compatible with each
+        other and with the roles already active. Membership is checked with a single query
+        and the dynamic separation of duty by the constraint engine. Active superusers may
+        activate roles they do not hold, like `has_role` treats them as holding every role,
+        but the dynamic separation of duty still applies to them.
+
+        Args:
+            user_id (int): The id of the user owning the session.
+            role_ids (Iterable[int]): The ids of the roles to activate.
+            active_role_ids (Iterable[int], optional): The ids of the roles already active.
+
+        Raises:
+            ValueError: If the user does not hold all roles or they are incompatible.
+        """
+        from rbaca.constraints import get_constraint_engine
+
+        role_ids = set(role_ids)
+
+        if not role_ids:
+            return
+
+        through, user_field, role_field = _user_roles_through()
+
+        if _use_role_inheritance():
+            held_role_ids = set().union(
+                *Role.manage.get_junior_closure(
+                    through.objects.filter(**{user_field: user_id}).values_list(
+                        role_field, flat=True
+                    )
+                ).values()
+            )
+        else:
+            held_role_ids = set(
+                through.objects.filter(
+                    **{user_field: user_id, "%s__in" % role_field: role_ids}
+                ).values_list(role_field, flat=True)
+            )
+
+        if (
+            not role_ids <= held_role_ids
+            and not get_user_model()
+            .objects.filter(pk=user_id, is_active=True, is_superuser=True)
+            .exists()
+        ):
+            raise ValueError(
+                "user with id '%s' does not hold the roles with ids %s."
+                % (user_id, sorted(role_ids - held_role_ids))
+            )
+
+        role_ids |= set(active_role_ids)
+
+        if not get_constraint_engine(role_ids).is_conflict_free(role_ids):
+            raise ValueError("roles can not be active in the same session.")
+
+    def delete_session(self, session):
+        """
+        Delete a session from the database.
+
+        Args:
+            session (Session): The session to delete.
+        """
+        session.delete()
+
+    @staticmethod
+    def get_timeout_cutoff(at=None):
+        """
+        Get the start time before which an open session has timed out.
+
+        Args:
+            at (datetime, optional): The time to check. Defaults to now.
+
+        Returns:
+            datetime: The earliest start time of an active session.
+        """
+        return (at or now()) - timedelta(seconds=settings.SESSION_TIMEOUT_ABSOLUTE)
+
+    def get_active_sessions(self, at=None):
+        """
+        Get the sessions that are neither closed nor timed out.
+        The timeout is evaluated as part of the query, so reading sessions never writes.
+
+        Args:
+            at (datetime, optional): The time to check. Defaults to now.
+
+        Returns:
+            QuerySet[Session]: QuerySet of active sessions.
+        """
+        return self.filter(
+            date_end__isnull=True, date_start__gte=self.get_timeout_cutoff(at)
+        )
+
+    def get_timed_out_sessions(self, at=None):
+        """
+        Get the sessions that have timed out but are not closed yet.
+
+        Args:
+            at (datetime, optional): The time to check. Defaults to now.
+
+        Returns:
+            QuerySet[Session]: QuerySet of timed out sessions.
+        """
+        return self.filter(
+            date_end__isnull=True, date_start__lt=self.get_timeout_cutoff(at)
+        )
+
+    def close_timed_out_sessions(self, chunk_size=1000):
+        """
+        Close all timed out sessions with one bulk update per chunk. The end of a closed session
+        is set to the time it timed out.
+
+        Args:
+            chunk_size (int, optional): The number of sessions closed per update.
+
+        Returns:
+            int: The number of closed sessions.
+        """
+        closed = 0
+        timed_out = self.get_timed_out_sessions().order_by("id")
+
+        while True:
+            session_ids = list(timed_out.values_list("id", flat=True)[:chunk_size])
+
+            if not session_ids:
+                return closed
+
+            closed += self.filter(id__in=session_ids, date_end__isnull=True).update(
+                date_end=models.F("date_start")
+                + timedelta(seconds=settings.SESSION_TIMEOUT_ABSOLUTE)
+            )
+
+    def sync_active_role_ids(self, chunk_size=1000):
+        """
+        Copy the ids of the active roles of all active sessions to `active_role_ids`, e.g. after
+        `USE_SESSION_ROLE_IDS` was enabled for existing sessions. Each chunk is read with two
+        queries and only sessions whose ids differ are written, with one bulk update.
+
+        Args:
+            chunk_size (int, optional): The number of sessions checked per chunk.
+
+        Returns:
+            int: The number of updated sessions.
+        """
+        through = Session.active_roles.through
+        sessions = self.get_active_sessions().order_by("id")
+        updated, last_id = 0, 0
+
+        while True:
+            chunk = list(
+                sessions.filter(id__gt=last_id).only("id", "active_role_ids")[
+                    :chunk_size
+                ]
+            )
+
+            if not chunk:
+                return updated
+
+            last_id = chunk[-1].id
+            role_ids = {session.id: [] for session in chunk}
+
+            for session_id, role_id in through.objects.filter(
+                session_id__in=role_ids
+            ).values_list("session_id", "role_id"):
+                role_ids[session_id].append(role_id)
+
+            stale = []
+
+            for session in chunk:
+                if session.active_role_ids != sorted(role_ids[session.id]):
+                    session.active_role_ids = sorted(role_ids[session.id])
+                    session.active_roles_version = models.F("active_roles_version") + 1
+                    stale.append(session)
+
+            updated += self.bulk_update(
+                stale, ["active_role_ids", "active_roles_version"]
+            )
+
+            if len(chunk) < chunk_size:
+                return updated
+
+
+class Session(models.Model):
+    """
+    Model representing user sessions in the system.
+
+    Fields:
+        user (User): The user associated with the session.
+        active_roles (ManyToManyField): Active roles for the session.
+        active_role_ids (JSONField): The sorted ids of the active roles, kept in sync with
+            `active_roles`, so permissions can be resolved from the session row alone.
+        active_roles_version (int): Incremented whenever the active roles change.
+        date_start (DateTimeField): The start date and time of the session.
+        date_end (DateTimeField): The end date and time of the session.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=False, blank=False, on_delete=models.CASCADE
+    )
+    active_roles = models.ManyToManyField(Role, blank=False)
+    active_role_ids = models.JSONField(default=list, blank=True, editable=False)
+    active_roles_version = models.PositiveIntegerField(default=0, editable=False)
+    date_start = models.DateTimeField(auto_now_add=True)
+    date_end = models.DateTimeField(null=True, blank=True)
+
+    objects = models.Manager()
+    manage = SessionManager()
+
+    class Meta:
+        verbose_name = _("Session")
+        verbose_name_plural = _("Sessions")
+        indexes = [
+            models.Index(
+                fields=["user"],
+                condition=Q(date_end__isnull=True),
+                name="rbaca_session_active_idx",
+            ),
+            models.Index(fields=["date_end", "id"], name="rbaca_session_date_end_idx"),
+        ]
+
+    def add_active_roles(self, roles):
+        """
+        Add active roles to the session. The whole set is validated before it is added at once.
+
+        Args:
+            roles (Union[Role, List[Role]]): The active roles to be added.
+        Raises:
+            ValueError: If roles are not instances of role, are not held by the user or are
+                incompatible with each other or with the active roles.
+        """
+        roles = _as_roles(roles)
+        Session.manage.validate_active_roles(
+            self.user_id,
+            [role.id for role in roles],
+            self.active_roles.values_list("id", flat=True),
+        )
+        self.active_roles.add(*roles)
+
+    def drop_active_roles(self, roles):
+        """
+        Drop active roles from the session.
+
+        Args:
+            roles (Union[Role, List[Role]]): The active roles to be removed.
+        """
+        if not is_iterable(roles):
+            roles = {roles}
+
+        self.active_roles.remove(*roles)
+
+    def sync_active_role_ids(self):
+        """
+        Copy the ids of the active roles to `active_role_ids` and increment `active_roles_version`.
+        Called whenever the active roles change if `USE_SESSION_ROLE_IDS` is enabled.
+        """
+        self.active_role_ids = sorted(self.active_roles.values_list("id", flat=True))
+        Session.objects.filter(pk=self.pk).update(
+            active_role_ids=self.active_role_ids,
+            active_roles_version=models.F("active_roles_version") + 1,
+        )
+        self.active_roles_version += 1
+
+    def session_roles(self):
+        """
+        Get the roles associated with the session.
+
+        Returns:
+            QuerySet[Role]: QuerySet of roles for the session.
+        """
+
+        return self.active_roles.all()
+
+    def session_perms(self):
+        """
+        Get the permissions associated with the session.
+
+        Returns:
+            QuerySet[Permission]: QuerySet of permissions for the session.
+        """
+        session_roles_field = Session._meta.get_field("active_roles")
+        session_roles_query = "role__%s" % session_roles_field.related_query_name()
+        return Permission.objects.filter(**{session_roles_query: self})
+
+    def close(self):
+        """
+        Close the session by setting the end date and time.
+        """
+        self.date_end = now()
+        self.save(update_fields=["date_end"])
+
+    def __str__(self) -> str:
+        """
+        Return a string representation of the session.
+
+        Returns:
+            str: A string containing user, start date, and end date.
+        """
+        return str(self.user) + " " + str(self.date_start) + "-" + str(self.date_end)
+
+
+class SessionArchiveManager(models.Manager):
+    """
+    Custom manager for the SessionArchive model. Provides methods for archiving closed sessions.
+    """
+
+    def archive_sessions(self, before, chunk_size=1000, delete_only=False):
+        """
+        Move one chunk of sessions closed before the given time, together with their role links,
+        into the archive within a single transaction.
+
+        Args:
+            before (datetime): Sessions closed before this time are archived.
+            chunk_size (int, optional): The maximum number of sessions to archive.
+            delete_only (bool, optional): Delete the sessions without archiving them.
+
+        Returns:
+            int: The number of archived sessions, 0 if no closed sessions are left.
+        """
+        with transaction.atomic():
+            sessions = list(
+                Session.objects.filter(date_end__lt=before)
+                .order_by("date_end", "id")
+                .values_list("id", "user_id", "date_start", "date_end")[:chunk_size]
+            )
+
+            if not sessions:
+                return 0
+
+            session_ids = [session[0] for session in sessions]
+            session_roles = Session.active_roles.through.objects.filter(
+                session_id__in=session_ids
+            )
+
+            if not delete_only:
+                role_names = {}
+
+                for session_id, name in session_roles.values_list(
+                    "session_id", "role__name"
+                ):
+                    role_names.setdefault(session_id, []).append(name)
+
+                self.bulk_create(
+                    [
+                        self.model(
+                            session_id=session_id,
+                            user_id=user_id,
+                            date_start=date_start,
+                            date_end=date_end,
+                            roles=sorted(role_names.get(session_id, [])),
+                        )
+                        for session_id, user_id, date_start, date_end in sessions
+                    ]
+                )
+
+            session_roles.delete()
+            Session.objects.filter(id__in=session_ids).delete()
+        return len(sessions)
+
+
+class SessionArchive(models.Model):
+    """
+    Model representing a closed session moved out of the Session table.
+
+    Fields:
+        session_id (int): The id of the archived session.
+        user (User): The user associated with the session.
+        date_start (DateTimeField): The start date and time of the session.
+        date_end (DateTimeField): The end date and time of the session.
+        roles (JSONField): The names of the active roles of the session.
+    """
+
+    session_id = models.PositiveBigIntegerField()
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=False, blank=False, on_delete=models.CASCADE
+    )
+    date_start = models.DateTimeField()
+    date_end = models.DateTimeField()
+    roles = models.JSONField(default=list)
+
+    objects = models.Manager()
+    manage = SessionArchiveManager()
+
+    class Meta:
+        verbose_name = _("Session archive")
+        verbose_name_plural = _("Session archives")
+
+
+class AccessDecision(models.Model):
+    """
+    Model representing a logged authorization decision. The rows are written in batches by
+    the decision log if `USE_DECISION_LOG` is enabled.
+
+    Fields:
+        user (User): The user the decision was made for, None if unknown or deleted.
+        kind (str): The kind of check, a permission, role or node access check.
+        target (str): The checked permission, role or node.
+        granted (bool): Whether access was granted.
+        date (DateTimeField): The date and time of the decision.
+    """
+
+    PERMISSION = "perm"
+    ROLE = "role"
+    NODE = "node"
+    KIND_CHOICES = [
+        (PERMISSION, _("Permission")),
+        (ROLE, _("Role")),
+        (NODE, _("Node")),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL
+    )
+    kind = models.CharField(max_length=4, choices=KIND_CHOICES)
+    target = models.CharField(max_length=255)
+    granted = models.BooleanField()
+    date = models.DateTimeField(default=now)
+
+    objects = models.Manager()
+
+    class Meta:
+        verbose_name = _("Access decision")
+        verbose_name_plural = _("Access decisions")
+        indexes = [
+            models.Index(fields=["date"], name="rbaca_decision_date_idx"),
+        ]
+
+
+class AuditEntryManager(models.Manager):
+    """
+    Custom manager for the AuditEntry model. Provides methods for pruning the audit trail.
+    """
+
+    def delete_before(self, before, chunk_size=1000):
+        """
+        Delete one chunk of the audit entries written before the given time.
+
+        Args:
+            before (datetime): Entries written before this time are deleted.
+            chunk_size (int, optional): The maximum number of entries to delete.
+
+        Returns:
+            int: The number of deleted entries, 0 if no old entries are left.
+        """
+        entry_ids = list(
+            self.filter(date__lt=before)
+            .order_by("date", "id")
+            .values_list("id", flat=True)[:chunk_size]
+        )
+
+        if entry_ids:
+            self.filter(id__in=entry_ids).delete()
+        return len(entry_ids)
+
+
+class AuditEntry(models.Model):
+    """
+    Model representing a change made through the role administration. The rows are written in
+    batches by the audit trail if `USE_AUDIT_TRAIL` is enabled.
+
+    Fields:
+        actor (User): The user who made the change, None if unknown or deleted.
+        action (str): The kind of change, see `ACTION_CHOICES`.
+        target_id (str): The primary key of the changed role or user.
+        target_name (str): The name of the changed role or user at the time of the change.
+        roles_before (JSONField): The sorted ids of the roles of the user before the change.
+        roles_after (JSONField): The sorted ids of the roles of the user after the change.
+        permissions_before (JSONField): The sorted ids of the permissions of the role before
+            the change.
+        permissions_after (JSONField): The sorted ids of the permissions of the role after
+            the change.
+        date (DateTimeField): The date and time of the change.
+    """
+
+    CREATE_ROLE = "create_role"
+    UPDATE_ROLE = "update_role"
+    DELETE_ROLE = "delete_role"
+    ASSIGN_ROLES = "assign_roles"
+    DEASSIGN_ROLES = "deassign_roles"
+    UPDATE_ROLES = "update_roles"
+    ACTION_CHOICES = [
+        (CREATE_ROLE, _("Create role")),
+        (UPDATE_ROLE, _("Update role")),
+        (DELETE_ROLE, _("Delete role")),
+        (ASSIGN_ROLES, _("Assign roles")),
+        (DEASSIGN_ROLES, _("Deassign roles")),
+        (UPDATE_ROLES, _("Update roles")),
+    ]
+
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    action = models.CharField(max_length=16, choices=ACTION_CHOICES)
+    target_id = models.CharField(max_length=64)
+    target_name = models.CharField(max_length=255)
+    roles_before = models.JSONField(null=True, blank=True)
+    roles_after = models.JSONField(null=True, blank=True)
+    permissions_before = models.JSONField(null=True, blank=True)
+    permissions_after = models.JSONField(null=True, blank=True)
+    date = models.DateTimeField(default=now)
+
+    objects = models.Manager()
+    manage = AuditEntryManager()
+
+    class Meta:
+        verbose_name = _("Audit entry")
+        verbose_name_plural = _("Audit entries")
+        indexes = [
+            models.Index(fields=["date"], name="rbaca_audit_date_idx"),
+            models.Index(fields=["target_id"], name="rbaca_audit_target_idx"),
+        ]
+
+
+class RoleExpirationManager(models.Manager):
+    """
+    Custom manager for the RoleExpiration model. Provides methods for managing role expirations.
+    """
+
+    chunk_size = 1000
+    delete_batch_size = 100
+
+    def add_role_expiration(self, user, role, expiration_date):
+        """
+        Create and add a new role expiration to the database.
+        An existing expiration of the role for the user is replaced.
+
+        Args:
+            user (User): The user associated with the role expiration.
+            role (Union[Role, str]): The role or role name to be expired.
+            expiration_date (date): The date of role expiration.
+
+        Returns:
+            RoleExpiration: The role expiration object created and added.
+        """
+        if isinstance(role, str):
+            role = Role.objects.filter(name=role).first()
+
+        role_expiration, _ = self.update_or_create(
+            user=user, role=role, defaults={"expiration_date": expiration_date}
+        )
+
+        return role_expiration
+
+    def get_expired_roles(self):
+        """
+        Get expired role expirations.
+
+        Returns:
+            QuerySet[RoleExpiration]: QuerySet of expired role expirations.
+        """
+        expired_roles = self.filter(expiration_date__lt=now())
+        return expired_roles
+
+    def remove_expired_roles(self, chunk_size=None):
+        """
+        Remove expired roles, and all of their senior roles, from users.
+        The expirations are processed in chunks, each of which is removed with a few bulk
+        deletes inside its own transaction.
+
+        Args:
+            chunk_size (int, optional): The number of expirations processed per transaction.
+
+        Returns:
+            int: The number of processed role expirations.
+        """
+        chunk_size = chunk_size or self.chunk_size
+        senior_roles = self.get_senior_role_map()
+        removed = 0
+
+        while True:
+            with transaction.atomic():
+                expirations = list(
+                    self.get_expired_roles()
+                    .order_by("expiration_date", "id")
+                    .values_list("id", "user_id", "role_id")[:chunk_size]
+                )
+
+                if not expirations:
+                    return removed
+
+                self.remove_role_expirations(expirations, senior_roles)
+            removed += len(expirations)
+
+    @staticmethod
+    def get_senior_role_map():
+        """
+        Load the senior role of every role with a single query.
+
+        Returns:
+            Dict[int, int]: A mapping from role id to the id of its senior role.
+        """
+        return dict(
+            Role.objects.filter(senior_role__isnull=False).values_list(
+                "id", "senior_role_id"
+            )
+        )
+
+    def remove_role_expirations(self, expirations, senior_roles=None):
+        """
+        Deassign the roles of the given expirations, and all of their senior roles, from their
+        users and delete the expirations. Users losing the same roles are deassigned together,
+        with at most `delete_batch_size` such groups per delete, so the statements stay within
+        the expression limits of the database. Caches are invalidated once per affected user.
+
+        Args:
+            expirations (Iterable[Tuple[int, int, int]]): (expiration id, user id, role id) tuples.
+            senior_roles (Dict[int, int], optional): The senior role map of all roles,
+                as returned by `get_senior_role_map`. Loaded if omitted.
+        """
+        if senior_roles is None:
+            senior_roles = self.get_senior_role_map()
+
+        expiration_ids = []
+        user_role_ids = {}
+
+        for expiration_id, user_id, role_id in expirations:
+            expiration_ids.append(expiration_id)
+            role_ids = user_role_ids.setdefault(user_id, set())
+
+            while role_id is not None and role_id not in role_ids:
+                role_ids.add(role_id)
+                role_id = senior_roles.get(role_id)
+
+        if not expiration_ids:
+            return
+
+        users_by_role_ids = {}
+
+        for user_id, role_ids in user_role_ids.items():
+            users_by_role_ids.setdefault(frozenset(role_ids), []).append(user_id)
+
+        through, user_field, role_field = _user_roles_through()
+        groups = list(users_by_role_ids.items())
+
+        with transaction.atomic():
+            for i in range(0, len(groups), self.delete_batch_size):
+                condition = Q()
+
+                for role_ids, user_ids in groups[i : i + self.delete_batch_size]:
+                    condition |= Q(
+                        **{
+                            "%s__in" % user_field: user_ids,
+                            "%s__in" % role_field: role_ids,
+                        }
+                    )
+                through.objects.filter(condition).delete()
+
+            for i in range(0, len(expiration_ids), self.chunk_size):
+                self.filter(id__in=expiration_ids[i : i + self.chunk_size]).delete()
+            _invalidate_user_roles([], list(user_role_ids))
+
+
+class RoleExpiration(models.Model):
+    """
+    Model representing role expirations in the system.
+
+    Fields:
+        expiration_date (date): The date of role expiration.
+        user (User): The user associated with the role expiration.
+        role (Role): The role to be expired.
+        uuid(uuid): The uuid of the role expiration.
+    """
+
+    uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+
+    expiration_date = models.DateField(null=False, blank=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=False, blank=False, on_delete=models.CASCADE
+    )
+    role = models.ForeignKey(Role, null=False, blank=False, on_delete=models.CASCADE)
+
+    objects = models.Manager()
+    manage = RoleExpirationManager()
+
+    class Meta:
+        verbose_name = _("Role expiration")
+        verbose_name_plural = _("Role expirations")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "role"], name="rbaca_unique_role_expiration"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["expiration_date", "id"],
+                name="rbaca_roleexpiration_date_idx",
+            ),
+        ]
+
+
+class RoleValidityManager(models.Manager):
+    """
+    Custom manager for the RoleValidity model. Provides methods for managing the validity
+    windows of role assignments.
+    """
+
+    def set_validity(self, user, role, valid_from=None, valid_until=None):
+        """
+        Set the validity window of a role assignment, replacing a previous window.
+
+        Args:
+            user (User): The user the role is assigned to.
+            role (Union[Role, str]): The role or role name.
+            valid_from (datetime, optional): The time the assignment becomes valid.
+            valid_until (datetime, optional): The time the assignment stops being valid.
+
+        Returns:
+            RoleValidity: The validity window.
+        """
+        if isinstance(role, str):
+            role = Role.objects.filter(name=role).first()
+
+        role_validity, _ = self.update_or_create(
+            user=user,
+            role=role,
+            defaults={"valid_from": valid_from, "valid_until": valid_until},
+        )
+        return role_validity
+
+    def get_invalid(self, at=None):
+        """
+        Get the validity windows that do not contain the given time.
+
+        Args:
+            at (datetime, optional): The time to check. Defaults to now.
+
+        Returns:
+            QuerySet[RoleValidity]: The validity windows not containing the time.
+        """
+        at = at or now()
+        return self.filter(Q(valid_from__gt=at) | Q(valid_until__lte=at))
+
+    def get_invalid_role_ids(self, user, at=None):
+        """
+        Get the ids of the roles of a user whose assignment is not valid at the given time.
+
+        Args:
+            user (User): The user to check.
+            at (datetime, optional): The time to check. Defaults to now.
 
-        return session
+        Returns:
+            QuerySet: The ids of the roles, usable as a subquery.
+        """
+        return self.get_invalid(at).filter(user=user).values("role_id")
 
-    def delete_session(self, session):
+    def get_next_boundary(self, user, at=None):
         """
-        Delete a session from the database.
+        Get the next time at which one of the role assignments of a user becomes valid or invalid.
 
         Args:
-            session (Session): The session to delete.
+            user (User): The user to check.
+            at (datetime, optional): The time to start from. Defaults to now.
+
+        Returns:
+            Union[datetime, None]: The next boundary, or None if there is none.
         """
-        session.delete()
+        at = at or now()
+        boundaries = self.filter(user=user).aggregate(
+            valid_from=models.Min("valid_from", filter=Q(valid_from__gt=at)),
+            valid_until=models.Min("valid_until", filter=Q(valid_until__gt=at)),
+        )
+        boundaries = [value for value in boundaries.values() if value is not None]
+        return min(boundaries) if boundaries else None
 
 
-class Session(models.Model):
+class RoleValidity(models.Model):
     """
-    Model representing user sessions in the system.
+    Model representing the validity window of a role assignment. The assignment only confers
+    its role between `valid_from` and `valid_until` if `USE_ROLE_VALIDITY` is enabled,
+    so it expires instantly without being removed.
 
     Fields:
-        user (User): The user associated with the session.
-        active_roles (ManyToManyField): Active roles for the session.
-        date_start (DateTimeField): The start date and time of the session.
-        date_end (DateTimeField): The end date and time of the session.
+        user (User): The user the role is assigned to.
+        role (Role): The assigned role.
+        valid_from (datetime): The time the assignment becomes valid, None for no lower bound.
+        valid_until (datetime): The time the assignment stops being valid, None for no upper bound.
     """
 
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL, null=False, blank=False, on_delete=models.CASCADE
     )
-    active_roles = models.ManyToManyField(Role, blank=False)
-    date_start = models.DateTimeField(auto_now_add=True)
-    date_end = models.DateTimeField(null=True, blank=True)
+    role = models.ForeignKey(Role, null=False, blank=False, on_delete=models.CASCADE)
+    valid_from = models.DateTimeField(null=True, blank=True)
+    valid_until = models.DateTimeField(null=True, blank=True)
 
     objects = models.Manager()
-    manage = SessionManager()
+    manage = RoleValidityManager()
 
     class Meta:
-        verbose_name = _("Session")
-        verbose_name_plural = _("Sessions")
+        verbose_name = _("Role validity")
+        verbose_name_plural = _("Role validities")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "role"], name="rbaca_unique_role_validity"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "valid_until"], name="rbaca_rolevalidity_until_idx"
+            ),
+        ]
 
-    def add_active_roles(self, roles):
+
+class EffectivePermissionManager(models.Manager):
+    """
+    Custom manager for the EffectivePermission model. Provides methods for keeping the
+    materialized user permissions in sync with the role assignments.
+    """
+
+    chunk_size = 500
+
+    def get_expected_permissions(self, user_ids):
         """
-        Add active roles to the session.
+        Compute the permissions the given users should own based on their roles.
 
         Args:
-            roles (Union[Role, List[Role]]): The active roles to be added.
-        Raises:
-            ValueError: If roles are not instances of role.
+            user_ids (Iterable[int]): The ids of the users to compute the permissions for.
+
+        Returns:
+            Set[Tuple[int, int]]: A set of (user id, permission id) pairs.
         """
-        if isinstance(roles, str):
-            raise ValueError("roles must be instance of Role.")
+        through, user_field, role_field = _user_roles_through()
+        assignments = list(
+            through.objects.filter(**{"%s__in" % user_field: user_ids}).values_list(
+                user_field, role_field
+            )
+        )
+        role_ids = {role_id for _, role_id in assignments}
 
-        if not is_iterable(roles):
-            roles = {roles}
+        if _use_role_inheritance():
+            closure = Role.manage.get_junior_closure(role_ids)
+        else:
+            closure = {role_id: {role_id} for role_id in role_ids}
 
-        self.active_roles.add(*roles)
-        self.save()
+        role_perms = {}
 
-    def drop_active_roles(self, roles):
+        for role_id, perm_id in Role.permissions.through.objects.filter(
+            role_id__in=set().union(*closure.values())
+        ).values_list("role_id", "permission_id"):
+            role_perms.setdefault(role_id, set()).add(perm_id)
+
+        return {
+            (user_id, perm_id)
+            for user_id, role_id in assignments
+            for junior_id in closure[role_id]
+            for perm_id in role_perms.get(junior_id, ())
+        }
+
+    def refresh_users(self, user_ids, dry_run=False):
         """
-        Drop active roles from the session.
+        Bring the materialized permissions of the given users up to date.
+
+        Within a change set, the refresh is deferred until the change set completes.
 
         Args:
-            roles (Union[Role, List[Role]]): The active roles to be removed.
-        """
-        if not is_iterable(roles):
-            roles = {roles}
+            user_ids (Iterable[int]): The ids of the users to refresh.
+            dry_run (bool): If True, only compute the differences without writing them.
 
-        self.active_roles.remove(*roles)
-        self.save()
+        Returns:
+            Tuple[int, int]: The number of added and removed rows, (0, 0) if deferred.
+        """
+        pending = get_pending_invalidations()
+
+        if pending is not None and not dry_run:
+            pending.user_ids.update(user_ids)
+            return 0, 0
+
+        user_ids = list(set(user_ids))
+        added = removed = 0
+
+        for i in range(0, len(user_ids), self.chunk_size):
+            chunk = user_ids[i : i + self.chunk_size]
+            expected = self.get_expected_permissions(chunk)
+            current = {
+                (user_id, perm_id): row_id
+                for row_id, user_id, perm_id in self.filter(
+                    user_id__in=chunk
+                ).values_list("id", "user_id", "permission_id")
+            }
+            missing = expected - current.keys()
+            stale = sorted(current[key] for key in current.keys() - expected)
+            added += len(missing)
+            removed += len(stale)
+
+            if dry_run or not (missing or stale):
+                continue
+
+            with transaction.atomic():
+                for j in range(0, len(stale), self.chunk_size):
+                    self.filter(id__in=stale[j : j + self.chunk_size]).delete()
+                if missing:
+                    self.bulk_create(
+                        [
+                            self.model(user_id=user_id, permission_id=perm_id)
+                            for user_id, perm_id in missing
+                        ],
+                        ignore_conflicts=True,
+                    )
+        return added, removed
 
-    def session_roles(self):
+    def refresh_roles(self, role_ids):
         """
-        Get the roles associated with the session.
+        Bring the materialized permissions of all users holding the given roles up to date.
+        If `USE_ROLE_INHERITANCE` is enabled, the users holding a senior role are refreshed as well.
+        Within a change set, the refresh is deferred until the change set completes.
+
+        Args:
+            role_ids (Iterable[int]): The ids of the roles whose users should be refreshed.
 
         Returns:
-            QuerySet[Role]: QuerySet of roles for the session.
+            Tuple[int, int]: The number of added and removed rows, (0, 0) if deferred.
         """
+        pending = get_pending_invalidations()
 
-        return self.active_roles.all()
+        if pending is not None:
+            pending.role_ids.update(role_ids)
+            return 0, 0
 
-    def session_perms(self):
+        return self.refresh_users(self.get_role_user_ids(role_ids))
+
+    @staticmethod
+    def get_role_user_ids(role_ids):
         """
-        Get the permissions associated with the session.
+        Get the ids of all users whose permissions depend on the given roles.
+        If `USE_ROLE_INHERITANCE` is enabled, the users holding a senior role are included.
+
+        Args:
+            role_ids (Iterable[int]): The ids of the roles.
 
         Returns:
-            QuerySet[Permission]: QuerySet of permissions for the session.
+            Set[int]: The ids of the users.
         """
-        session_roles_field = Session._meta.get_field("active_roles")
-        session_roles_query = "role__%s" % session_roles_field.related_query_name()
-        return Permission.objects.filter(**{session_roles_query: self})
+        role_ids = set(role_ids)
 
-    def close(self):
-        """
-        Close the session by setting the end date and time.
-        """
-        self.date_end = now()
-        self.save()
+        if _use_role_inheritance():
+            role_ids = Role.manage.get_senior_role_ids(role_ids)
+        return _users_with_roles(role_ids)
 
-    def __str__(self) -> str:
-        """
-        Return a string representation of the session.
 
-        Returns:
-            str: A string containing user, start date, and end date.
-        """
-        return str(self.user) + " " + str(self.date_start) + "-" + str(self.date_end)
+class EffectivePermission(models.Model):
+    """
+    Model representing the materialized permissions a user owns through their roles.
+    The rows are maintained incrementally if `USE_EFFECTIVE_PERMISSIONS` is enabled.
 
+    Fields:
+        user (User): The user owning the permission.
+        permission (Permission): The permission owned by the user.
+    """
 
-class RoleExpirationManager(models.Manager):
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=False, blank=False, on_delete=models.CASCADE
+    )
+    permission = models.ForeignKey(
+        Permission, null=False, blank=False, on_delete=models.CASCADE
+    )
+
+    objects = models.Manager()
+    manage = EffectivePermissionManager()
+
+    class Meta:
+        verbose_name = _("Effective permission")
+        verbose_name_plural = _("Effective permissions")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "permission"], name="rbaca_unique_effective_permission"
+            ),
+        ]
+
+
+class CommandLockManager(models.Manager):
     """
-    Custom manager for the RoleExpiration model. Provides methods for managing role expirations.
+    Custom manager for the CommandLock model. Provides methods for acquiring and releasing locks.
     """
 
-    def add_role_expiration(self, user, role, expiration_date):
+    def acquire(self, name, timeout, owner=""):
         """
-        Create and add a new role expiration to the database.
+        Acquire the lock with the given name. A lock that was not refreshed before its
+        expiration is considered abandoned and taken over.
 
         Args:
-            user (User): The user associated with the role expiration.
-            role (Union[Role, str]): The role or role name to be expired.
-            expiration_date (date): The date of role expiration.
+            name (str): The name of the lock.
+            timeout (int): The number of seconds after which the lock expires.
+            owner (str, optional): A description of the process holding the lock.
 
         Returns:
-            RoleExpiration: The role expiration object created and added.
+            Union[CommandLock, None]: The acquired lock, or None if the lock is held by someone else.
         """
-        if isinstance(role, str):
-            role = Role.objects.filter(name=role).first()
-
-        role_expiration = self.create(
-            user=user, role=role, expiration_date=expiration_date
-        )
+        current_time = now()
 
-        return role_expiration
+        try:
+            with transaction.atomic():
+                self.filter(name=name, expires_at__lt=current_time).delete()
+                return self.create(
+                    name=name,
+                    owner=owner,
+                    acquired_at=current_time,
+                    expires_at=current_time + timedelta(seconds=timeout),
+                )
+        except IntegrityError:
+            return None
 
-    def get_expired_roles(self):
+    def refresh(self, lock, timeout):
         """
-        Get expired role expirations.
+        Extend the expiration of a held lock.
+
+        Args:
+            lock (CommandLock): The held lock.
+            timeout (int): The number of seconds from now after which the lock expires.
 
         Returns:
-            QuerySet[RoleExpiration]: QuerySet of expired role expirations.
+            bool: True if the lock is still held, otherwise False.
         """
-        expired_roles = self.filter(expiration_date__lt=now())
-        return expired_roles
+        lock.expires_at = now() + timedelta(seconds=timeout)
+        return bool(self.filter(pk=lock.pk).update(expires_at=lock.expires_at))
 
-    def remove_expired_roles(self):
-        """
-        Remove expired roles from users.
+    def release(self, lock):
         """
-        expired_roles = self.get_expired_roles()
+        Release a held lock.
 
-        for expired_role in expired_roles:
-            user = expired_role.user
-
-            user.deassign_roles(expired_role.role)
-            user.save()
-
-        expired_roles.delete()
+        Args:
+            lock (CommandLock): The held lock.
+        """
+        self.filter(pk=lock.pk).delete()
 
 
-class RoleExpiration(models.Model):
+class CommandLock(models.Model):
     """
-    Model representing role expirations in the system.
+    Model representing a lock held by a running management command, so periodic jobs
+    started by several schedulers do not run concurrently.
 
     Fields:
-        expiration_date (date): The date of role expiration.
-        user (User): The user associated with the role expiration.
-        role (Role): The role to be expired.
-        uuid(uuid): The uuid of the role expiration.
+        name (str): The unique name of the lock.
+        owner (str): A description of the process holding the lock.
+        acquired_at (datetime): The time the lock was acquired.
+        expires_at (datetime): The time after which the lock is considered abandoned.
     """
 
-    uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
-
-    expiration_date = models.DateField(null=False, blank=False)
-    user = models.ForeignKey(
-        settings.AUTH_USER_MODEL, null=False, blank=False, on_delete=models.CASCADE
-    )
-    role = models.ForeignKey(Role, null=False, blank=False, on_delete=models.CASCADE)
+    name = models.CharField(max_length=100, unique=True)
+    owner = models.CharField(max_length=255, blank=True)
+    acquired_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
 
     objects = models.Manager()
-    manage = RoleExpirationManager()
+    manage = CommandLockManager()
 
     class Meta:
-        verbose_name = _("Role expiration")
-        verbose_name_plural = _("Role expirations")
+        verbose_name = _("Command lock")
+        verbose_name_plural = _("Command locks")
 
 
 class RoleMixin(models.Model):
@@ -468,6 +1713,10 @@ class RoleMixin(models.Model):
         Raises:
             ValueError: If roles are not iterable or contain incompatible roles.
 
+        Note:
+            If `USE_ROLE_INHERITANCE` is enabled, the junior roles do not need to be assigned,
+            since a senior role confers the permissions of all of its junior roles.
+
         Example:
             custom_user.assign_roles([Role1, Role2])
         """
@@ -477,28 +1726,45 @@ class RoleMixin(models.Model):
         if not is_iterable(roles):
             roles = {roles}
 
-        user_roles = self.roles.all()
-        incompatible_roles = user_roles.values_list("incompatible_roles", flat=True)
-        junior_roles = Role.objects.filter(senior_role__in=roles)
-
-        for role in roles:
-            if role.id in incompatible_roles:
-                raise ValueError(
-                    "role '%s' is incompatible with '%s'"
-                    % (
-                        role.name,
-                        ", ".join(
-                            role.incompatible_roles.all().values_list("name", flat=True)
-                        ),
+        from rbaca.constraints import get_constraint_engine
+
+        user_role_ids = set(self.roles.values_list("id", flat=True))
+        role_ids = {role.id for role in roles}
+
+        if _use_role_inheritance():
+            closure = Role.manage.get_junior_closure(user_role_ids | role_ids)
+            held_role_ids = set().union(*(closure[i] for i in user_role_ids))
+            new_role_ids = set().union(*(closure[i] for i in role_ids))
+            missing_junior_role_ids = set()
+        else:
+            held_role_ids = user_role_ids
+            new_role_ids = role_ids
+            missing_junior_role_ids = (
+                set(
+                    Role.objects.filter(senior_role_id__in=role_ids).values_list(
+                        "id", flat=True
                     )
                 )
-        if not all(role in roles or role in user_roles for role in junior_roles):
+                - role_ids
+                - user_role_ids
+            )
+
+        _check_conflict_free(
+            get_constraint_engine(new_role_ids), new_role_ids, held_role_ids, self.pk
+        )
+
+        if missing_junior_role_ids:
             raise ValueError(
                 "user '%s' needs all junior roles before assigning." % (self.username)
             )
 
         self.roles.add(*roles)
-        self.save()
+        record_change(
+            AuditEntry.ASSIGN_ROLES,
+            self,
+            roles_before=user_role_ids,
+            roles_after=user_role_ids | role_ids,
+        )
 
     def deassign_roles(self, roles):
         """
@@ -522,8 +1788,20 @@ class RoleMixin(models.Model):
         for role in roles:
             roles_to_deassign.extend(_user_get_senior_role(role))
 
+        audited = _use_audit_trail()
+
+        if audited:
+            user_role_ids = set(self.roles.values_list("id", flat=True))
+
         self.roles.remove(*roles_to_deassign)
-        self.save()
+
+        if audited:
+            record_change(
+                AuditEntry.DEASSIGN_ROLES,
+                self,
+                roles_before=user_role_ids,
+                roles_after=user_role_ids - {role.id for role in roles_to_deassign},
+            )
 
     def assigned_roles(self):
         """
@@ -537,6 +1815,7 @@ class RoleMixin(models.Model):
         """
         return self.roles.all()
 
+    @instrumented("user.has_active_session", profiled=True)
     def has_active_session(self, session_id=None):
         """
         Check if the user has an active session.
@@ -552,9 +1831,12 @@ class RoleMixin(models.Model):
         """
         return self.get_active_session(session_id) is not None
 
+    @instrumented("session.get_active_session")
     def get_active_session(self, session_id=None):
         """
-        Get the active session of the user.
+        Get the active session of the user. Timed out sessions are not returned,
+        but are only closed by `Session.manage.close_timed_out_sessions`.
+        If `USE_SESSION_CACHE` is enabled, the active session is cached across requests.
 
         Args:
             session_id (int, optional): ID of the session to retrieve. Defaults to None.
@@ -568,25 +1850,39 @@ class RoleMixin(models.Model):
         if not hasattr(self, "_session_cache"):
             self._session_cache = {}
 
-        if session_id not in self._session_cache:
-            session_qs = Session.objects.filter(user=self, date_end__isnull=True)
+        hit = session_id in self._session_cache
+        record_cache("session", hit)
 
-            if session_id:
-                session_qs = session_qs.filter(id=session_id)
+        if not hit:
+            session = None
+            entry = None
 
-            session = session_qs.first()
+            if _use_session_cache() and not session_id:
+                entry = get_session_entry(self.pk)
+                record_cache("session_entry", entry is not None)
 
-            if session:
-                if session.date_start < now() - timedelta(
-                    seconds=settings.SESSION_TIMEOUT_ABSOLUTE
-                ):
-                    session.date_end = now()
-                    session.save()
-                    session = None
+            if entry is not None:
+                if entry["session_id"] is not None:
+                    session = Session.from_db(
+                        router.db_for_read(Session),
+                        ["id", "user_id", "date_start", "date_end"],
+                        [entry["session_id"], self.pk, entry["date_start"], None],
+                    )
+            else:
+                session_qs = Session.manage.get_active_sessions().filter(user=self)
+
+                if session_id:
+                    session_qs = session_qs.filter(id=session_id)
+
+                session = session_qs.first()
+
+                if _use_session_cache() and not session_id:
+                    _cache_session(self, session)
 
             self._session_cache[session_id] = session
         return self._session_cache[session_id]
 
+    @instrumented("user.has_role", profiled=True)
     def has_role(self, role):
         """
         Check if the user has a specific role.
@@ -633,6 +1929,7 @@ class RoleMixin(models.Model):
         """
         return _user_get_permissions(self, obj, "all")
 
+    @instrumented("user.has_perm", profiled=True)
     def has_perm(self, perm, obj=None):
         """
         Check if the user has a specific permission.
@@ -689,6 +1986,190 @@ class RoleMixin(models.Model):
         return _user_has_module_perms(self, app_label)
 
 
+def _check_conflict_free(engine, role_ids, held_role_ids, user_id):
+    """
+    Check that roles to assign are compatible with each other and with the roles a user holds.
+
+    Args:
+        engine (ConstraintEngine): The engine loaded for the roles to assign.
+        role_ids (Set[int]): The ids of the roles to assign.
+        held_role_ids (Set[int]): The ids of the roles the user holds after the assignment.
+        user_id (int): The id of the user.
+
+    Raises:
+        ValueError: If roles are incompatible, naming the first incompatible pair.
+    """
+    if engine.is_conflict_free(role_ids, held_role_ids):
+        return
+
+    role_id, other_id = next(
+        pair if pair[0] in role_ids else pair[::-1]
+        for pair in engine.get_conflicts(role_ids, held_role_ids)
+    )
+    names = dict(
+        Role.objects.filter(id__in=[role_id, other_id]).values_list("id", "name")
+    )
+    raise ValueError(
+        "role '%s' is incompatible with '%s' for user with id '%s'."
+        % (names[role_id], names[other_id], user_id)
+    )
+
+
+def _use_role_inheritance():
+    """
+    Check if senior roles implicitly confer their junior roles.
+
+    Returns:
+        bool: True if `USE_ROLE_INHERITANCE` is enabled, otherwise False.
+    """
+    return getattr(settings, "USE_ROLE_INHERITANCE", False)
+
+
+def _use_session_role_ids():
+    """
+    Check if session permissions are resolved from the denormalized role ids of the session.
+
+    Returns:
+        bool: True if `USE_SESSION_ROLE_IDS` is enabled, otherwise False.
+    """
+    return getattr(settings, "USE_SESSION_ROLE_IDS", False)
+
+
+def _use_session_cache():
+    """
+    Check if the active session of a user is cached across requests.
+
+    The session is only cached if the cache is shared between processes, since a process
+    drops the cached session only from its own cache when the session changes.
+
+    Returns:
+        bool: True if `USE_SESSION_CACHE` is enabled and the cache is shared, otherwise False.
+    """
+    if not getattr(settings, "USE_SESSION_CACHE", False):
+        return False
+    return is_shared_cache()
+
+
+def _cache_session(user, session, **values):
+    """
+    Cache the active session of a user, or values derived from it, until the session times out.
+
+    Args:
+        user (User): The user owning the session.
+        session (Union[Session, None]): The active session, None if the user has none.
+        **values: Values derived from the session to cache along with it.
+    """
+    current_time = now()
+
+    if session is None:
+        expires_at = current_time + timedelta(seconds=settings.SESSION_TIMEOUT_ABSOLUTE)
+        values.update(session_id=None, date_start=None)
+    else:
+        expires_at = session.date_start + timedelta(
+            seconds=settings.SESSION_TIMEOUT_ABSOLUTE
+        )
+        values.update(session_id=session.pk, date_start=session.date_start)
+
+    set_session_entry(user.pk, values, expires_at)
+
+
+def _use_role_validity():
+    """
+    Check if role assignments are restricted to their validity windows.
+
+    Returns:
+        bool: True if `USE_ROLE_VALIDITY` is enabled, otherwise False.
+    """
+    return getattr(settings, "USE_ROLE_VALIDITY", False)
+
+
+def _as_roles(roles):
+    """
+    Normalize a role or an iterable of roles to a list of roles.
+
+    Args:
+        roles (Union[Role, List[Role]]): The role(s) to normalize.
+
+    Returns:
+        List[Role]: The roles.
+
+    Raises:
+        ValueError: If roles are a string.
+    """
+    if isinstance(roles, str):
+        raise ValueError("roles must be (iterable) instance(s) of Role.")
+
+    if not is_iterable(roles):
+        roles = {roles}
+
+    return list(roles)
+
+
+def _as_users(users):
+    """
+    Normalize a queryset or an iterable of users to the user instances and their ids.
+    Querysets are not evaluated.
+
+    Args:
+        users (Union[QuerySet[User], List[User]]): The users to normalize.
+
+    Returns:
+        Tuple[List[User], List[int]]: The user instances and the user ids.
+    """
+    if isinstance(users, models.QuerySet):
+        return [], list(users.values_list("pk", flat=True))
+
+    users = list(users)
+    return users, [user.pk for user in users]
+
+
+def _invalidate_user_roles(users, user_ids):
+    """
+    Invalidate everything derived from the role assignments of the given users at once.
+
+    Args:
+        users (List[User]): The user instances whose caches are dropped.
+        user_ids (List[int]): The ids of the users whose role assignments changed.
+    """
+    if getattr(settings, "USE_EFFECTIVE_PERMISSIONS", False):
+        EffectivePermission.manage.refresh_users(user_ids)
+
+    invalidate_users(users)
+
+
+def _user_roles_through():
+    """
+    Get the through model of the user roles relation and the names of its fields.
+
+    Returns:
+        Tuple[Model, str, str]: The through model, the user field name and the role field name.
+    """
+    user_roles_field = get_user_model()._meta.get_field("roles")
+    return (
+        user_roles_field.remote_field.through,
+        user_roles_field.m2m_field_name(),
+        user_roles_field.m2m_reverse_field_name(),
+    )
+
+
+def _users_with_roles(role_ids):
+    """
+    Get the ids of all users holding at least one of the given roles.
+
+    Args:
+        role_ids (Iterable[int]): The ids of the roles.
+
+    Returns:
+        Set[int]: The ids of the users holding the roles.
+    """
+    through, user_field, role_field = _user_roles_through()
+    return set(
+        through.objects.filter(**{"%s__in" % role_field: role_ids}).values_list(
+            user_field, flat=True
+        )
+    )
+
+
 def _user_get_senior_role(role):
     """
     Recursively retrieve the senior role of a given role.
@@ -721,16 +2202,20 @@ def _user_has_role(user, role):
     Returns:
         bool: True if the user has the specified role, otherwise False.
     """
+    granted = False
+
     for backend in auth.get_backends():
         if not hasattr(backend, "has_role"):
             continue
         try:
             if backend.has_role(user, role):
-                return True
+                granted = True
+                break
         except PermissionDenied:
-            return False
+            break
 
-    return False
+    log_decision(AccessDecision.ROLE, user.pk, role, granted)
+    return granted
 
 
 def _user_get_permissions(user, obj, from_name):
@@ -767,16 +2252,20 @@ def _user_has_perm(user, perm, obj):
     Returns:
         bool: True if the user has the specified permission, otherwise False.
     """
+    granted = False
+
     for backend in auth.get_backends():
         if not hasattr(backend, "has_perm"):
             continue
         try:
             if backend.has_perm(user, perm, obj):
-                return True
+                granted = True
+                break
         except PermissionDenied:
-            return False
+            break
 
-    return False
+    log_decision(AccessDecision.PERMISSION, user.pk, perm, granted)
+    return granted
 
 
 def _user_has_module_perms(user, app_label):
@@ -0,0 +1,463 @@
+import json
+
+from django.conf import settings
+from django.contrib.auth.models import Permission
+
+from rbaca.cache import get_pending_invalidations
+from rbaca.changesets import changeset
+from rbaca.management.utils import chunked
+from rbaca.models import Role
+
+BATCH_SIZE = 500
+
+
+class PolicyError(ValueError):
+    """
+    Raised if a policy document is malformed or violates a role constraint.
+    """
+
+
+def read_policy(path):
+    """
+    Read a policy document from a JSON or YAML file. YAML requires PyYAML.
+
+    Args:
+        path (str): The path of the file. Files ending in .yaml or .yml are read as YAML.
+
+    Returns:
+        dict: The policy document.
+
+    Raises:
+        PolicyError: If the file can not be parsed.
+    """
+    with open(path, encoding="utf-8") as file:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise PolicyError("PyYAML is required to read YAML policies.")
+            try:
+                return yaml.safe_load(file)
+            except yaml.YAMLError as error:
+                raise PolicyError("invalid YAML policy: %s" % error)
+        try:
+            return json.load(file)
+        except ValueError as error:
+            raise PolicyError("invalid JSON policy: %s" % error)
+
+
+def parse_policy(document):
+    """
+    Convert a policy document into the state compared by `PolicyDiff`.
+
+    A policy document has the form::
+
+        {
+            "roles": [
+                {
+                    "name": "editor",
+                    "permissions": ["app_label.codename"],
+                    "senior_role": "chief_editor",
+                    "incompatible_roles": ["auditor"]
+                }
+            ],
+            "node_access": {"node": ["editor"]}
+        }
+
+    Args:
+        document (dict): The policy document.
+
+    Incompatibilities are symmetric, and a junior role inherits the incompatible roles of its
+    senior role like with `Role.set_senior_role`, so the state matches the same policy built
+    through the model methods.
+
+    Returns:
+        dict: The roles, keyed by name, with their `permissions`, `senior_role` and
+        `incompatible_roles`, and the `node_access` mapping or None.
+
+    Raises:
+        PolicyError: If the document is malformed or the hierarchy is inconsistent.
+    """
+    if not isinstance(document, dict) or not isinstance(
+        document.get("roles", []), list
+    ):
+        raise PolicyError("a policy must be an object with a list of roles.")
+
+    roles = {}
+
+    for entry in document.get("roles", []):
+        if not isinstance(entry, dict) or not entry.get("name"):
+            raise PolicyError("every role needs a name.")
+        if entry["name"] in roles:
+            raise PolicyError("role '%s' is defined twice." % entry["name"])
+
+        for perm in entry.get("permissions", []):
+            if not isinstance(perm, str) or perm.count(".") != 1:
+                raise PolicyError(
+                    "permission '%s' is not in the form app_label.codename." % perm
+                )
+
+        roles[entry["name"]] = {
+            "permissions": set(entry.get("permissions", [])),
+            "senior_role": entry.get("senior_role"),
+            "incompatible_roles": set(entry.get("incompatible_roles", [])),
+        }
+
+    for name, role in roles.items():
+        for other in role["incompatible_roles"]:
+            if other not in roles:
+                raise PolicyError(
+                    "role '%s' is incompatible with unknown role '%s'." % (name, other)
+                )
+            roles[other]["incompatible_roles"].add(name)
+
+    depths = {}
+
+    for name, role in roles.items():
+        senior_role, seen = role["senior_role"], {name}
+
+        if senior_role is not None and senior_role not in roles:
+            raise PolicyError(
+                "role '%s' has unknown senior role '%s'." % (name, senior_role)
+            )
+
+        while senior_role is not None:
+            if senior_role in seen:
+                raise PolicyError("the hierarchy of role '%s' is cyclic." % name)
+            seen.add(senior_role)
+            senior_role = roles[senior_role]["senior_role"]
+        depths[name] = len(seen)
+
+    # Like `Role.set_senior_role`, a junior role inherits the incompatible roles of its
+    # senior role, so seniors are resolved before their juniors.
+    for name in sorted(roles, key=depths.get):
+        role = roles[name]
+
+        if role["senior_role"] is None:
+            continue
+
+        senior_role = roles[role["senior_role"]]
+
+        if name in senior_role["incompatible_roles"]:
+            raise PolicyError("an incompatible role can not be a senior role.")
+
+        for other in senior_role["incompatible_roles"] - role["incompatible_roles"]:
+            role["incompatible_roles"].add(other)
+            roles[other]["incompatible_roles"].add(name)
+
+    return {"roles": roles, "node_access": document.get("node_access")}
+
+
+def load_policy():
+    """
+    Load the current policy from the database with three queries.
+
+    Returns:
+        dict: The current state in the form returned by `parse_policy`, with the
+        `node_access` mapping taken from the `NODE_ACCESS` setting.
+    """
+    roles = {
+        name: {
+            "permissions": set(),
+            "senior_role": senior_role,
+            "incompatible_roles": set(),
+        }
+        for name, senior_role in Role.objects.values_list("name", "senior_role__name")
+    }
+
+    for name, app_label, codename in Role.permissions.through.objects.values_list(
+        "role__name", "permission__content_type__app_label", "permission__codename"
+    ):
+        roles[name]["permissions"].add("%s.%s" % (app_label, codename))
+
+    for name, other in Role.incompatible_roles.through.objects.values_list(
+        "from_role__name", "to_role__name"
+    ):
+        roles[name]["incompatible_roles"].add(other)
+        roles[other]["incompatible_roles"].add(name)
+
+    return {"roles": roles, "node_access": getattr(settings, "NODE_ACCESS", None)}
+
+
+def dump_policy(state):
+    """
+    Convert a policy state into a policy document with a stable order.
+
+    Args:
+        state (dict): The state, as returned by `load_policy` or `parse_policy`.
+
+    Returns:
+        dict: The policy document.
+    """
+    document = {
+        "roles": [
+            {
+                "name": name,
+                "permissions": sorted(role["permissions"]),
+                "senior_role": role["senior_role"],
+                "incompatible_roles": sorted(role["incompatible_roles"]),
+            }
+            for name, role in sorted(state["roles"].items())
+        ]
+    }
+
+    if state.get("node_access") is not None:
+        document["node_access"] = state["node_access"]
+    return document
+
+
+class PolicyDiff:
+    """
+    The changes needed to bring the current policy to the desired policy.
+
+    Attributes:
+        created_roles (List[str]): The names of the roles to create.
+        deleted_roles (List[str]): The names of the roles to delete.
+        granted (List[Tuple[str, str]]): The (role name, permission name) pairs to grant.
+        revoked (List[Tuple[str, str]]): The (role name, permission name) pairs to revoke.
+        senior_roles (List[Tuple[str, Union[str, None]]]): The (role name, senior role name)
+            pairs to set.
+        added_incompatibilities (List[Tuple[str, str]]): The role name pairs to make incompatible.
+        removed_incompatibilities (List[Tuple[str, str]]): The role name pairs to make compatible.
+        node_access_changed (bool): Whether the desired node mapping differs from `NODE_ACCESS`.
+    """
+
+    def __init__(self, current, desired, prune=False):
+        """
+        Compute the changes between two policy states.
+
+        Args:
+            current (dict): The current state, as returned by `load_policy`.
+            desired (dict): The desired state, as returned by `parse_policy`.
+            prune (bool): Decides if roles missing from the desired state are deleted.
+        """
+        current_roles, desired_roles = current["roles"], desired["roles"]
+
+        self.created_roles = sorted(set(desired_roles) - set(current_roles))
+        self.deleted_roles = (
+            sorted(set(current_roles) - set(desired_roles)) if prune else []
+        )
+        self.granted = []
+        self.revoked = []
+        self.senior_roles = []
+
+        empty = {"permissions": set(), "senior_role": None, "incompatible_roles": set()}
+        current_pairs = set()
+        desired_pairs = set()
+
+        for name, role in sorted(desired_roles.items()):
+            current_role = current_roles.get(name, empty)
+            self.granted.extend(
+                (name, perm)
+                for perm in sorted(role["permissions"] - current_role["permissions"])
+            )
+            self.revoked.extend(
+                (name, perm)
+                for perm in sorted(current_role["permissions"] - role["permissions"])
+            )
+            if role["senior_role"] != current_role["senior_role"]:
+                self.senior_roles.append((name, role["senior_role"]))
+
+        for roles, pairs in (
+            (current_roles, current_pairs),
+            (desired_roles, desired_pairs),
+        ):
+            for name, role in roles.items():
+                pairs.update(
+                    tuple(sorted((name, other))) for other in role["incompatible_roles"]
+                )
+
+        deleted = set(self.deleted_roles)
+        self.added_incompatibilities = sorted(desired_pairs - current_pairs)
+        self.removed_incompatibilities = sorted(
+            pair
+            for pair in current_pairs - desired_pairs
+            if pair[0] in desired_roles
+            and pair[1] in desired_roles
+            or deleted.intersection(pair)
+        )
+        self.node_access_changed = (
+            desired["node_access"] is not None
+            and desired["node_access"] != current["node_access"]
+        )
+
+    def __bool__(self):
+        return bool(
+            self.created_roles
+            or self.deleted_roles
+            or self.granted
+            or self.revoked
+            or self.senior_roles
+            or self.added_incompatibilities
+            or self.removed_incompatibilities
+            or self.node_access_changed
+        )
+
+    def describe(self):
+        """
+        Describe the changes, one per line.
+
+        Returns:
+            List[str]: The description of each change.
+        """
+        return (
+            ["+ role %s" % name for name in self.created_roles]
+            + ["- role %s" % name for name in self.deleted_roles]
+            + ["+ permission %s: %s" % pair for pair in self.granted]
+            + ["- permission %s: %s" % pair for pair in self.revoked]
+            + ["~ senior role %s: %s" % pair for pair in self.senior_roles]
+            + ["+ incompatible %s, %s" % pair for pair in self.added_incompatibilities]
+            + [
+                "- incompatible %s, %s" % pair
+                for pair in self.removed_incompatibilities
+            ]
+            + (
+                ["~ node access differs from NODE_ACCESS"]
+                if self.node_access_changed
+                else []
+            )
+        )
+
+
+def apply_policy_diff(diff):
+    """
+    Apply the changes of a policy diff with bulk writes in a single change set.
+    The node mapping lives in the `NODE_ACCESS` setting and is not written.
+
+    Args:
+        diff (PolicyDiff): The changes to apply.
+
+    Raises:
+        PolicyError: If a permission of the policy does not exist or a senior role is
+            incompatible with its junior role.
+    """
+    with changeset():
+        pending = get_pending_invalidations()
+        Role.objects.bulk_create(
+            [Role(name=name) for name in diff.created_roles], ignore_conflicts=True
+        )
+        role_ids = dict(Role.objects.values_list("name", "id"))
+        permission_ids = _get_permission_ids(perm for _, perm in diff.granted)
+        pending.policy = True
+
+        if diff.revoked:
+            revoked_ids = _find_permission_ids(perm for _, perm in diff.revoked)
+            revoked = {}
+
+            for name, perm in diff.revoked:
+                if perm in revoked_ids:
+                    revoked.setdefault(role_ids[name], []).append(revoked_ids[perm])
+
+            for role_id, perm_ids in revoked.items():
+                for batch in chunked(perm_ids, BATCH_SIZE):
+                    Role.permissions.through.objects.filter(
+                        role_id=role_id, permission_id__in=batch
+                    ).delete()
+
+        Role.permissions.through.objects.bulk_create(
+            [
+                Role.permissions.through(
+                    role_id=role_ids[name], permission_id=permission_ids[perm]
+                )
+                for name, perm in diff.granted
+            ],
+            ignore_conflicts=True,
+        )
+
+        incompatible = Role.incompatible_roles.through
+
+        if diff.removed_incompatibilities:
+            removed = {}
+
+            for name, other in diff.removed_incompatibilities:
+                if name in role_ids and other in role_ids:
+                    removed.setdefault(role_ids[name], []).append(role_ids[other])
+                    removed.setdefault(role_ids[other], []).append(role_ids[name])
+
+            for role_id, other_ids in removed.items():
+                for batch in chunked(other_ids, BATCH_SIZE):
+                    incompatible.objects.filter(
+                        from_role_id=role_id, to_role_id__in=batch
+                    ).delete()
+
+        incompatible.objects.bulk_create(
+            [
+                incompatible(from_role_id=role_ids[a], to_role_id=role_ids[b])
+                for name, other in diff.added_incompatibilities
+                for a, b in ((name, other), (other, name))
+            ],
+            ignore_conflicts=True,
+        )
+
+        if diff.senior_roles:
+            roles = Role.objects.in_bulk(
+                [role_ids[name] for name, _ in diff.senior_roles]
+                + [role_ids[name] for _, name in diff.senior_roles if name is not None]
+            )
+            try:
+                Role.manage.set_senior_roles(
+                    [
+                        (roles[role_ids[name]], roles.get(role_ids.get(senior_role)))
+                        for name, senior_role in diff.senior_roles
+                    ]
+                )
+            except ValueError as error:
+                raise PolicyError(str(error))
+
+        pending.role_ids.update(
+            role_ids[name]
+            for name, _ in diff.granted + diff.revoked + diff.senior_roles
+        )
+
+        if diff.deleted_roles:
+            Role.objects.filter(name__in=diff.deleted_roles).delete()
+
+
+def _get_permission_ids(perms):
+    """
+    Look up the ids of permissions by name.
+
+    Args:
+        perms (Iterable[str]): The permission names in the form app_label.codename.
+
+    Returns:
+        Dict[str, int]: The permission ids, keyed by name.
+
+    Raises:
+        PolicyError: If a permission does not exist.
+    """
+    perms = set(perms)
+    permission_ids = _find_permission_ids(perms)
+    missing = perms - set(permission_ids)
+
+    if missing:
+        raise PolicyError("unknown permissions: %s" % ", ".join(sorted(missing)))
+    return permission_ids
+
+
+def _find_permission_ids(perms):
+    """
+    Look up the ids of the existing permissions by name, with one query per app label and
+    batch of `BATCH_SIZE` codenames.
+
+    Args:
+        perms (Iterable[str]): The permission names in the form app_label.codename.
+
+    Returns:
+        Dict[str, int]: The ids of the existing permissions, keyed by name.
+    """
+    codenames = {}
+
+    for perm in set(perms):
+        app_label, codename = perm.split(".")
+        codenames.setdefault(app_label, []).append(codename)
+
+    permission_ids = {}
+
+    for app_label, app_codenames in codenames.items():
+        for batch in chunked(sorted(app_codenames), BATCH_SIZE):
+            for perm_id, codename in Permission.objects.filter(
+                content_type__app_label=app_label, codename__in=batch
+            ).values_list("id", "codename"):
+                permission_ids["%s.%s" % (app_label, codename)] = perm_id
+    return permission_ids
@@ -0,0 +1,226 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+
+from rbaca.cache import invalidate_session, policy_changed
+from rbaca.models import (
+    EffectivePermission,
+    Role,
+    Session,
+    _use_role_inheritance,
+    _use_session_cache,
+    _use_session_role_ids,
+    _users_with_roles,
+)
+
+
+def _use_effective_permissions():
+    """
+    Check if the materialized effective permissions are enabled.
+
+    Returns:
+        bool: True if `USE_EFFECTIVE_PERMISSIONS` is enabled, otherwise False.
+    """
+    return getattr(settings, "USE_EFFECTIVE_PERMISSIONS", False)
+
+
+def user_roles_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Refresh the effective permissions of the users whose role assignments changed.
+    """
+    if not _use_effective_permissions():
+        return
+
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            EffectivePermission.manage.refresh_users([instance.pk])
+    elif action == "pre_clear":
+        instance._rbaca_cleared_user_ids = _users_with_roles([instance.pk])
+    elif action == "post_clear":
+        EffectivePermission.manage.refresh_users(
+            instance.__dict__.pop("_rbaca_cleared_user_ids", ())
+        )
+    elif action in ("post_add", "post_remove"):
+        EffectivePermission.manage.refresh_users(pk_set)
+
+
+def role_permissions_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Refresh the effective permissions of the users holding a role whose permissions changed.
+    """
+    if action.startswith("post_"):
+        policy_changed()
+
+    if not _use_effective_permissions():
+        return
+
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            EffectivePermission.manage.refresh_roles([instance.pk])
+    elif action == "pre_clear":
+        instance._rbaca_cleared_role_ids = set(
+            Role.objects.filter(permissions=instance).values_list("id", flat=True)
+        )
+    elif action == "post_clear":
+        EffectivePermission.manage.refresh_roles(
+            instance.__dict__.pop("_rbaca_cleared_role_ids", ())
+        )
+    elif action in ("post_add", "post_remove"):
+        EffectivePermission.manage.refresh_roles(pk_set)
+
+
+def incompatible_roles_changed(sender, action, **kwargs):
+    """
+    Invalidate the cached policy when the incompatibilities of roles changed.
+    """
+    if action.startswith("post_"):
+        policy_changed()
+
+
+def role_pre_save(sender, instance, raw=False, **kwargs):
+    """
+    Remember the previous senior role of a role if the hierarchy confers permissions.
+    """
+    if raw or not instance.pk:
+        return
+
+    if _use_effective_permissions() and _use_role_inheritance():
+        instance._rbaca_previous_senior_role_id = (
+            Role.objects.filter(pk=instance.pk)
+            .values_list("senior_role_id", flat=True)
+            .first()
+        )
+
+
+def role_post_save(sender, instance, raw=False, **kwargs):
+    """
+    Invalidate the cached policy and refresh the effective permissions of the users holding
+    a senior role of a role whose position in the hierarchy changed.
+    """
+    policy_changed()
+
+    if "_rbaca_previous_senior_role_id" not in instance.__dict__:
+        return
+
+    previous_senior_role_id = instance.__dict__.pop("_rbaca_previous_senior_role_id")
+
+    if previous_senior_role_id != instance.senior_role_id:
+        EffectivePermission.manage.refresh_roles(
+            role_id
+            for role_id in (previous_senior_role_id, instance.senior_role_id)
+            if role_id is not None
+        )
+
+
+def role_pre_delete(sender, instance, **kwargs):
+    """
+    Remember the users holding a role, or one of its senior roles if the hierarchy confers
+    permissions, before it is deleted.
+    """
+    if _use_effective_permissions():
+        role_ids = {instance.pk}
+
+        if _use_role_inheritance():
+            role_ids.update(
+                instance.get_all_senior_roles().values_list("id", flat=True)
+            )
+        instance._rbaca_deleted_user_ids = _users_with_roles(role_ids)
+
+
+def role_post_delete(sender, instance, **kwargs):
+    """
+    Invalidate the cached policy and refresh the effective permissions of the users
+    that held a deleted role.
+    """
+    policy_changed()
+
+    if _use_effective_permissions():
+        EffectivePermission.manage.refresh_users(
+            instance.__dict__.pop("_rbaca_deleted_user_ids", ())
+        )
+
+
+def session_changed(sender, instance, **kwargs):
+    """
+    Drop the cached active session of the user whose session was created, changed or deleted.
+    """
+    if _use_session_cache():
+        invalidate_session(instance.user_id)
+
+
+def session_roles_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Keep the denormalized role ids of the sessions whose roles changed in sync, if
+    `USE_SESSION_ROLE_IDS` is enabled, and drop the cached active session of their users.
+    """
+    if not (_use_session_role_ids() or _use_session_cache()):
+        return
+
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            if _use_session_role_ids():
+                instance.sync_active_role_ids()
+
+            if _use_session_cache():
+                invalidate_session(instance.user_id)
+        return
+
+    if action == "pre_clear":
+        instance._rbaca_cleared_session_ids = set(
+            Session.objects.filter(active_roles=instance).values_list("id", flat=True)
+        )
+        return
+
+    if action == "post_clear":
+        session_ids = instance.__dict__.pop("_rbaca_cleared_session_ids", ())
+    elif action in ("post_add", "post_remove"):
+        session_ids = pk_set
+    else:
+        return
+
+    for session in Session.objects.filter(pk__in=session_ids):
+        if _use_session_role_ids():
+            session.sync_active_role_ids()
+
+        if _use_session_cache():
+            invalidate_session(session.user_id)
+
+
+m2m_changed.connect(
+    user_roles_changed,
+    sender=get_user_model()._meta.get_field("roles").remote_field.through,
+    dispatch_uid="rbaca_user_roles_changed",
+)
+m2m_changed.connect(
+    role_permissions_changed,
+    sender=Role.permissions.through,
+    dispatch_uid="rbaca_role_permissions_changed",
+)
+m2m_changed.connect(
+    incompatible_roles_changed,
+    sender=Role.incompatible_roles.through,
+    dispatch_uid="rbaca_incompatible_roles_changed",
+)
+pre_save.connect(role_pre_save, sender=Role, dispatch_uid="rbaca_role_pre_save")
+post_save.connect(role_post_save, sender=Role, dispatch_uid="rbaca_role_post_save")
+pre_delete.connect(role_pre_delete, sender=Role, dispatch_uid="rbaca_role_pre_delete")
+post_delete.connect(
+    role_post_delete, sender=Role, dispatch_uid="rbaca_role_post_delete"
+)
+m2m_changed.connect(
+    session_roles_changed,
+    sender=Session.active_roles.through,
+    dispatch_uid="rbaca_session_roles_changed",
+)
+post_save.connect(
+    session_changed, sender=Session, dispatch_uid="rbaca_session_post_save"
+)
+post_delete.connect(
+    session_changed, sender=Session, dispatch_uid="rbaca_session_post_delete"
+)
@@ -30,4 +30,9 @@ urlpatterns = [
         api_views.VerifyNodeAcces.as_view(),
         name="refresh_node_jwt",
     ),
+    path(
+        "audit-trail/",
+        api_views.AuditEntryList.as_view(),
+        name="audit_trail",
+    ),
 ]
@@ -1,46 +1,194 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import PermissionRequiredMixin
-from django.http import HttpResponseRedirect
+from django.contrib.auth.models import Permission
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse, HttpResponseRedirect
 from django.shortcuts import render
 from django.urls import reverse_lazy
+from django.utils.functional import cached_property
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import CreateView, DeleteView, UpdateView
 from django.views.generic.list import ListView
 
+from rbaca.audit import _use_audit_trail, audit_actor, record_change
+from rbaca.cache import get_policy_generation
 from rbaca.forms import RoleForm, UserRoleForm
-from rbaca.models import Role
+from rbaca.instrumentation import MetricsCollector, get_tracer
+from rbaca.models import AuditEntry, Role
 
 UserModel = get_user_model()
 
 
+class KeysetPage:
+    """
+    A page of a queryset ordered by primary key, delimited by the primary key of the last
+    object of the previous page or the first object of the next page.
+
+    Unlike offset pagination, reading a page does not count the objects and does not skip
+    the preceding ones, so every page costs the same. The page is read on first access,
+    so a page rendered from a cached fragment is never read at all.
+
+    Attributes:
+        queryset (QuerySet): The objects to paginate.
+        page_size (int): The maximum number of objects per page.
+        after (Union[int, None]): Read the objects following this primary key.
+        before (Union[int, None]): Read the objects preceding this primary key.
+    """
+
+    def __init__(self, queryset, page_size, after=None, before=None):
+        self.queryset = queryset
+        self.page_size = page_size
+        self.after = after
+        self.before = before
+
+    @cached_property
+    def _page(self):
+        """
+        Read the objects of the page and one more to detect a further page.
+
+        Returns:
+            Tuple[List[Model], bool, bool]: The objects, whether a previous page and whether
+            a next page exists.
+        """
+        if self.before is not None:
+            objects = list(
+                self.queryset.filter(pk__lt=self.before).order_by("-pk")[
+                    : self.page_size + 1
+                ]
+            )
+            return objects[: self.page_size][::-1], len(objects) > self.page_size, True
+
+        queryset = self.queryset.order_by("pk")
+
+        if self.after is not None:
+            queryset = queryset.filter(pk__gt=self.after)
+
+        objects = list(queryset[: self.page_size + 1])
+        return (
+            objects[: self.page_size],
+            self.after is not None,
+            len(objects) > self.page_size,
+        )
+
+    @property
+    def object_list(self):
+        return self._page[0]
+
+    @property
+    def has_previous(self):
+        return self._page[1]
+
+    @property
+    def has_next(self):
+        return self._page[2]
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous and self.object_list:
+            return self.object_list[0].pk
+        return None
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.object_list:
+            return self.object_list[-1].pk
+        return None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
 class RoleList(PermissionRequiredMixin, ListView):
     """
-    View to list all roles.
+    View to list the roles page by page.
 
-    This view displays a list of all available roles.
+    This view displays the roles with their senior role, incompatible roles and
+    permissions. The `q` query parameter filters the roles by name, the `after` and
+    `before` query parameters select the page. The list is cached per page until the
+    policy changes.
 
     Attributes:
         permission_required (str): The permission required to access this view ("rbaca.view_role").
         model (Role): The model used for listing roles.
+        page_size (int): The maximum number of roles per page.
     """
 
     permission_required = "rbaca.view_role"
     model = Role
+    page_size = 100
+
+    def get_queryset(self):
+        """
+        Get the roles matching the search, with everything the list displays.
+
+        Returns:
+            QuerySet[Role]: The matching roles.
+        """
+        queryset = Role.objects.select_related("senior_role").prefetch_related(
+            Prefetch(
+                "incompatible_roles",
+                queryset=Role.objects.only("id", "name").order_by("name"),
+            ),
+            Prefetch(
+                "permissions",
+                queryset=Permission.objects.select_related("content_type"),
+            ),
+        )
+        query = self.get_search_query()
+
+        if query:
+            queryset = queryset.filter(name__icontains=query)
+        return queryset
+
+    def get_search_query(self):
+        return self.request.GET.get("q", "").strip()
+
+    def get_context_data(self, **kwargs):
+        after = _get_cursor(self.request, "after")
+        before = _get_cursor(self.request, "before")
+        page = KeysetPage(self.object_list, self.page_size, after=after, before=before)
+        kwargs.update(
+            page=page,
+            query=self.get_search_query(),
+            after=after,
+            before=before,
+            **_get_fragment_cache_context()
+        )
+        context = super().get_context_data(**kwargs)
+        context["object_list"] = context["role_list"] = page
+        return context
 
 
 class RoleDetail(PermissionRequiredMixin, DetailView):
     """
     View to display role details.
 
-    This view displays the details of a specific role.
+    This view displays the details of a specific role. The incompatible roles and the
+    permissions are cached until the policy changes, and only read if the cached details
+    are missing.
 
     Attributes:
         permission_required (str): The permission required to access this view ("rbaca.view_role").
-        model (Role): The model used for displaying role details.
+        queryset (QuerySet[Role]): The roles to display, with their senior role.
     """
 
     permission_required = "rbaca.view_role"
-    model = Role
+    queryset = Role.objects.select_related("senior_role")
+
+    def get_context_data(self, **kwargs):
+        kwargs.update(
+            incompatible_roles=self.object.incompatible_roles.only(
+                "id", "name"
+            ).order_by("name"),
+            permissions=self.object.permissions.select_related("content_type"),
+            **_get_fragment_cache_context()
+        )
+        return super().get_context_data(**kwargs)
 
 
 class RoleCreate(PermissionRequiredMixin, CreateView):
@@ -63,7 +211,7 @@ class RoleCreate(PermissionRequiredMixin, CreateView):
         form = RoleForm(request.POST)
 
         if form.is_valid():
-            form.save()
+            _save_role_form(request, form)
             return HttpResponseRedirect(reverse_lazy("rbaca:role_list"))
         return render(request, "rbaca/role_form.html", {"form": form})
 
@@ -88,7 +236,7 @@ class RoleUpdate(PermissionRequiredMixin, UpdateView):
         form = RoleForm(request.POST, instance=Role.objects.filter(pk=pk).first())
 
         if form.is_valid():
-            form.save()
+            _save_role_form(request, form)
             return HttpResponseRedirect(reverse_lazy("rbaca:role_list"))
         return render(request, "rbaca/role_form.html", {"form": form})
 
@@ -109,6 +257,18 @@ class RoleDelete(PermissionRequiredMixin, DeleteView):
     model = Role
     success_url = reverse_lazy("rbaca:role_list")
 
+    def form_valid(self, form):
+        if not _use_audit_trail():
+            return super().form_valid(form)
+
+        permission_ids = set(self.object.permissions.values_list("id", flat=True))
+
+        with transaction.atomic(), audit_actor(self.request.user):
+            record_change(
+                AuditEntry.DELETE_ROLE, self.object, permissions_before=permission_ids
+            )
+            return super().form_valid(form)
+
 
 class UserRoleUpdate(PermissionRequiredMixin, UpdateView):
     """
@@ -133,7 +293,121 @@ class UserRoleUpdate(PermissionRequiredMixin, UpdateView):
             request.POST, instance=UserModel.objects.filter(pk=pk).first()
         )
         if form.is_valid():
-            form.save()
+            if _use_audit_trail():
+                role_ids = (
+                    set(form.instance.roles.values_list("id", flat=True))
+                    if form.instance.pk
+                    else set()
+                )
+
+                with audit_actor(request.user):
+                    user = form.save()
+                    record_change(
+                        AuditEntry.UPDATE_ROLES,
+                        user,
+                        roles_before=role_ids,
+                        roles_after={role.pk for role in form.cleaned_data["roles"]},
+                    )
+            else:
+                form.save()
             return HttpResponseRedirect(reverse_lazy("rbaca:role_list"))
 
         return render(request, "rbaca/role_form.html", {"form": form})
+
+
+def _get_cursor(request, name):
+    """
+    Get a page cursor from the query parameters.
+
+    Args:
+        request (HttpRequest): The request.
+        name (str): The name of the query parameter.
+
+    Returns:
+        Union[int, None]: The cursor, or None if it is not given.
+
+    Raises:
+        Http404: If the cursor is not an integer.
+    """
+    value = request.GET.get(name)
+
+    if not value:
+        return None
+
+    try:
+        return int(value)
+    except ValueError:
+        raise Http404("Invalid page cursor.")
+
+
+def _get_fragment_cache_context():
+    """
+    Get the template variables used to cache the role fragments until the policy changes.
+
+    Returns:
+        Dict[str, Any]: The policy generation, the timeout and the alias of the cache.
+    """
+    return {
+        "policy_generation": get_policy_generation(),
+        "fragment_cache_timeout": getattr(
+            settings, "RBACA_FRAGMENT_CACHE_TIMEOUT", 300
+        ),
+        "fragment_cache_alias": getattr(settings, "RBACA_CACHE_ALIAS", "default"),
+    }
+
+
+def _save_role_form(request, form):
+    """
+    Save a valid role form and record the change in the audit trail if `USE_AUDIT_TRAIL`
+    is enabled.
+
+    Args:
+        request (HttpRequest): The request of the user making the change.
+        form (RoleForm): The valid form.
+
+    Returns:
+        Role: The saved role.
+    """
+    if not _use_audit_trail():
+        return form.save()
+
+    if form.instance.pk:
+        action = AuditEntry.UPDATE_ROLE
+        permission_ids = set(form.instance.permissions.values_list("id", flat=True))
+    else:
+        action = AuditEntry.CREATE_ROLE
+        permission_ids = None
+
+    with audit_actor(request.user):
+        role = form.save()
+        record_change(
+            action,
+            role,
+            permissions_before=permission_ids,
+            permissions_after={perm.pk for perm in form.cleaned_data["permissions"]},
+        )
+    return role
+
+
+def metrics(request):
+    """
+    View to expose the authorization metrics in the Prometheus text format.
+
+    The view is not routed by default. Add it to your URLs behind the protection your
+    monitoring setup requires. It responds with 404 unless `USE_INSTRUMENTATION` is enabled
+    and the tracer is a `MetricsCollector`.
+
+    Args:
+        request (HttpRequest): The request.
+
+    Returns:
+        HttpResponse: The metrics of the current process.
+    """
+    tracer = get_tracer()
+
+    if not isinstance(tracer, MetricsCollector):
+        raise Http404("Metrics are not collected.")
+
+    return HttpResponse(
+        tracer.render_prometheus(), content_type="text/plain; version=0.0.4"
+    )
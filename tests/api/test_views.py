@@ -7,7 +7,7 @@ from rest_framework.test import APIClient
 from rest_framework_jwt.utils import jwt_encode_payload
 
 from rbaca.api.utils import jwt_payload_handler
-from rbaca.models import Role, User
+from rbaca.models import AuditEntry, Role, User
 
 
 @override_settings(ROOT_URLCONF="rbaca.urls")
@@ -136,3 +136,55 @@ class TestVerifyNodeAcces(TestCase):
             "/verify-node-access-token/", {"token": token}, format="json"
         )
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+@override_settings(ROOT_URLCONF="rbaca.urls")
+class TestAuditEntryList(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create(username="admin", is_superuser=True)
+        self.user = User.objects.create(username="test")
+        AuditEntry.objects.bulk_create(
+            [
+                AuditEntry(
+                    actor=self.admin,
+                    action=AuditEntry.ASSIGN_ROLES,
+                    target_id=str(index % 2),
+                    target_name="user",
+                    roles_before=[],
+                    roles_after=[index],
+                )
+                for index in range(5)
+            ]
+        )
+        self.client = APIClient()
+
+    def test_requires_permission(self):
+        self.client.force_authenticate(self.user)
+
+        response = self.client.get("/audit-trail/")
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_cursor_pagination(self):
+        self.client.force_authenticate(self.admin)
+        targets = []
+        url = "/audit-trail/?page_size=2"
+
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            targets.extend(entry["roles_after"] for entry in response.data["results"])
+            url = response.data["next"]
+
+        self.assertEqual(targets, [[4], [3], [2], [1], [0]])
+
+    def test_filters(self):
+        self.client.force_authenticate(self.admin)
+
+        response = self.client.get("/audit-trail/", {"target_id": "1"})
+        self.assertEqual(
+            [entry["roles_after"] for entry in response.data["results"]], [[3], [1]]
+        )
+
+        response = self.client.get("/audit-trail/", {"actor": "foo"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,244 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import Permission
+from django.db import DatabaseError, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils.timezone import now
+
+from rbaca.audit import (
+    AuditTrail,
+    audit_actor,
+    close_audit_trail,
+    flush_audit_trail,
+    get_audit_trail,
+    record_change,
+)
+from rbaca.forms import RoleExpirationForm
+from rbaca.models import AuditEntry, Role, User
+from rbaca.views import RoleCreate, RoleDelete, RoleUpdate, UserRoleUpdate
+
+
+class TestAuditTrail(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="foo")
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(get_audit_trail())
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            record_change(AuditEntry.ASSIGN_ROLES, self.user, [], [1])
+
+        self.assertEqual(callbacks, [])
+
+    def test_full_buffer_is_written_by_caller(self):
+        trail = AuditTrail(buffer_size=2, batch_size=2, flush_interval=0)
+
+        trail.append({"action": AuditEntry.ASSIGN_ROLES, "target_id": "1"})
+        self.assertEqual(AuditEntry.objects.count(), 0)
+
+        trail.append({"action": AuditEntry.ASSIGN_ROLES, "target_id": "2"})
+        self.assertEqual(AuditEntry.objects.count(), 2)
+        self.assertEqual(trail.dropped, 0)
+
+    def test_failed_write_is_kept(self):
+        trail = AuditTrail(batch_size=1, flush_interval=0)
+        trail.append({"action": AuditEntry.ASSIGN_ROLES, "target_id": "1"})
+        trail.append({"action": AuditEntry.ASSIGN_ROLES, "target_id": "2"})
+
+        with mock.patch.object(
+            AuditEntry.objects, "bulk_create", side_effect=DatabaseError
+        ):
+            with self.assertLogs("rbaca.audit", "ERROR"):
+                self.assertEqual(trail.flush(), 0)
+
+        self.assertEqual(trail.failed, 1)
+        self.assertEqual([row["target_id"] for row in trail.buffer], ["1", "2"])
+
+        self.assertEqual(trail.flush(), 2)
+        self.assertEqual(
+            list(AuditEntry.objects.values_list("target_id", flat=True)), ["1", "2"]
+        )
+
+    @override_settings(USE_AUDIT_TRAIL=True, AUDIT_TRAIL_FLUSH_INTERVAL=5)
+    def test_close_writes_remaining_entries(self):
+        trail = get_audit_trail()
+        trail.buffer.clear()
+        trail.append({"action": AuditEntry.ASSIGN_ROLES, "target_id": "1"})
+
+        with mock.patch.object(trail, "stop") as stop:
+            close_audit_trail()
+
+        stop.assert_called_once_with()
+        self.assertEqual(AuditEntry.objects.count(), 1)
+        self.assertEqual(len(trail.buffer), 0)
+
+    @override_settings(USE_AUDIT_TRAIL=True, AUDIT_TRAIL_FLUSH_INTERVAL=0)
+    def test_rolled_back_changes_are_not_recorded(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    record_change(AuditEntry.ASSIGN_ROLES, self.user, [], [1])
+                    raise ValueError
+            except ValueError:
+                pass
+
+        flush_audit_trail()
+        self.assertFalse(AuditEntry.objects.exists())
+
+    @override_settings(USE_AUDIT_TRAIL=True, AUDIT_TRAIL_FLUSH_INTERVAL=0)
+    def test_delete_before(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(3):
+                record_change(AuditEntry.ASSIGN_ROLES, self.user, [], [1])
+        flush_audit_trail()
+
+        self.assertEqual(AuditEntry.manage.delete_before(now(), chunk_size=2), 2)
+        self.assertEqual(AuditEntry.manage.delete_before(now(), chunk_size=2), 1)
+        self.assertEqual(
+            AuditEntry.manage.delete_before(now() - timedelta(days=1), chunk_size=2),
+            0,
+        )
+
+
+@override_settings(
+    USE_AUDIT_TRAIL=True, AUDIT_TRAIL_FLUSH_INTERVAL=0, ROOT_URLCONF="tests.urls"
+)
+class TestAuditedChanges(TestCase):
+    def setUp(self):
+        get_audit_trail().buffer.clear()
+        self.admin = User.objects.create(username="admin", is_superuser=True)
+        self.user = User.objects.create(username="foo")
+        self.role1 = Role.objects.create(name="test_role_1")
+        self.role2 = Role.objects.create(name="test_role_2")
+        self.permissions = list(Permission.objects.order_by("id")[:3])
+        self.factory = RequestFactory()
+
+    def get_entries(self):
+        flush_audit_trail()
+        return list(AuditEntry.objects.order_by("id"))
+
+    def post(self, view, data, **kwargs):
+        request = self.factory.post("/", data)
+        request.user = self.admin
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = view.as_view()(request, **kwargs)
+
+        self.assertEqual(response.status_code, 302)
+
+    def test_assign_and_deassign_roles(self):
+        with self.captureOnCommitCallbacks(execute=True), audit_actor(self.admin):
+            self.user.assign_roles(self.role1)
+            self.user.assign_roles(self.role2)
+            self.user.deassign_roles(self.role1)
+
+        entries = self.get_entries()
+
+        self.assertEqual(
+            [
+                (entry.action, entry.roles_before, entry.roles_after)
+                for entry in entries
+            ],
+            [
+                (AuditEntry.ASSIGN_ROLES, [], [self.role1.pk]),
+                (
+                    AuditEntry.ASSIGN_ROLES,
+                    [self.role1.pk],
+                    [self.role1.pk, self.role2.pk],
+                ),
+                (
+                    AuditEntry.DEASSIGN_ROLES,
+                    [self.role1.pk, self.role2.pk],
+                    [self.role2.pk],
+                ),
+            ],
+        )
+        self.assertTrue(all(entry.actor == self.admin for entry in entries))
+        self.assertEqual(entries[0].target_id, str(self.user.pk))
+        self.assertEqual(entries[0].target_name, "foo")
+
+    def test_unknown_actor(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.assign_roles(self.role1)
+
+        self.assertIsNone(self.get_entries()[0].actor)
+
+    def test_role_expiration_form(self):
+        self.role2.senior_role = self.role1
+        self.role2.save()
+        form = RoleExpirationForm(
+            self.user,
+            allow_superroles=True,
+            data={"role": self.role1.pk, "expiration_date": now().date()},
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            form.save()
+
+        entry = self.get_entries()[0]
+        self.assertEqual(entry.action, AuditEntry.ASSIGN_ROLES)
+        self.assertEqual(entry.roles_before, [])
+        self.assertEqual(entry.roles_after, [self.role1.pk, self.role2.pk])
+
+    def test_role_views(self):
+        perm_ids = [perm.pk for perm in self.permissions]
+
+        self.post(RoleCreate, {"name": "created", "permissions": perm_ids[:2]})
+        role = Role.objects.get(name="created")
+        self.post(
+            RoleUpdate, {"name": "updated", "permissions": perm_ids[1:]}, pk=role.pk
+        )
+        self.post(RoleDelete, {}, pk=role.pk)
+
+        self.assertEqual(
+            [
+                (
+                    entry.action,
+                    entry.target_id,
+                    entry.target_name,
+                    entry.permissions_before,
+                    entry.permissions_after,
+                    entry.actor_id,
+                )
+                for entry in self.get_entries()
+            ],
+            [
+                (
+                    AuditEntry.CREATE_ROLE,
+                    str(role.pk),
+                    "created",
+                    None,
+                    perm_ids[:2],
+                    self.admin.pk,
+                ),
+                (
+                    AuditEntry.UPDATE_ROLE,
+                    str(role.pk),
+                    "updated",
+                    perm_ids[:2],
+                    perm_ids[1:],
+                    self.admin.pk,
+                ),
+                (
+                    AuditEntry.DELETE_ROLE,
+                    str(role.pk),
+                    "updated",
+                    perm_ids[1:],
+                    None,
+                    self.admin.pk,
+                ),
+            ],
+        )
+
+    def test_user_role_update_view(self):
+        self.user.roles.add(self.role1)
+
+        self.post(UserRoleUpdate, {"roles": [self.role2.pk]}, pk=self.user.pk)
+
+        entry = self.get_entries()[0]
+        self.assertEqual(entry.action, AuditEntry.UPDATE_ROLES)
+        self.assertEqual(entry.roles_before, [self.role1.pk])
+        self.assertEqual(entry.roles_after, [self.role2.pk])
+        self.assertEqual(entry.actor, self.admin)
@@ -1,3 +1,4 @@
+from datetime import timedelta
 from unittest import mock
 
 from django.contrib.auth import authenticate
@@ -5,9 +6,12 @@ from django.contrib.auth.hashers import MD5PasswordHasher
 from django.contrib.auth.models import AnonymousUser, Permission
 from django.contrib.contenttypes.models import ContentType
 from django.test import TestCase, modify_settings, override_settings
+from django.utils.timezone import now
 
-from rbaca.backends import RoleBackend
-from rbaca.models import Role, Session, User
+from rbaca import backends
+from rbaca.backends import RoleBackend, get_role_permission_map
+from rbaca.cache import get_cache, get_session_entry
+from rbaca.models import Role, RoleValidity, Session, User
 
 
 class CountingMD5PasswordHasher(MD5PasswordHasher):
@@ -191,6 +195,151 @@ class TestRoleBackendRoleBased(TestCase):
         self.assertEqual(backend.get_user(self.user.id), self.user)
         self.assertEqual(None, backend.get_user(-1))
 
+    def test_with_perm(self):
+        backend = RoleBackend()
+        content_type = ContentType.objects.get_for_model(Role)
+        perm = Permission.objects.create(
+            name="test_role", content_type=content_type, codename="test_role"
+        )
+        role = Role.objects.create(name="test_role")
+        role.permissions.add(perm)
+        self.user.roles.add(role)
+
+        self.assertEqual(
+            set(backend.with_perm("rbaca.test_role")), {self.user, self.superuser}
+        )
+        self.assertEqual(
+            set(backend.with_perm(perm, include_superusers=False)), {self.user}
+        )
+        self.assertFalse(backend.with_perm("rbaca.test_role", obj="object"))
+
+        with self.assertRaises(ValueError):
+            backend.with_perm("test_role")
+        with self.assertRaises(TypeError):
+            backend.with_perm(1)
+
+    @override_settings(USE_EFFECTIVE_PERMISSIONS=True)
+    def test_effective_permissions(self):
+        backend = RoleBackend()
+        content_type = ContentType.objects.get_for_model(Role)
+        perm = Permission.objects.create(
+            name="test_role", content_type=content_type, codename="test_role"
+        )
+        role = Role.objects.create(name="test_role")
+        role.permissions.add(perm)
+        self.user.roles.add(role)
+
+        user = self.UserModel._default_manager.get(pk=self.user.pk)
+        self.assertEqual(backend.get_role_permissions(user), {"rbaca.test_role"})
+        self.assertEqual(
+            set(backend.with_perm("rbaca.test_role", include_superusers=False)),
+            {self.user},
+        )
+
+    @override_settings(USE_ROLE_INHERITANCE=True)
+    def test_role_inheritance(self):
+        backend = RoleBackend()
+        content_type = ContentType.objects.get_for_model(Role)
+        perm = Permission.objects.create(
+            name="test_role", content_type=content_type, codename="test_role"
+        )
+        senior_role = Role.objects.create(name="senior_role")
+        junior_role = Role.objects.create(name="junior_role", senior_role=senior_role)
+        junior_role.permissions.add(perm)
+        self.user.roles.add(senior_role)
+
+        user = self.UserModel._default_manager.get(pk=self.user.pk)
+        self.assertIs(user.has_perm("rbaca.test_role"), True)
+        self.assertIs(user.has_role("junior_role"), True)
+        self.assertEqual(
+            set(backend.with_perm("rbaca.test_role", include_superusers=False)),
+            {self.user},
+        )
+
+    @override_settings(USE_ROLE_INHERITANCE=True)
+    def test_with_perm_role_inheritance_queries(self):
+        backend = RoleBackend()
+        content_type = ContentType.objects.get_for_model(Role)
+        perm = Permission.objects.create(
+            name="test_role", content_type=content_type, codename="test_role"
+        )
+        senior_role = Role.objects.create(name="senior_role")
+
+        for index in range(10):
+            junior_role = Role.objects.create(
+                name="junior_role_%d" % index, senior_role=senior_role
+            )
+            junior_role.permissions.add(perm)
+        self.user.roles.add(senior_role)
+
+        # roles with the permission, one query per hierarchy level, users
+        with self.assertNumQueries(4):
+            self.assertEqual(
+                set(backend.with_perm("rbaca.test_role", include_superusers=False)),
+                {self.user},
+            )
+
+    @override_settings(USE_ROLE_VALIDITY=True, USE_EFFECTIVE_PERMISSIONS=True)
+    def test_role_validity(self):
+        backend = RoleBackend()
+        content_type = ContentType.objects.get_for_model(Role)
+        perm = Permission.objects.create(
+            name="test_role", content_type=content_type, codename="test_role"
+        )
+        role = Role.objects.create(name="test_role")
+        role.permissions.add(perm)
+        self.user.roles.add(role)
+        current_time = now()
+
+        RoleValidity.manage.set_validity(
+            self.user, role, valid_until=current_time - timedelta(minutes=1)
+        )
+        user = self.UserModel._default_manager.get(pk=self.user.pk)
+        self.assertIs(user.has_perm("rbaca.test_role"), False)
+        self.assertIs(user.has_role("test_role"), False)
+        self.assertFalse(backend.with_perm("rbaca.test_role", include_superusers=False))
+
+        RoleValidity.manage.set_validity(
+            self.user, role, valid_from=current_time + timedelta(minutes=1)
+        )
+        user = self.UserModel._default_manager.get(pk=self.user.pk)
+        self.assertIs(user.has_perm("rbaca.test_role"), False)
+
+        with mock.patch(
+            "rbaca.backends.now", return_value=current_time + timedelta(minutes=2)
+        ), mock.patch(
+            "rbaca.models.now", return_value=current_time + timedelta(minutes=2)
+        ):
+            self.assertIs(user.has_perm("rbaca.test_role"), True)
+            self.assertIs(user.has_role("test_role"), True)
+            self.assertEqual(
+                set(backend.with_perm("rbaca.test_role", include_superusers=False)),
+                {self.user},
+            )
+
+    @override_settings(USE_ROLE_VALIDITY=True)
+    def test_role_validity_cache_expires(self):
+        content_type = ContentType.objects.get_for_model(Role)
+        perm = Permission.objects.create(
+            name="test_role", content_type=content_type, codename="test_role"
+        )
+        role = Role.objects.create(name="test_role")
+        role.permissions.add(perm)
+        self.user.roles.add(role)
+        valid_until = now() + timedelta(minutes=1)
+        RoleValidity.manage.set_validity(self.user, role, valid_until=valid_until)
+
+        user = self.UserModel._default_manager.get(pk=self.user.pk)
+        self.assertIs(user.has_perm("rbaca.test_role"), True)
+
+        with self.assertNumQueries(0):
+            self.assertIs(user.has_perm("rbaca.test_role"), True)
+
+        with mock.patch("rbaca.backends.now", return_value=valid_until), mock.patch(
+            "rbaca.models.now", return_value=valid_until
+        ):
+            self.assertIs(user.has_perm("rbaca.test_role"), False)
+
 
 @override_settings(USE_SESSIONS=True)
 class TestRoleBackendSessionBased(TestCase):
@@ -335,6 +484,126 @@ class TestRoleBackendSessionBased(TestCase):
         self.assertEqual(backend.get_all_permissions(user), set())
         self.assertEqual(backend.get_role_permissions(user), set())
 
+    @override_settings(USE_SESSION_ROLE_IDS=True, USE_ROLE_INHERITANCE=True)
+    def test_session_role_ids(self):
+        content_type = ContentType.objects.get_for_model(Role)
+        perm = Permission.objects.create(
+            name="test_role", content_type=content_type, codename="test_role"
+        )
+        senior_role = Role.objects.create(name="senior_role")
+        junior_role = Role.objects.create(name="junior_role", senior_role=senior_role)
+        junior_role.permissions.add(perm)
+        self.user.roles.add(senior_role)
+        Session.manage.add_session(self.user, senior_role)
+
+        user = self.UserModel._default_manager.get(pk=self.user.pk)
+
+        with mock.patch.object(
+            backends.transaction, "get_connection"
+        ) as get_connection, mock.patch.object(
+            backends, "_role_permissions", None
+        ), mock.patch.object(
+            backends, "is_shared_cache", return_value=True
+        ):
+            get_connection.return_value.in_atomic_block = False
+            self.assertEqual(
+                get_role_permission_map()[senior_role.id], {"rbaca.test_role"}
+            )
+
+            with self.assertNumQueries(1):
+                self.assertIs(user.has_perm("rbaca.test_role"), True)
+
+    def test_role_permission_map_not_shared_with_process_local_cache(self):
+        content_type = ContentType.objects.get_for_model(Role)
+        perm = Permission.objects.create(
+            name="test_role", content_type=content_type, codename="test_role"
+        )
+        role = Role.objects.create(name="test_role")
+        role.permissions.add(perm)
+
+        with mock.patch.object(
+            backends.transaction, "get_connection"
+        ) as get_connection, mock.patch.object(backends, "_role_permissions", None):
+            get_connection.return_value.in_atomic_block = False
+            self.assertEqual(get_role_permission_map()[role.id], {"rbaca.test_role"})
+            self.assertIsNone(backends._role_permissions)
+
+            # another process revokes the permission without bumping this cache
+            Role.permissions.through.objects.filter(role=role).delete()
+
+            with self.assertNumQueries(1):
+                self.assertNotIn(role.id, get_role_permission_map())
+
+    @override_settings(USE_SESSION_CACHE=True)
+    def test_session_cache_not_used_with_process_local_cache(self):
+        get_cache().clear()
+        role = Role.objects.create(name="test_role")
+        self.user.roles.add(role)
+        Session.manage.add_session(self.user, role)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user = self.UserModel._default_manager.get(pk=self.user.pk)
+            user.get_active_session()
+
+        self.assertIsNone(get_session_entry(self.user.pk))
+
+    @override_settings(USE_SESSION_CACHE=True)
+    @mock.patch("rbaca.models.is_shared_cache", return_value=True)
+    def test_session_cache(self, is_shared_cache):
+        get_cache().clear()
+        content_type = ContentType.objects.get_for_model(Role)
+        perm = Permission.objects.create(
+            name="test_role", content_type=content_type, codename="test_role"
+        )
+        role = Role.objects.create(name="test_role")
+        role.permissions.add(perm)
+        self.user.roles.add(role)
+        session = Session.manage.add_session(self.user, role)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user = self.UserModel._default_manager.get(pk=self.user.pk)
+            self.assertIs(user.has_perm("rbaca.test_role"), True)
+            self.assertIs(user.has_role("test_role"), True)
+
+        user = self.UserModel._default_manager.get(pk=self.user.pk)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(user.get_active_session(), session)
+            self.assertIs(user.has_perm("rbaca.test_role"), True)
+            self.assertIs(user.has_role("test_role"), True)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            session.drop_active_roles(role)
+
+        user = self.UserModel._default_manager.get(pk=self.user.pk)
+        self.assertIs(user.has_perm("rbaca.test_role"), False)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            session.close()
+
+        user = self.UserModel._default_manager.get(pk=self.user.pk)
+        self.assertIsNone(user.get_active_session())
+
+    @override_settings(USE_SESSION_CACHE=True)
+    @mock.patch("rbaca.models.is_shared_cache", return_value=True)
+    def test_session_cache_policy_changed(self, is_shared_cache):
+        get_cache().clear()
+        content_type = ContentType.objects.get_for_model(Role)
+        perm = Permission.objects.create(
+            name="test_role", content_type=content_type, codename="test_role"
+        )
+        role = Role.objects.create(name="test_role")
+        self.user.roles.add(role)
+        Session.manage.add_session(self.user, role)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user = self.UserModel._default_manager.get(pk=self.user.pk)
+            self.assertIs(user.has_perm("rbaca.test_role"), False)
+
+        role.permissions.add(perm)
+        user = self.UserModel._default_manager.get(pk=self.user.pk)
+        self.assertIs(user.has_perm("rbaca.test_role"), True)
+
     def test_get_all_superuser_permissions(self):
         user = self.UserModel._default_manager.get(pk=self.superuser.pk)
         self.assertEqual(len(user.get_all_permissions()), len(Permission.objects.all()))
@@ -0,0 +1,158 @@
+from unittest import mock
+
+from django.contrib.auth.models import Permission
+from django.test import TestCase, override_settings
+
+import rbaca
+from rbaca import constraints
+from rbaca.cache import get_policy_generation
+from rbaca.changesets import ChangeSet, changeset_applied
+from rbaca.constraints import ConstraintEngine, get_constraint_engine
+from rbaca.models import EffectivePermission, Role, User
+
+
+class TestChangeSet(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username="user%d" % i) for i in range(3)]
+        self.role = Role.objects.create(name="role")
+        self.other_role = Role.objects.create(name="other")
+        self.view_role = Permission.objects.get(codename="view_role")
+        self.change_role = Permission.objects.get(codename="change_role")
+        self.role.permissions.add(self.change_role)
+
+    @override_settings(USE_EFFECTIVE_PERMISSIONS=True)
+    def test_changeset(self):
+        received = []
+        changeset_applied.connect(
+            lambda sender, changeset, **kwargs: received.append(changeset),
+            weak=False,
+            dispatch_uid="test_changeset",
+        )
+        self.addCleanup(changeset_applied.disconnect, dispatch_uid="test_changeset")
+
+        with mock.patch(
+            "rbaca.cache.bump_policy_generation"
+        ) as bump, self.captureOnCommitCallbacks(execute=True):
+            with rbaca.changeset() as changes:
+                changes.grant(self.role, self.view_role)
+                changes.revoke(self.role, [self.change_role])
+                changes.assign(User.objects.all(), self.role)
+                self.other_role.grant_perms(self.change_role)
+
+        self.assertEqual(bump.call_count, 2)
+        self.assertEqual(received, [changes])
+        self.assertEqual(len(changes), 3)
+        self.assertQuerysetEqual(self.role.permissions.all(), [self.view_role])
+
+        for user in self.users:
+            self.assertQuerysetEqual(user.roles.all(), [self.role])
+            self.assertEqual(
+                set(
+                    EffectivePermission.objects.filter(user=user).values_list(
+                        "permission", flat=True
+                    )
+                ),
+                {self.view_role.id},
+            )
+
+    def test_changeset_rolls_back(self):
+        self.role.incompatible_roles.add(self.other_role)
+        self.users[0].roles.add(self.other_role)
+
+        with self.assertRaises(ValueError):
+            with rbaca.changeset() as changes:
+                changes.grant(self.role, self.view_role)
+                self.other_role.grant_perms(self.view_role)
+                changes.assign(self.users, self.role)
+
+        self.assertQuerysetEqual(self.role.permissions.all(), [self.change_role])
+        self.assertFalse(self.other_role.permissions.exists())
+        self.assertFalse(self.role.assigned_users().exists())
+
+    def test_changeset_hierarchy(self):
+        with rbaca.changeset() as changes:
+            changes.set_senior_role(self.role, self.other_role)
+            changes.deassign(self.users, self.role)
+
+        self.role.refresh_from_db()
+        self.assertEqual(self.role.senior_role, self.other_role)
+
+    def test_changeset_invalid_permissions(self):
+        with self.assertRaises(ValueError):
+            ChangeSet().grant(self.role, "rbaca.view_role")
+
+    def test_changeset_applies_changes_in_order(self):
+        with rbaca.changeset() as changes:
+            changes.grant(self.role, self.view_role)
+            changes.revoke(self.role, self.view_role)
+            changes.revoke(self.role, self.change_role)
+            changes.grant(self.role, self.change_role)
+            changes.assign(self.users, self.role)
+            changes.deassign(self.users[:1], self.role)
+
+        self.assertQuerysetEqual(self.role.permissions.all(), [self.change_role])
+        self.assertQuerysetEqual(
+            self.role.assigned_users().order_by("id"), self.users[1:]
+        )
+
+    def test_changeset_hierarchy_inherits_incompatible_roles(self):
+        senior = Role.objects.create(name="senior")
+        incompatible = Role.objects.create(name="incompatible")
+        senior.incompatible_roles.add(incompatible)
+
+        # savepoint, read, insert, update, release
+        with self.assertNumQueries(5):
+            with rbaca.changeset() as changes:
+                changes.set_senior_role(self.other_role, senior)
+                changes.set_senior_role(self.role, self.other_role)
+
+        self.assertQuerysetEqual(self.role.incompatible_roles.all(), [incompatible])
+        self.assertQuerysetEqual(
+            incompatible.incompatible_roles.order_by("id"),
+            [self.role, self.other_role, senior],
+        )
+        self.role.refresh_from_db()
+        self.assertEqual(self.role.senior_role, self.other_role)
+
+    def test_changeset_hierarchy_rejects_incompatible_senior_role(self):
+        self.role.incompatible_roles.add(self.other_role)
+
+        with self.assertRaises(ValueError):
+            with rbaca.changeset() as changes:
+                changes.set_senior_role(self.role, self.other_role)
+
+        self.role.refresh_from_db()
+        self.assertIsNone(self.role.senior_role)
+
+    def test_changeset_revokes_from_many_roles(self):
+        Role.objects.bulk_create(Role(name="bulk_%d" % index) for index in range(1200))
+        roles = list(Role.objects.filter(name__startswith="bulk_"))
+        Role.permissions.through.objects.bulk_create(
+            Role.permissions.through(role=role, permission=self.view_role)
+            for role in roles
+        )
+
+        with rbaca.changeset() as changes:
+            for role in roles:
+                changes.revoke(role, [self.view_role, self.change_role])
+
+        self.assertFalse(
+            Role.permissions.through.objects.filter(role__in=roles).exists()
+        )
+
+    @override_settings(USE_CONSTRAINT_ENGINE_CACHE=True)
+    def test_changeset_validates_against_pending_incompatibilities(self):
+        stale_engine = ConstraintEngine.load(generation=get_policy_generation())
+
+        with mock.patch.object(
+            constraints, "_use_shared_engine", return_value=True
+        ), mock.patch.object(constraints, "_engine", stale_engine):
+            self.assertIs(get_constraint_engine(), stale_engine)
+
+            with self.assertRaises(ValueError):
+                with rbaca.changeset() as changes:
+                    self.role.incompatible_roles.add(self.other_role)
+                    changes.assign(self.users[:1], [self.role, self.other_role])
+
+        self.assertFalse(self.users[0].roles.exists())
+        self.assertFalse(self.role.incompatible_roles.exists())
@@ -0,0 +1,435 @@
+import json
+import os
+from datetime import timedelta
+from io import StringIO
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+
+from django.contrib.auth.models import Permission
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils.timezone import now
+
+from rbaca.models import (
+    AuditEntry,
+    CommandLock,
+    EffectivePermission,
+    Role,
+    RoleExpiration,
+    Session,
+    SessionArchive,
+    User,
+)
+
+
+class TestEffectivePermissionsCommand(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="foo")
+        self.role = Role.objects.create(name="role")
+        self.role.permissions.add(Permission.objects.get(codename="view_role"))
+        self.user.roles.add(self.role)
+
+    def test_verify_out_of_sync(self):
+        out = StringIO()
+
+        with self.assertRaises(CommandError):
+            call_command("rbaca_effective_permissions", stdout=out)
+
+        self.assertIn("1 missing, 0 stale rows", out.getvalue())
+        self.assertFalse(EffectivePermission.objects.exists())
+
+    def test_repair(self):
+        out = StringIO()
+        call_command(
+            "rbaca_effective_permissions", "--repair", "--chunk-size", "1", stdout=out
+        )
+
+        self.assertIn("checked 1 users", out.getvalue())
+        self.assertTrue(EffectivePermission.objects.filter(user=self.user).exists())
+
+        call_command("rbaca_effective_permissions", stdout=StringIO())
+
+    def test_verify_in_sync(self):
+        EffectivePermission.manage.refresh_users([self.user.pk])
+        out = StringIO()
+        call_command("rbaca_effective_permissions", stdout=out)
+
+        self.assertIn("0 missing, 0 stale rows", out.getvalue())
+
+
+class TestExpireRolesCommand(TestCase):
+    def setUp(self):
+        self.role = Role.objects.create(name="role")
+        self.senior_role = Role.objects.create(name="senior")
+        self.role.set_senior_role(self.senior_role)
+        self.users = [User.objects.create(username="user%d" % i) for i in range(3)]
+
+        for i, user in enumerate(self.users):
+            user.roles.add(self.role, self.senior_role)
+            RoleExpiration.manage.add_role_expiration(
+                user, self.role, now() - timedelta(days=3 - i)
+            )
+
+        self.active = RoleExpiration.manage.add_role_expiration(
+            self.users[0], self.senior_role, now() + timedelta(days=1)
+        )
+
+    def test_expire_roles(self):
+        out = StringIO()
+        call_command("rbaca_expire_roles", "--batch-size", "2", stdout=out)
+
+        self.assertIn("batch 1: 2 expirations", out.getvalue())
+        self.assertIn("batch 2: 1 expirations", out.getvalue())
+        self.assertIn("removed 3 expirations in 2 batches", out.getvalue())
+        self.assertQuerysetEqual(RoleExpiration.objects.all(), [self.active])
+        self.assertFalse(User.objects.filter(roles__isnull=False).exists())
+        self.assertFalse(CommandLock.objects.exists())
+
+    def test_dry_run(self):
+        out = StringIO()
+        call_command("rbaca_expire_roles", "--dry-run", "--batch-size", "1", stdout=out)
+
+        self.assertIn("found 3 expirations in 3 batches", out.getvalue())
+        self.assertEqual(RoleExpiration.objects.count(), 4)
+        self.assertEqual(self.users[0].roles.count(), 2)
+
+    def test_max_seconds(self):
+        out = StringIO()
+        call_command("rbaca_expire_roles", "--max-seconds", "0", stdout=out)
+
+        self.assertIn("removed 0 expirations in 0 batches", out.getvalue())
+        self.assertEqual(RoleExpiration.objects.count(), 4)
+
+    def test_locked(self):
+        CommandLock.manage.acquire("rbaca_expire_roles", 60)
+
+        with self.assertRaises(CommandError):
+            call_command("rbaca_expire_roles", stdout=StringIO())
+
+        self.assertEqual(RoleExpiration.objects.count(), 4)
+
+    def test_abandoned_lock(self):
+        CommandLock.manage.acquire("rbaca_expire_roles", -1)
+        call_command("rbaca_expire_roles", stdout=StringIO())
+
+        self.assertEqual(RoleExpiration.objects.count(), 1)
+        self.assertFalse(CommandLock.objects.exists())
+
+
+class TestCloseSessionsCommand(TestCase):
+    def test_close_sessions(self):
+        user = User.objects.create(username="foo")
+        timed_out = Session.manage.add_session(user)
+        Session.objects.filter(pk=timed_out.pk).update(
+            date_start=now() - timedelta(days=1)
+        )
+        active = Session.manage.add_session(user)
+        out = StringIO()
+        call_command("rbaca_close_sessions", stdout=out)
+
+        self.assertIn("closed 1 sessions", out.getvalue())
+        self.assertQuerysetEqual(
+            Session.objects.filter(date_end__isnull=True), [active]
+        )
+
+
+class TestSyncSessionRolesCommand(TestCase):
+    def test_sync_session_roles(self):
+        user = User.objects.create(username="foo")
+        role = Role.objects.create(name="role")
+        user.roles.add(role)
+        session = Session.manage.add_session(user, [role])
+        out = StringIO()
+        call_command("rbaca_sync_session_roles", stdout=out)
+
+        self.assertIn("synced 1 sessions", out.getvalue())
+        session.refresh_from_db()
+        self.assertEqual(session.active_role_ids, [role.id])
+
+    def test_invalid_chunk_size(self):
+        with self.assertRaises(CommandError):
+            call_command("rbaca_sync_session_roles", chunk_size=0)
+
+
+class TestArchiveSessionsCommand(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="foo")
+        self.role = Role.objects.create(name="role")
+        self.user.roles.add(self.role)
+        self.old = [Session.manage.add_session(self.user, self.role) for _ in range(3)]
+        Session.objects.filter(pk__in=[session.pk for session in self.old]).update(
+            date_end=now() - timedelta(days=100)
+        )
+        self.recent = Session.manage.add_session(self.user, self.role)
+        self.recent.close()
+        self.active = Session.manage.add_session(self.user, self.role)
+
+    def test_archive_sessions(self):
+        out = StringIO()
+        call_command("rbaca_archive_sessions", "--batch-size", "2", stdout=out)
+
+        self.assertIn("batch 2: 1 sessions", out.getvalue())
+        self.assertIn("archived 3 sessions in 2 batches", out.getvalue())
+        self.assertQuerysetEqual(
+            Session.objects.order_by("id"), [self.recent, self.active]
+        )
+        self.assertEqual(Session.active_roles.through.objects.count(), 2)
+        self.assertEqual(
+            sorted(SessionArchive.objects.values_list("session_id", flat=True)),
+            [session.pk for session in self.old],
+        )
+        self.assertEqual(SessionArchive.objects.first().roles, ["role"])
+
+    def test_delete_sessions(self):
+        out = StringIO()
+        call_command("rbaca_archive_sessions", "--delete", "--days", "0", stdout=out)
+
+        self.assertIn("deleted 4 sessions in 1 batches", out.getvalue())
+        self.assertQuerysetEqual(Session.objects.all(), [self.active])
+        self.assertFalse(SessionArchive.objects.exists())
+
+
+class TestPruneAuditCommand(TestCase):
+    def setUp(self):
+        AuditEntry.objects.bulk_create(
+            [
+                AuditEntry(
+                    action=AuditEntry.ASSIGN_ROLES,
+                    target_id=str(index),
+                    target_name="user",
+                    date=now() - timedelta(days=400 if index < 3 else 1),
+                )
+                for index in range(5)
+            ]
+        )
+
+    def test_prune_audit(self):
+        out = StringIO()
+        call_command("rbaca_prune_audit", "--batch-size", "2", stdout=out)
+
+        self.assertIn("batch 2: 1 entries", out.getvalue())
+        self.assertIn("deleted 3 entries in 2 batches", out.getvalue())
+        self.assertEqual(
+            sorted(AuditEntry.objects.values_list("target_id", flat=True)), ["3", "4"]
+        )
+
+    def test_invalid_batch_size(self):
+        with self.assertRaises(CommandError):
+            call_command("rbaca_prune_audit", "--batch-size", "0")
+
+
+class TestSyncPolicyCommand(TestCase):
+    def setUp(self):
+        self.role = Role.objects.create(name="role")
+        self.stale = Role.objects.create(name="stale")
+        self.role.permissions.add(Permission.objects.get(codename="view_role"))
+        self.file = NamedTemporaryFile("w", suffix=".json")
+        self.addCleanup(self.file.close)
+
+    def write_policy(self, document):
+        json.dump(document, self.file)
+        self.file.flush()
+
+    def test_sync_policy(self):
+        self.write_policy(
+            {
+                "roles": [
+                    {
+                        "name": "role",
+                        "permissions": ["rbaca.add_role"],
+                        "senior_role": "senior",
+                    },
+                    {"name": "senior", "incompatible_roles": ["other"]},
+                    {"name": "other"},
+                ]
+            }
+        )
+        out = StringIO()
+        call_command("rbaca_sync_policy", self.file.name, "--prune", stdout=out)
+
+        self.assertIn("+ permission role: rbaca.add_role", out.getvalue())
+        self.assertIn("+ incompatible other, role", out.getvalue())
+        self.assertIn("applied 8 changes", out.getvalue())
+        self.assertFalse(Role.objects.filter(name="stale").exists())
+        self.role.refresh_from_db()
+        self.assertEqual(self.role.senior_role.name, "senior")
+        self.assertEqual(
+            list(self.role.permissions.values_list("codename", flat=True)),
+            ["add_role"],
+        )
+        self.assertEqual(
+            list(
+                self.role.senior_role.incompatible_roles.values_list("name", flat=True)
+            ),
+            ["other"],
+        )
+
+        out = StringIO()
+        call_command("rbaca_sync_policy", self.file.name, "--check", stdout=out)
+        self.assertIn("the policy is in sync", out.getvalue())
+
+    def test_check_drift(self):
+        self.write_policy({"roles": [{"name": "role"}, {"name": "new"}]})
+        out = StringIO()
+
+        with self.assertRaises(CommandError):
+            call_command("rbaca_sync_policy", self.file.name, "--check", stdout=out)
+
+        self.assertIn("+ role new", out.getvalue())
+        self.assertIn("- permission role: rbaca.view_role", out.getvalue())
+        self.assertNotIn("stale", out.getvalue())
+        self.assertFalse(Role.objects.filter(name="new").exists())
+        self.assertTrue(self.role.permissions.exists())
+
+    def test_unknown_permission(self):
+        self.write_policy({"roles": [{"name": "new", "permissions": ["rbaca.nope"]}]})
+
+        with self.assertRaisesMessage(CommandError, "unknown permissions: rbaca.nope"):
+            call_command("rbaca_sync_policy", self.file.name, stdout=StringIO())
+
+        self.assertFalse(Role.objects.filter(name="new").exists())
+
+
+class TestExportImportCommands(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="foo")
+        self.user2 = User.objects.create(username="bar")
+        self.role = Role.objects.create(name="role")
+        self.other = Role.objects.create(name="other")
+        self.other.incompatible_roles.add(self.role)
+        self.user.roles.add(self.role)
+        self.user2.roles.add(self.other)
+        self.directory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_export_import_round_trip(self):
+        for file_format in ("csv", "jsonl"):
+            with self.subTest(file_format=file_format):
+                path = self.path("assignments.%s" % file_format)
+                out = StringIO()
+                call_command("rbaca_export", path, "--chunk-size", "1", stdout=out)
+
+                self.assertIn("exported 2 assignments", out.getvalue())
+
+                self.user.roles.clear()
+                self.user2.roles.clear()
+                out = StringIO()
+                call_command("rbaca_import", path, "--batch-size", "1", stdout=out)
+
+                self.assertIn("imported 2 assignments in 2 batches", out.getvalue())
+                self.assertEqual(list(self.user.roles.all()), [self.role])
+                self.assertEqual(list(self.user2.roles.all()), [self.other])
+
+    def test_export_to_stdout(self):
+        out = StringIO()
+        call_command("rbaca_export", "--format", "jsonl", stdout=out, stderr=StringIO())
+
+        self.assertEqual(
+            [json.loads(line) for line in out.getvalue().splitlines()],
+            [{"user": "foo", "role": "role"}, {"user": "bar", "role": "other"}],
+        )
+
+    def test_import_stops_at_invalid_batch(self):
+        path = self.path("assignments.csv")
+
+        with open(path, "w") as file:
+            file.write("user,role\nbar,role\nfoo,other\n")
+
+        with self.assertRaisesMessage(CommandError, "incompatible"):
+            call_command("rbaca_import", path, "--batch-size", "1", stdout=StringIO())
+
+        with open(path, "w") as file:
+            file.write("user,role\nfoo,other\nbar,role\n")
+
+        with self.assertRaisesMessage(
+            CommandError, "(0 assignments in 0 batches were imported)"
+        ):
+            call_command("rbaca_import", path, "--batch-size", "2", stdout=StringIO())
+
+        self.assertEqual(list(self.user.roles.all()), [self.role])
+        self.assertEqual(list(self.user2.roles.all()), [self.other])
+
+    def test_import_unknown_user(self):
+        path = self.path("assignments.jsonl")
+
+        with open(path, "w") as file:
+            file.write(json.dumps({"user": "baz", "role": "role"}) + "\n")
+
+        with self.assertRaisesMessage(CommandError, "line 1: unknown user 'baz'"):
+            call_command("rbaca_import", path, stdout=StringIO())
+
+    def test_unknown_format(self):
+        with self.assertRaises(CommandError):
+            call_command("rbaca_export", self.path("assignments"), stdout=StringIO())
+
+
+class TestGenerateCommand(TestCase):
+    def generate(self, **options):
+        out = StringIO()
+        call_command(
+            "rbaca_generate",
+            roles=12,
+            depth=3,
+            cluster_size=2,
+            users=20,
+            roles_per_user=2,
+            sessions=0.5,
+            expirations=0.5,
+            chunk_size=7,
+            stdout=out,
+            **options
+        )
+        return out.getvalue()
+
+    def test_generate(self):
+        out = self.generate()
+
+        self.assertIn("created 12 roles in 4 hierarchies", out)
+        self.assertIn("created 20 of 20 users", out)
+        self.assertEqual(Role.objects.filter(senior_role__isnull=False).count(), 8)
+        self.assertEqual(Role.incompatible_roles.through.objects.count(), 4)
+        self.assertEqual(User.objects.count(), 20)
+        self.assertTrue(Session.objects.exists())
+        self.assertTrue(RoleExpiration.objects.exists())
+
+        for user in User.objects.prefetch_related("roles"):
+            self.assertTrue(Role.manage.check_role_compatibility(user.roles.all()))
+
+        for session in Session.objects.all():
+            self.assertEqual(
+                session.active_role_ids,
+                sorted(session.active_roles.values_list("id", flat=True)),
+            )
+
+    def test_generate_is_seeded(self):
+        self.generate(seed=3)
+        first = sorted(
+            User.roles.through.objects.values_list("user__username", "role__name")
+        )
+        User.objects.all().delete()
+        Role.objects.all().delete()
+        self.generate(seed=3)
+
+        self.assertEqual(
+            sorted(
+                User.roles.through.objects.values_list("user__username", "role__name")
+            ),
+            first,
+        )
+
+    def test_invalid_options(self):
+        with self.assertRaises(CommandError):
+            call_command(
+                "rbaca_generate", roles=3, depth=3, roles_per_user=2, stdout=StringIO()
+            )
+        with self.assertRaises(CommandError):
+            call_command("rbaca_generate", sessions=2, stdout=StringIO())
+
+    def test_generate_twice_fails(self):
+        self.generate()
+
+        with self.assertRaisesMessage(CommandError, "could not create the roles"):
+            self.generate()
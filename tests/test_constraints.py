@@ -0,0 +1,101 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+
+from rbaca import constraints
+from rbaca.cache import bump_policy_generation
+from rbaca.constraints import ConstraintEngine, get_constraint_engine
+from rbaca.models import Role
+
+
+class TestConstraintEngine(TestCase):
+    def setUp(self):
+        self.engine = ConstraintEngine([(1, 2), (2, 3), (4, 5)], role_ids=range(1, 8))
+
+    def test_is_conflict_free(self):
+        self.assertTrue(self.engine.is_conflict_free([1, 3, 4, 6]))
+        self.assertTrue(self.engine.is_conflict_free([]))
+        self.assertFalse(self.engine.is_conflict_free([1, 2]))
+        self.assertFalse(self.engine.is_conflict_free([3], [2, 6]))
+        self.assertTrue(self.engine.is_conflict_free([1], [3, 99]))
+
+    def test_get_conflicts(self):
+        self.assertEqual(
+            self.engine.get_conflicts([1, 2, 3, 4, 5]), [(1, 2), (2, 3), (4, 5)]
+        )
+        self.assertEqual(self.engine.get_conflicts([2], [1, 4]), [(1, 2)])
+        self.assertEqual(self.engine.get_conflicts([6, 7]), [])
+
+    def test_get_excluded_roles(self):
+        self.assertEqual(self.engine.get_excluded_roles([2, 6]), {1, 2, 3, 6})
+
+    def test_get_assignable_roles(self):
+        self.assertEqual(self.engine.get_assignable_roles([2]), {4, 5, 6, 7})
+        self.assertEqual(self.engine.get_assignable_roles([1, 4]), {3, 6, 7})
+
+    def test_load(self):
+        role1 = Role.objects.create(name="1")
+        role2 = Role.objects.create(name="2")
+        role3 = Role.objects.create(name="3")
+        role1.incompatible_roles.add(role2)
+
+        engine = ConstraintEngine.load()
+
+        self.assertFalse(engine.is_conflict_free([role2.id, role1.id]))
+        self.assertEqual(engine.get_assignable_roles([role1.id]), {role3.id})
+
+
+class TestGetConstraintEngine(TestCase):
+    def setUp(self):
+        self.role1 = Role.objects.create(name="1")
+        self.role2 = Role.objects.create(name="2")
+        self.role3 = Role.objects.create(name="3")
+        self.role1.incompatible_roles.add(self.role2)
+        constraints._engine = None
+
+    def tearDown(self):
+        constraints._engine = None
+
+    def test_loads_only_checked_roles_by_default(self):
+        engine = get_constraint_engine([self.role3.id])
+
+        self.assertIsNot(get_constraint_engine([self.role3.id]), engine)
+        self.assertTrue(engine.is_conflict_free([self.role1.id, self.role2.id]))
+        self.assertFalse(
+            get_constraint_engine([self.role1.id]).is_conflict_free(
+                [self.role1.id], [self.role2.id]
+            )
+        )
+
+    @override_settings(USE_CONSTRAINT_ENGINE_CACHE=True)
+    def test_not_shared_with_process_local_cache(self):
+        self.assertFalse(constraints._use_shared_engine())
+        self.assertIsNot(get_constraint_engine(), get_constraint_engine())
+
+    @override_settings(USE_CONSTRAINT_ENGINE_CACHE=True)
+    @mock.patch.object(constraints, "_use_shared_engine", return_value=True)
+    def test_not_shared_inside_transactions(self, use_shared_engine):
+        self.assertIsNot(get_constraint_engine(), get_constraint_engine())
+
+    @override_settings(USE_CONSTRAINT_ENGINE_CACHE=True)
+    @mock.patch.object(constraints, "_use_shared_engine", return_value=True)
+    def test_shared_until_policy_changes(self, use_shared_engine):
+        with mock.patch.object(
+            constraints.transaction, "get_connection"
+        ) as get_connection:
+            get_connection.return_value.in_atomic_block = False
+            engine = get_constraint_engine()
+
+            with self.assertNumQueries(0):
+                self.assertIs(get_constraint_engine([self.role3.id]), engine)
+
+            self.role2.incompatible_roles.add(self.role3)
+            changed_engine = get_constraint_engine()
+
+            self.assertIsNot(changed_engine, engine)
+            self.assertFalse(
+                changed_engine.is_conflict_free([self.role2.id, self.role3.id])
+            )
+
+            bump_policy_generation()
+            self.assertIsNot(get_constraint_engine(), changed_engine)
@@ -0,0 +1,167 @@
+from unittest import mock
+
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from rbaca.decisions import DecisionLog, flush_decisions, get_decision_log
+from rbaca.models import AccessDecision, Role, User
+
+
+class TestDecisionLog(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="foo")
+
+    def test_flush_in_batches(self):
+        decision_log = DecisionLog(batch_size=2, flush_interval=0)
+
+        for index in range(5):
+            decision_log.record(AccessDecision.PERMISSION, self.user.pk, index, True)
+
+        with self.assertNumQueries(3):
+            self.assertEqual(decision_log.flush(), 5)
+
+        self.assertEqual(AccessDecision.objects.count(), 5)
+        self.assertEqual(decision_log.flush(), 0)
+
+    def test_deny_only(self):
+        decision_log = DecisionLog(deny_only=True, flush_interval=0)
+
+        decision_log.record(AccessDecision.ROLE, self.user.pk, "foo", True)
+        decision_log.record(AccessDecision.ROLE, self.user.pk, "bar", False)
+        decision_log.flush()
+
+        self.assertEqual(
+            list(AccessDecision.objects.values_list("target", "granted")),
+            [("bar", False)],
+        )
+
+    def test_sample_rate(self):
+        decision_log = DecisionLog(sample_rate=0, flush_interval=0)
+
+        decision_log.record(AccessDecision.ROLE, self.user.pk, "foo", True)
+        decision_log.record(AccessDecision.ROLE, self.user.pk, "bar", False)
+
+        self.assertEqual([entry["target"] for entry in decision_log.buffer], ["bar"])
+
+    def test_back_pressure(self):
+        decision_log = DecisionLog(buffer_size=4, flush_interval=0)
+
+        for index in range(4):
+            decision_log.record(AccessDecision.ROLE, self.user.pk, index, True)
+
+        self.assertEqual(len(decision_log.buffer), 3)
+        self.assertEqual(decision_log.shed, 1)
+
+        for index in range(2):
+            decision_log.record(AccessDecision.ROLE, self.user.pk, "deny", False)
+
+        self.assertEqual(len(decision_log.buffer), 4)
+        self.assertEqual(decision_log.dropped, 1)
+        self.assertEqual(decision_log.buffer[0]["target"], "1")
+
+    def test_failed_write(self):
+        decision_log = DecisionLog(flush_interval=0)
+        decision_log.record(AccessDecision.ROLE, self.user.pk, "foo", False)
+
+        with mock.patch.object(
+            AccessDecision.objects, "bulk_create", side_effect=DatabaseError
+        ):
+            with self.assertLogs("rbaca.decisions", "ERROR"):
+                self.assertEqual(decision_log.flush(), 0)
+
+        self.assertEqual(decision_log.failed, 1)
+        self.assertEqual(len(decision_log.buffer), 0)
+
+    def test_concurrent_flush_does_not_block(self):
+        decision_log = DecisionLog(flush_interval=0)
+        decision_log.record(AccessDecision.ROLE, self.user.pk, "foo", False)
+
+        with decision_log.flush_lock:
+            self.assertEqual(decision_log.flush(), 0)
+
+        self.assertEqual(len(decision_log.buffer), 1)
+
+
+class TestDecisionLogging(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="foo", password="bar")
+        self.role = Role.objects.create(name="test_role_1")
+        self.user.roles.add(self.role)
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(get_decision_log())
+
+        self.user.has_role("test_role_1")
+
+        self.assertFalse(AccessDecision.objects.exists())
+
+    @override_settings(USE_DECISION_LOG=True, DECISION_LOG_FLUSH_INTERVAL=0)
+    def test_user_checks(self):
+        user = User.objects.get(pk=self.user.pk)
+
+        user.has_role("test_role_1")
+        user.has_perm("rbaca.view_role")
+        flush_decisions()
+
+        self.assertEqual(
+            sorted(AccessDecision.objects.values_list("kind", "target", "granted")),
+            [
+                (AccessDecision.PERMISSION, "rbaca.view_role", False),
+                (AccessDecision.ROLE, "test_role_1", True),
+            ],
+        )
+        self.assertEqual(AccessDecision.objects.filter(user=self.user).count(), 2)
+
+    @override_settings(
+        USE_DECISION_LOG=True,
+        DECISION_LOG_FLUSH_INTERVAL=0,
+        DECISION_LOG_DENY_ONLY=True,
+        ROOT_URLCONF="rbaca.urls",
+    )
+    def test_node_access(self):
+        user = User.objects.create_user(username="test", password="test")
+        user.roles.add(self.role)
+        client = APIClient(enforce_csrf_checks=True)
+        token = client.post(
+            "/get-node-access-token/",
+            {"username": "test", "password": "test"},
+            format="json",
+        ).data["token"]
+
+        for node in ("test_node_1", "test_node_2"):
+            client.post(
+                "/verify-node-access-token/",
+                {"token": token, "node": node},
+                format="json",
+            )
+
+        client.post(
+            "/verify-node-access-token/",
+            {"token": "fake-token", "node": "test_node_1"},
+            format="json",
+        )
+
+        self.assertEqual(
+            list(
+                AccessDecision.objects.order_by("id").values_list(
+                    "kind", "user_id", "target", "granted"
+                )
+            ),
+            [
+                (AccessDecision.NODE, user.pk, "test_node_2", False),
+                (AccessDecision.NODE, None, "test_node_1", False),
+            ],
+        )
+
+    @override_settings(USE_DECISION_LOG=True, DECISION_LOG_FLUSH_INTERVAL=0.01)
+    def test_background_flush(self):
+        decision_log = get_decision_log()
+
+        with mock.patch.object(decision_log, "flush") as flush:
+            decision_log.record(AccessDecision.ROLE, self.user.pk, "foo", False)
+            self.assertIsNotNone(decision_log.thread)
+            decision_log.stop()
+
+        self.assertTrue(flush.called)
+        self.assertFalse(decision_log.thread.is_alive())
@@ -1,8 +1,8 @@
 from django.contrib.auth.models import Permission
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from rbaca.forms import RoleExpirationForm, RoleForm, UserRoleForm
-from rbaca.models import Role, User
+from rbaca.models import Role, RoleExpiration, User
 
 
 class TestRoleForm(TestCase):
@@ -137,6 +137,22 @@ class TestRoleExpirationForm(TestCase):
 
         role_expiration.delete()
 
+    @override_settings(USE_ROLE_INHERITANCE=True)
+    def test_save_method_adding_senior_role_with_role_inheritance(self):
+        form_data = {
+            "role": self.senior_role.id,
+            "expiration_date": "2023-12-31",
+        }
+        form = RoleExpirationForm(user=self.user, data=form_data)
+        self.assertTrue(form.is_valid())
+
+        form.save()
+
+        self.assertQuerysetEqual(self.user.roles.all(), [self.senior_role])
+        self.assertEqual(RoleExpiration.objects.filter(user=self.user).count(), 1)
+        user = User.objects.get(pk=self.user.pk)
+        self.assertTrue(user.has_role(self.junior_role))
+
     def test_allow_superroles(self):
         assign_role = Permission.objects.get(codename="assign_role")
         assignable_role = Role.objects.create(name="assignable_role")
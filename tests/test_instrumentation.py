@@ -0,0 +1,117 @@
+from django.test import RequestFactory, TestCase, override_settings
+
+from rbaca.instrumentation import (
+    Histogram,
+    MetricsCollector,
+    Tracer,
+    get_tracer,
+    instrumented,
+)
+from rbaca.models import Role, Session, User
+from rbaca.views import metrics
+
+
+class RecordingTracer(Tracer):
+    def __init__(self):
+        self.records = []
+        self.caches = []
+
+    def record(self, operation, duration, queries, error=False):
+        self.records.append((operation, queries, error))
+
+    def cache(self, name, hit):
+        self.caches.append((name, hit))
+
+
+class TestHistogram(TestCase):
+    def test_observe(self):
+        histogram = Histogram(bounds=(0.1, 1.0))
+
+        for value in (0.05, 0.1, 0.5, 5):
+            histogram.observe(value)
+
+        self.assertEqual(histogram.counts, [2, 1, 1])
+        self.assertEqual(histogram.count, 4)
+        self.assertAlmostEqual(histogram.sum, 5.65)
+
+
+class TestInstrumentation(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="foo")
+        self.role = Role.objects.create(name="test_role_1")
+        self.user.roles.add(self.role)
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(get_tracer())
+
+    @override_settings(
+        USE_INSTRUMENTATION=True,
+        RBACA_TRACER="tests.test_instrumentation.RecordingTracer",
+    )
+    def test_custom_tracer(self):
+        tracer = get_tracer()
+        user = User.objects.get(pk=self.user.pk)
+
+        user.has_perm("rbaca.view_role")
+        user.has_perm("rbaca.view_role")
+
+        self.assertIsInstance(tracer, RecordingTracer)
+        self.assertEqual(
+            [record for record in tracer.records if record[0] == "backend.has_perm"],
+            [("backend.has_perm", 1, False), ("backend.has_perm", 0, False)],
+        )
+        self.assertEqual(
+            [cache for cache in tracer.caches if cache[0] == "all_permissions"],
+            [("all_permissions", False), ("all_permissions", True)],
+        )
+
+    @override_settings(USE_INSTRUMENTATION=True)
+    def test_errors_are_recorded(self):
+        @instrumented("failing")
+        def fail():
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            fail()
+
+        snapshot = get_tracer().snapshot()
+        self.assertEqual(snapshot["operations"]["failing"]["errors"], 1)
+
+    @override_settings(USE_INSTRUMENTATION=True, USE_SESSIONS=True)
+    def test_metrics_view(self):
+        Session.manage.add_session(self.user, self.role)
+        user = User.objects.get(pk=self.user.pk)
+        user.has_role("test_role_1")
+        user.get_active_session()
+
+        response = metrics(RequestFactory().get("/metrics"))
+        content = response.content.decode()
+
+        self.assertEqual(response["Content-Type"], "text/plain; version=0.0.4")
+        self.assertIn(
+            'rbaca_operation_calls_total{operation="backend.has_role"} 1', content
+        )
+        self.assertIn(
+            'rbaca_operation_duration_seconds_count{operation="backend.has_role"} 1',
+            content,
+        )
+        self.assertIn('rbaca_cache_hits_total{cache="session"} 1', content)
+        self.assertIn(
+            'rbaca_operation_duration_seconds_bucket{operation="backend.has_role",le="+Inf"} 1',
+            content,
+        )
+
+    def test_metrics_view_disabled(self):
+        from django.http import Http404
+
+        with self.assertRaises(Http404):
+            metrics(RequestFactory().get("/metrics"))
+
+    @override_settings(USE_INSTRUMENTATION=True)
+    def test_reset(self):
+        tracer = get_tracer()
+        tracer.record("operation", 0.1, 2)
+        tracer.reset()
+
+        self.assertEqual(tracer.snapshot(), {"operations": {}, "caches": {}})
+        self.assertIsInstance(tracer, MetricsCollector)
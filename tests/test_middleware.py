@@ -0,0 +1,68 @@
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+
+from rbaca.middleware import AuthorizationProfilerMiddleware
+from rbaca.models import Role, User
+
+
+def view(request):
+    request.user.has_perm("rbaca.view_role")
+    request.user.has_perm("rbaca.view_role")
+    template = Template("{% load rbaca_tags %}{% has_role user 'role' %}")
+    return HttpResponse(template.render(Context({"user": request.user})))
+
+
+@override_settings(
+    DEBUG=True,
+    TEMPLATES=[{"BACKEND": "django.template.backends.django.DjangoTemplates"}],
+)
+class TestAuthorizationProfilerMiddleware(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="foo")
+        self.role = Role.objects.create(name="role")
+        self.user.roles.add(self.role)
+        self.request = RequestFactory().get("/")
+        self.request.user = User.objects.get(pk=self.user.pk)
+
+    def test_profile(self):
+        with self.assertLogs("rbaca.profiler", "DEBUG") as logs:
+            response = AuthorizationProfilerMiddleware(view)(self.request)
+
+        profile = self.request.rbaca_profile
+        first, second, tag = profile.calls
+
+        self.assertEqual(
+            [call.operation for call in profile.calls],
+            ["user.has_perm", "user.has_perm", "user.has_role"],
+        )
+        self.assertEqual(first.arguments, "'rbaca.view_role'")
+        self.assertTrue(first.caller.startswith("tests.test_middleware.view:"))
+        self.assertEqual(first.cache_status, "miss")
+        self.assertEqual(len(first.queries), 1)
+        self.assertEqual(second.cache_status, "hit")
+        self.assertEqual(second.queries, [])
+        self.assertTrue(
+            tag.caller.startswith("rbaca.templatetags.rbaca_tags.has_role:")
+        )
+        self.assertTrue(tag.result)
+        self.assertEqual(profile.get_repeated_calls(), [(first, 2, 0)])
+        self.assertEqual(
+            response["X-Rbaca-Profile"],
+            profile.summary(),
+        )
+        self.assertIn("3 checks, 2 queries", profile.summary())
+        self.assertIn("1 repeated checks with 0 avoidable queries", profile.summary())
+        self.assertIn("repeated 2x: user.has_perm('rbaca.view_role')", logs.output[0])
+
+    def test_profile_is_request_local(self):
+        AuthorizationProfilerMiddleware(view)(self.request)
+        self.user.has_perm("rbaca.view_role")
+
+        self.assertEqual(len(self.request.rbaca_profile.calls), 3)
+
+    @override_settings(DEBUG=False)
+    def test_disabled_without_debug(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            AuthorizationProfilerMiddleware(view)
@@ -1,12 +1,22 @@
 from datetime import datetime, timedelta
+from unittest import mock, skipUnless
 from uuid import UUID
 
 from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, connection
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import now
 
-from rbaca.models import Role, RoleExpiration, Session, User
+from rbaca.models import (
+    EffectivePermission,
+    Role,
+    RoleExpiration,
+    RoleValidity,
+    Session,
+    User,
+)
 
 
 class TestRoleModel(TestCase):
@@ -45,6 +55,152 @@ class TestRoleModel(TestCase):
         Role.manage.delete_role(self.senior_role.name)
         self.assertFalse(Role.objects.filter(name="senior"))
 
+    def test_role_manager_bulk_assign(self):
+        users = [self.user, User.objects.create(username="bar")]
+
+        with self.assertNumQueries(4):
+            Role.manage.bulk_assign(users, [self.senior_role, self.junior_role])
+
+        for user in users:
+            self.assertEqual(
+                set(user.roles.all()), {self.senior_role, self.junior_role}
+            )
+
+        Role.manage.bulk_assign(User.objects.all(), self.junior_role)
+        self.assertEqual(self.junior_role.roles.count(), 2)
+
+    def test_role_manager_bulk_assign_invalid(self):
+        self.user.roles.add(self.incompatible_role)
+        user2 = User.objects.create(username="bar")
+
+        with self.assertRaises(ValueError):
+            Role.manage.bulk_assign([user2], self.senior_role)
+        with self.assertRaisesMessage(
+            ValueError,
+            "role 'junior' is incompatible with 'beaver' for user with id '%s'."
+            % self.user.pk,
+        ):
+            Role.manage.bulk_assign([self.user, user2], self.junior_role)
+        with self.assertRaises(ValueError):
+            Role.manage.bulk_assign([user2], "senior")
+
+        self.assertFalse(user2.roles.exists())
+
+    @override_settings(USE_ROLE_INHERITANCE=True)
+    def test_role_manager_bulk_assign_with_role_inheritance(self):
+        Role.manage.bulk_assign([self.user], self.senior_role)
+        self.assertEqual(set(self.user.roles.all()), {self.senior_role})
+
+    def test_role_manager_bulk_assign_reads_only_batch_roles(self):
+        Role.objects.bulk_create(Role(name="other_%s" % index) for index in range(5))
+
+        for inheritance in (False, True):
+            with override_settings(
+                USE_ROLE_INHERITANCE=inheritance
+            ), CaptureQueriesContext(connection) as context:
+                Role.manage.bulk_assign(
+                    [self.user], [self.senior_role, self.junior_role]
+                )
+
+            role_queries = [
+                query["sql"]
+                for query in context.captured_queries
+                if query["sql"].startswith("SELECT")
+                and 'FROM "rbaca_role" ' in query["sql"] + " "
+            ]
+            self.assertTrue(role_queries)
+            for sql in role_queries:
+                self.assertIn("WHERE", sql)
+
+            self.user.roles.clear()
+
+        user2 = User.objects.create(username="bar")
+        self.user.roles.add(self.junior_role)
+
+        Role.manage.bulk_assign_user_roles(
+            {
+                self.user.pk: [self.senior_role.pk],
+                user2.pk: [self.incompatible_role.pk],
+            }
+        )
+
+        self.assertEqual(
+            set(self.user.roles.all()), {self.senior_role, self.junior_role}
+        )
+        self.assertEqual(set(user2.roles.all()), {self.incompatible_role})
+
+    def test_role_manager_bulk_assign_user_roles_invalid(self):
+        self.user.roles.add(self.incompatible_role)
+        user2 = User.objects.create(username="bar")
+
+        for user_role_ids in (
+            {user2.pk: [self.senior_role.pk]},
+            {self.user.pk: [self.junior_role.pk]},
+            {user2.pk: [self.junior_role.pk, self.incompatible_role.pk]},
+            {user2.pk: [0]},
+        ):
+            with self.subTest(user_role_ids=user_role_ids), self.assertRaises(
+                ValueError
+            ):
+                Role.manage.bulk_assign_user_roles(user_role_ids)
+
+        self.assertFalse(user2.roles.exists())
+
+    @override_settings(USE_ROLE_INHERITANCE=True)
+    def test_role_manager_bulk_assign_user_roles_with_role_inheritance(self):
+        Role.manage.bulk_assign_user_roles({self.user.pk: [self.senior_role.pk]})
+        self.assertEqual(set(self.user.roles.all()), {self.senior_role})
+
+        with self.assertRaises(ValueError):
+            Role.manage.bulk_assign_user_roles(
+                {self.user.pk: [self.incompatible_role.pk]}
+            )
+
+    def test_role_manager_bulk_deassign(self):
+        user2 = User.objects.create(username="bar")
+        Role.manage.bulk_assign(
+            [self.user, user2], [self.senior_role, self.junior_role]
+        )
+        Role.manage.bulk_deassign(User.objects.all(), self.junior_role)
+
+        self.assertFalse(self.user.roles.exists())
+        self.assertFalse(user2.roles.exists())
+
+    def test_role_manager_get_senior_role_ids(self):
+        self.assertEqual(
+            Role.manage.get_senior_role_ids([self.junior_role.id]),
+            {self.junior_role.id, self.senior_role.id},
+        )
+
+    def test_role_manager_check_role_compatibility(self):
+        self.assertTrue(
+            Role.manage.check_role_compatibility([self.senior_role, self.junior_role])
+        )
+
+        with self.assertNumQueries(2):
+            compatibility = Role.manage.check_role_compatibility(
+                [self.senior_role, self.incompatible_role]
+            )
+
+        self.assertFalse(compatibility)
+        self.assertEqual(
+            compatibility.incompatible_pairs,
+            [(self.senior_role, self.incompatible_role)],
+        )
+        self.assertEqual(compatibility.missing_junior_roles, [self.junior_role])
+        self.assertEqual(
+            str(compatibility),
+            "role 'senior' is incompatible with 'beaver'; "
+            "junior roles 'junior' are missing",
+        )
+
+    def test_role_manager_check_role_compatibility_skip_checks(self):
+        roles = [self.senior_role, self.incompatible_role]
+
+        self.assertFalse(Role.manage.check_role_compatibility(roles, False, True))
+        self.assertFalse(Role.manage.check_role_compatibility(roles, True, False))
+        self.assertTrue(Role.manage.check_role_compatibility(roles, False, False))
+
     def test_role_assigned_users(self):
         self.user2 = User.objects.create(username="bar")
         self.user.roles.set([self.senior_role, self.junior_role])
@@ -147,6 +303,36 @@ class TestRoleModel(TestCase):
         senior_roles = self.junior_role.get_all_senior_roles()
         self.assertEqual(set(senior_roles), {self.senior_role})
 
+    def test_role_manager_get_junior_closure(self):
+        junior_junior_role = Role.objects.create(
+            name="junior_junior", senior_role=self.junior_role
+        )
+        closure = Role.manage.get_junior_closure(
+            [self.senior_role.id, self.junior_role.id, self.incompatible_role.id]
+        )
+
+        self.assertEqual(
+            closure,
+            {
+                self.senior_role.id: {
+                    self.senior_role.id,
+                    self.junior_role.id,
+                    junior_junior_role.id,
+                },
+                self.junior_role.id: {self.junior_role.id, junior_junior_role.id},
+                self.incompatible_role.id: {self.incompatible_role.id},
+            },
+        )
+
+    @override_settings(USE_ROLE_INHERITANCE=True)
+    def test_role_manager_check_role_compatibility_with_role_inheritance(self):
+        self.assertTrue(Role.manage.check_role_compatibility([self.senior_role]))
+        self.assertFalse(
+            Role.manage.check_role_compatibility(
+                [self.senior_role, self.incompatible_role]
+            )
+        )
+
     def test_role_to_str(self):
         self.assertEqual(str(self.junior_role), "junior")
 
@@ -163,11 +349,12 @@ class TestSessionModel(TestCase):
             ]
         )
 
-        User.objects.create(username="foo")
+        user = User.objects.create(username="foo")
         role1 = Role.objects.create(name="1")
         role1.grant_perms(permissions[:2])
         role2 = Role.objects.create(name="2")
         role2.grant_perms(permissions[2:4])
+        user.roles.add(role1, role2)
 
     def setUp(self) -> None:
         self.permissions = Permission.objects.filter(
@@ -200,12 +387,138 @@ class TestSessionModel(TestCase):
 
         self.assertEqual(Session.objects.all().count(), 0)
 
+    def test_session_manager_active_and_timed_out_sessions(self):
+        active = Session.manage.add_session(self.user)
+        timed_out = Session.manage.add_session(self.user)
+        Session.objects.filter(pk=timed_out.pk).update(
+            date_start=now() - timedelta(seconds=7200)
+        )
+        closed = Session.manage.add_session(self.user)
+        closed.close()
+
+        self.assertQuerysetEqual(Session.manage.get_active_sessions(), [active])
+        self.assertQuerysetEqual(Session.manage.get_timed_out_sessions(), [timed_out])
+
+    def test_session_manager_close_timed_out_sessions(self):
+        date_start = now() - timedelta(seconds=7200)
+        sessions = [Session.manage.add_session(self.user) for _ in range(3)]
+        Session.objects.filter(pk__in=[session.pk for session in sessions]).update(
+            date_start=date_start
+        )
+        active = Session.manage.add_session(self.user)
+
+        with self.assertNumQueries(5):
+            self.assertEqual(Session.manage.close_timed_out_sessions(chunk_size=2), 3)
+
+        for session in sessions:
+            session.refresh_from_db()
+            self.assertEqual(session.date_end, date_start + timedelta(seconds=3600))
+
+        active.refresh_from_db()
+        self.assertIsNone(active.date_end)
+
     def test_session_add_active_roles(self):
         session = Session.manage.add_session(self.user)
         session.add_active_roles(self.role1)
 
         self.assertTrue(self.role1 in session.active_roles.all())
 
+    def test_superuser_activates_roles_not_held(self):
+        superuser = User.objects.create(username="admin", is_superuser=True)
+        session = Session.manage.add_session(superuser, [self.role1])
+        self.assertQuerysetEqual(session.active_roles.all(), [self.role1])
+
+        self.role2.incompatible_roles.add(self.role1)
+
+        with self.assertRaises(ValueError):
+            session.add_active_roles(self.role2)
+
+        superuser.is_active = False
+        superuser.save()
+
+        with self.assertRaises(ValueError):
+            Session.manage.add_session(superuser, [self.role1])
+
+    def test_session_add_active_roles_validates_whole_set(self):
+        role3 = Role.objects.create(name="3")
+        session = Session.manage.add_session(self.user, self.role1)
+
+        with self.assertRaises(ValueError):
+            session.add_active_roles([self.role2, role3])
+
+        self.user.roles.add(role3)
+        self.role2.incompatible_roles.add(self.role1)
+
+        with self.assertRaises(ValueError):
+            session.add_active_roles([self.role2, role3])
+
+        self.assertQuerysetEqual(session.active_roles.all(), [self.role1])
+
+        with self.assertNumQueries(5):
+            session.add_active_roles(role3)
+
+        self.assertQuerysetEqual(
+            session.active_roles.order_by("id"), [self.role1, role3]
+        )
+
+    def test_session_manager_add_session_validates_roles(self):
+        role3 = Role.objects.create(name="3")
+
+        with self.assertRaises(ValueError):
+            Session.manage.add_session(self.user, [self.role1, role3])
+
+        self.role2.incompatible_roles.add(self.role1)
+
+        with self.assertRaises(ValueError):
+            Session.manage.add_session(self.user, [self.role1, self.role2])
+
+        self.assertFalse(Session.objects.exists())
+
+    def test_session_active_role_ids_not_synced_by_default(self):
+        session = Session.manage.add_session(self.user, [self.role1])
+        session.refresh_from_db()
+
+        self.assertEqual(session.active_role_ids, [])
+        self.assertEqual(session.active_roles_version, 0)
+
+    def test_sync_active_role_ids(self):
+        session = Session.manage.add_session(self.user, [self.role2, self.role1])
+        synced = Session.manage.add_session(self.user)
+        closed = Session.manage.add_session(self.user, [self.role1])
+        closed.close()
+
+        with self.assertNumQueries(3):
+            self.assertEqual(Session.manage.sync_active_role_ids(chunk_size=3), 1)
+
+        session.refresh_from_db()
+        self.assertEqual(session.active_role_ids, [self.role1.id, self.role2.id])
+        self.assertEqual(session.active_roles_version, 1)
+        synced.refresh_from_db()
+        self.assertEqual(synced.active_roles_version, 0)
+        closed.refresh_from_db()
+        self.assertEqual(closed.active_role_ids, [])
+
+    @override_settings(USE_SESSION_ROLE_IDS=True)
+    def test_session_active_role_ids(self):
+        session = Session.manage.add_session(self.user, [self.role2, self.role1])
+        self.assertEqual(session.active_role_ids, [self.role1.id, self.role2.id])
+
+        session.drop_active_roles(self.role1)
+        self.assertEqual(session.active_role_ids, [self.role2.id])
+
+        self.role2.session_set.clear()
+        session.refresh_from_db()
+        self.assertEqual(session.active_role_ids, [])
+        self.assertEqual(session.active_roles_version, 3)
+
+        self.role1.session_set.add(session)
+        session.refresh_from_db()
+        self.assertEqual(session.active_role_ids, [self.role1.id])
+
+        session.close()
+        session.refresh_from_db()
+        self.assertEqual(session.active_role_ids, [self.role1.id])
+
     def test_session_add_active_roles_string(self):
         session = Session.manage.add_session(self.user)
 
@@ -287,13 +600,30 @@ class TestRoleExpirationModel(TestCase):
         self.assertEqual(role_expiration.role, self.role)
         self.assertEqual(role_expiration.expiration_date, expiration_date)
 
+    def test_role_expiration_manager_add_role_expiration_replaces(self):
+        expiration_date = now()
+        first = RoleExpiration.manage.add_role_expiration(
+            self.user, self.role, expiration_date - timedelta(days=1)
+        )
+        second = RoleExpiration.manage.add_role_expiration(
+            self.user, self.role, expiration_date
+        )
+
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(RoleExpiration.objects.count(), 1)
+        self.assertEqual(
+            RoleExpiration.objects.get().expiration_date, expiration_date.date()
+        )
+
     def test_role_expiration_manager_get_expired_roles(self):
         expiration_date = now()
         expired = RoleExpiration.manage.add_role_expiration(
             self.user, self.role, expiration_date - timedelta(days=1)
         )
         not_expired = RoleExpiration.manage.add_role_expiration(
-            self.user, self.role, expiration_date + timedelta(days=1)
+            self.user,
+            Role.objects.create(name="other"),
+            expiration_date + timedelta(days=1),
         )
 
         all_expired = RoleExpiration.manage.get_expired_roles()
@@ -313,6 +643,61 @@ class TestRoleExpirationModel(TestCase):
 
         self.assertQuerysetEqual(self.user.roles.all(), Role.objects.none())
 
+    def test_role_expiration_manager_remove_expired_roles_senior_roles(self):
+        senior_role = Role.objects.create(name="senior")
+        top_role = Role.objects.create(name="top")
+        other_role = Role.objects.create(name="other")
+        self.role.set_senior_role(senior_role)
+        senior_role.set_senior_role(top_role)
+        users = [User.objects.create(username="user%d" % i) for i in range(5)]
+        expired_date = now() - timedelta(days=1)
+
+        for user in users:
+            user.roles.add(self.role, senior_role, top_role, other_role)
+            RoleExpiration.manage.add_role_expiration(user, self.role, expired_date)
+        RoleExpiration.manage.add_role_expiration(
+            users[0], other_role, now() + timedelta(days=1)
+        )
+
+        with CaptureQueriesContext(connection) as context:
+            removed = RoleExpiration.manage.remove_expired_roles(chunk_size=2)
+
+        statements = [
+            query["sql"]
+            for query in context.captured_queries
+            if not query["sql"].startswith(("SAVEPOINT", "RELEASE SAVEPOINT"))
+        ]
+        self.assertEqual(len(statements), 11)
+        self.assertEqual(removed, 5)
+        self.assertEqual(RoleExpiration.objects.count(), 1)
+
+        for user in users:
+            self.assertQuerysetEqual(user.roles.all(), [other_role])
+
+    def test_remove_role_expirations_deletes_groups_in_batches(self):
+        roles = [Role.objects.create(name="expiring%d" % i) for i in range(5)]
+        users = [User.objects.create(username="user%d" % i) for i in range(5)]
+        expired_date = now() - timedelta(days=1)
+
+        for user, role in zip(users, roles):
+            user.roles.add(role)
+            RoleExpiration.manage.add_role_expiration(user, role, expired_date)
+
+        with mock.patch.object(
+            RoleExpiration.manage, "delete_batch_size", 2
+        ), CaptureQueriesContext(connection) as context:
+            self.assertEqual(RoleExpiration.manage.remove_expired_roles(), 5)
+
+        deletes = [
+            query["sql"]
+            for query in context.captured_queries
+            if query["sql"].startswith('DELETE FROM "rbaca_user_roles"')
+        ]
+        self.assertEqual(len(deletes), 3)
+
+        for user in users:
+            self.assertFalse(user.roles.exists())
+
     def test_role_expiration_uuid_generation(self):
         expiration_date = now()
         role_expiration = RoleExpiration.manage.add_role_expiration(
@@ -329,6 +714,196 @@ class TestRoleExpirationModel(TestCase):
         self.assertEqual(get_by_uuid, role_expiration)
 
 
+class TestRoleValidityModel(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="foo")
+        self.role = Role.objects.create(name="role")
+        self.other_role = Role.objects.create(name="other")
+
+    def test_role_validity_manager_set_validity(self):
+        valid_until = now() + timedelta(days=1)
+        RoleValidity.manage.set_validity(self.user, "role", valid_until=valid_until)
+        role_validity = RoleValidity.manage.set_validity(
+            self.user, self.role, valid_from=valid_until
+        )
+
+        self.assertEqual(RoleValidity.objects.count(), 1)
+        self.assertEqual(role_validity.role, self.role)
+        self.assertEqual(role_validity.valid_from, valid_until)
+        self.assertIsNone(role_validity.valid_until)
+
+    def test_role_validity_manager_get_invalid_role_ids(self):
+        current_time = now()
+        RoleValidity.manage.set_validity(self.user, self.role, valid_until=current_time)
+        RoleValidity.manage.set_validity(
+            self.user,
+            self.other_role,
+            valid_from=current_time - timedelta(days=1),
+            valid_until=current_time + timedelta(days=1),
+        )
+
+        self.assertEqual(
+            list(RoleValidity.manage.get_invalid_role_ids(self.user, current_time)),
+            [{"role_id": self.role.id}],
+        )
+
+    def test_role_validity_manager_get_next_boundary(self):
+        current_time = now()
+        self.assertIsNone(RoleValidity.manage.get_next_boundary(self.user))
+
+        RoleValidity.manage.set_validity(
+            self.user, self.role, valid_until=current_time + timedelta(days=2)
+        )
+        RoleValidity.manage.set_validity(
+            self.user,
+            self.other_role,
+            valid_from=current_time - timedelta(days=1),
+            valid_until=current_time + timedelta(days=3),
+        )
+        self.assertEqual(
+            RoleValidity.manage.get_next_boundary(self.user, current_time),
+            current_time + timedelta(days=2),
+        )
+
+
+@override_settings(USE_EFFECTIVE_PERMISSIONS=True)
+class TestEffectivePermissionModel(TestCase):
+    @classmethod
+    def setUpTestData(cls) -> None:
+        content_type = ContentType.objects.get_for_model(Role)
+        Permission.objects.create(
+            name="test", content_type=content_type, codename="test_role"
+        )
+        Permission.objects.create(
+            name="test2", content_type=content_type, codename="test_role2"
+        )
+        User.objects.create(username="foo")
+        User.objects.create(username="bar")
+
+    def setUp(self) -> None:
+        self.perm = Permission.objects.get(codename="test_role")
+        self.perm2 = Permission.objects.get(codename="test_role2")
+        self.user = User.objects.get(username="foo")
+        self.user2 = User.objects.get(username="bar")
+        self.role = Role.objects.create(name="role")
+        self.role.grant_perms(self.perm)
+
+    def effective_permissions(self, user):
+        return set(
+            EffectivePermission.objects.filter(user=user).values_list(
+                "permission__codename", flat=True
+            )
+        )
+
+    def test_assign_and_deassign_roles(self):
+        self.user.assign_roles(self.role)
+        self.assertEqual(self.effective_permissions(self.user), {"test_role"})
+
+        self.user.deassign_roles(self.role)
+        self.assertEqual(self.effective_permissions(self.user), set())
+
+    def test_reverse_assignment(self):
+        self.role.roles.add(self.user, self.user2)
+        self.assertEqual(self.effective_permissions(self.user2), {"test_role"})
+
+        self.role.roles.clear()
+        self.assertEqual(self.effective_permissions(self.user), set())
+        self.assertEqual(self.effective_permissions(self.user2), set())
+
+    def test_grant_and_revoke_perms(self):
+        self.user.roles.add(self.role)
+        self.role.grant_perms(self.perm2)
+        self.assertEqual(
+            self.effective_permissions(self.user), {"test_role", "test_role2"}
+        )
+
+        self.role.revoke_perms(self.perm)
+        self.assertEqual(self.effective_permissions(self.user), {"test_role2"})
+
+    def test_permission_kept_by_other_role(self):
+        role2 = Role.objects.create(name="role2")
+        role2.grant_perms(self.perm)
+        self.user.roles.add(self.role, role2)
+        self.user.roles.remove(self.role)
+
+        self.assertEqual(self.effective_permissions(self.user), {"test_role"})
+
+    def test_delete_role(self):
+        self.user.roles.add(self.role)
+        Role.manage.delete_role(self.role)
+
+        self.assertEqual(self.effective_permissions(self.user), set())
+
+    def test_refresh_users(self):
+        self.user.roles.add(self.role)
+        EffectivePermission.objects.all().delete()
+        EffectivePermission.objects.create(user=self.user2, permission=self.perm2)
+
+        self.assertEqual(
+            EffectivePermission.manage.refresh_users(
+                [self.user.pk, self.user2.pk], dry_run=True
+            ),
+            (1, 1),
+        )
+        self.assertEqual(self.effective_permissions(self.user), set())
+
+        self.assertEqual(
+            EffectivePermission.manage.refresh_users([self.user.pk, self.user2.pk]),
+            (1, 1),
+        )
+        self.assertEqual(self.effective_permissions(self.user), {"test_role"})
+        self.assertEqual(self.effective_permissions(self.user2), set())
+
+    def test_refresh_users_deletes_stale_rows_in_batches(self):
+        EffectivePermission.objects.bulk_create(
+            EffectivePermission(user=user, permission=perm)
+            for user in (self.user, self.user2)
+            for perm in (self.perm, self.perm2)
+        )
+
+        with mock.patch.object(
+            EffectivePermission.manage, "chunk_size", 2
+        ), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(
+                EffectivePermission.manage.refresh_users([self.user.pk, self.user2.pk]),
+                (0, 4),
+            )
+
+        deletes = [
+            query["sql"] for query in queries if query["sql"].startswith("DELETE")
+        ]
+        self.assertEqual(len(deletes), 2)
+        self.assertFalse(EffectivePermission.objects.exists())
+
+    @override_settings(USE_ROLE_INHERITANCE=True)
+    def test_role_inheritance(self):
+        senior_role = Role.objects.create(name="senior")
+        self.user.roles.add(senior_role)
+        self.role.set_senior_role(senior_role)
+        self.assertEqual(self.effective_permissions(self.user), {"test_role"})
+
+        self.role.grant_perms(self.perm2)
+        self.assertEqual(
+            self.effective_permissions(self.user), {"test_role", "test_role2"}
+        )
+
+        self.role.senior_role = None
+        self.role.save()
+        self.assertEqual(self.effective_permissions(self.user), set())
+
+    def test_bulk_assign_and_deassign(self):
+        Role.manage.bulk_assign([self.user, self.user2], self.role)
+        self.assertEqual(self.effective_permissions(self.user2), {"test_role"})
+
+        Role.manage.bulk_deassign([self.user, self.user2], self.role)
+        self.assertEqual(self.effective_permissions(self.user2), set())
+
+    @override_settings(USE_EFFECTIVE_PERMISSIONS=False)
+    def test_disabled(self):
+        self.user.roles.add(self.role)
+        self.assertFalse(EffectivePermission.objects.exists())
+
+
 class TestRoleMixinModel(TestCase):
     @classmethod
     def setUpTestData(cls) -> None:
@@ -395,6 +970,23 @@ class TestRoleMixinModel(TestCase):
         self.assertTrue(junior_role in self.user.roles.all())
         self.assertTrue(senior_role in self.user.roles.all())
 
+    @override_settings(USE_ROLE_INHERITANCE=True)
+    def test_role_mixin_assign_roles_with_role_inheritance(self):
+        junior_role = Role.manage.add_role("junior_role")
+        senior_role = Role.manage.add_role("senior_role")
+        incompatible_role = Role.manage.add_role("incompatible_role")
+
+        junior_role.set_senior_role(senior_role)
+        incompatible_role.set_incompatible_roles([junior_role])
+
+        self.user.assign_roles(senior_role)
+
+        with self.assertRaises(ValueError):
+            self.user.assign_roles(incompatible_role)
+
+        self.assertTrue(senior_role in self.user.roles.all())
+        self.assertFalse(junior_role in self.user.roles.all())
+
     def test_role_mixin_deassign_roles(self):
         junior_role_1 = Role.manage.add_role("junior_role_1")
         junior_role_2 = Role.manage.add_role("junior_role_2")
@@ -445,7 +1037,12 @@ class TestRoleMixinModel(TestCase):
     def test_role_mixin_get_active_session_old_session(self):
         self.session.date_start = datetime(1980, 1, 1, 1, 1, 1)
         self.session.save()
-        self.assertEqual(None, self.user.get_active_session())
+
+        with self.assertNumQueries(1):
+            self.assertEqual(None, self.user.get_active_session())
+
+        self.session.refresh_from_db()
+        self.assertIsNone(self.session.date_end)
 
     def test_role_mixin_has_role(self):
         self.assertTrue(self.user.has_role("test_role"))
@@ -581,3 +1178,39 @@ class TestRoleMixinModel(TestCase):
     @override_settings(USE_SESSIONS=True)
     def test_role_mixin_has_module_perms_superuser_session_based(self):
         self.assertTrue(self.user.has_module_perms("rbaca"))
+
+
+@skipUnless(connection.vendor == "sqlite", "query plans are checked on SQLite")
+class TestQueryPlans(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="foo")
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn("INDEX %s" % index_name, plan)
+
+    def test_active_session_query(self):
+        self.assertUsesIndex(
+            Session.manage.get_active_sessions().filter(user=self.user),
+            "rbaca_session_active_idx",
+        )
+
+    def test_expired_roles_query(self):
+        self.assertUsesIndex(
+            RoleExpiration.manage.get_expired_roles().order_by("expiration_date", "id"),
+            "rbaca_roleexpiration_date_idx",
+        )
+
+    def test_junior_roles_query(self):
+        self.assertUsesIndex(
+            Role.objects.filter(senior_role_id__in=[1, 2]), "rbaca_role_senior_role_id"
+        )
+
+    def test_role_expiration_unique(self):
+        role = Role.objects.create(name="role")
+        RoleExpiration.objects.create(user=self.user, role=role, expiration_date=now())
+
+        with self.assertRaises(IntegrityError):
+            RoleExpiration.objects.create(
+                user=self.user, role=role, expiration_date=now()
+            )
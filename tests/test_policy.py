@@ -0,0 +1,184 @@
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+
+from rbaca.models import Role
+from rbaca.policy import (
+    PolicyDiff,
+    PolicyError,
+    apply_policy_diff,
+    dump_policy,
+    load_policy,
+    parse_policy,
+)
+
+
+class TestParsePolicy(TestCase):
+    def test_incompatibilities_are_symmetric(self):
+        state = parse_policy(
+            {"roles": [{"name": "a", "incompatible_roles": ["b"]}, {"name": "b"}]}
+        )
+
+        self.assertEqual(state["roles"]["b"]["incompatible_roles"], {"a"})
+
+    def test_junior_roles_inherit_incompatible_roles(self):
+        state = parse_policy(
+            {
+                "roles": [
+                    {"name": "a", "senior_role": "b"},
+                    {"name": "b", "senior_role": "c"},
+                    {"name": "c", "incompatible_roles": ["d"]},
+                    {"name": "d"},
+                ]
+            }
+        )
+
+        self.assertEqual(state["roles"]["a"]["incompatible_roles"], {"d"})
+        self.assertEqual(state["roles"]["d"]["incompatible_roles"], {"a", "b", "c"})
+
+    def test_invalid_policies(self):
+        for document in (
+            [],
+            {"roles": [{}]},
+            {"roles": [{"name": "a"}, {"name": "a"}]},
+            {"roles": [{"name": "a", "permissions": ["codename"]}]},
+            {"roles": [{"name": "a", "permissions": [1]}]},
+            {"roles": [{"name": "a", "senior_role": "b"}]},
+            {"roles": [{"name": "a", "incompatible_roles": ["b"]}]},
+            {
+                "roles": [
+                    {"name": "a", "senior_role": "b"},
+                    {"name": "b", "senior_role": "a"},
+                ]
+            },
+            {
+                "roles": [
+                    {"name": "a", "senior_role": "b", "incompatible_roles": ["b"]},
+                    {"name": "b"},
+                ]
+            },
+            {
+                "roles": [
+                    {"name": "a", "senior_role": "b"},
+                    {"name": "b", "senior_role": "c"},
+                    {"name": "c", "incompatible_roles": ["a"]},
+                ]
+            },
+        ):
+            with self.subTest(document=document), self.assertRaises(PolicyError):
+                parse_policy(document)
+
+
+class TestLoadPolicy(TestCase):
+    def setUp(self):
+        self.role = Role.objects.create(name="role")
+        self.senior_role = Role.objects.create(name="senior")
+        self.other = Role.objects.create(name="other")
+        self.senior_role.set_incompatible_roles(self.other)
+        self.role.set_senior_role(self.senior_role)
+        self.role.permissions.add(Permission.objects.get(codename="view_role"))
+
+    def test_load_policy(self):
+        with self.assertNumQueries(3):
+            state = load_policy()
+
+        self.assertEqual(
+            dump_policy(state)["roles"][1],
+            {
+                "name": "role",
+                "permissions": ["rbaca.view_role"],
+                "senior_role": "senior",
+                "incompatible_roles": ["other"],
+            },
+        )
+        self.assertEqual(
+            state["roles"]["other"]["incompatible_roles"], {"role", "senior"}
+        )
+
+    def test_round_trip_has_no_changes(self):
+        state = load_policy()
+
+        self.assertFalse(PolicyDiff(state, parse_policy(dump_policy(state)), True))
+
+
+class TestApplyPolicyDiff(TestCase):
+    document = {
+        "roles": [
+            {"name": "clerk", "senior_role": "manager"},
+            {"name": "manager", "senior_role": "director"},
+            {
+                "name": "director",
+                "permissions": ["rbaca.view_role"],
+                "incompatible_roles": ["auditor"],
+            },
+            {"name": "auditor"},
+        ]
+    }
+
+    def build_through_api(self):
+        clerk = Role.manage.add_role("clerk")
+        manager = Role.manage.add_role("manager")
+        director = Role.manage.add_role("director")
+        auditor = Role.manage.add_role("auditor")
+        director.grant_perms(Permission.objects.get(codename="view_role"))
+        director.set_incompatible_roles(auditor)
+        manager.set_senior_role(director)
+        clerk.set_senior_role(manager)
+
+    def test_matches_policy_built_through_api(self):
+        self.build_through_api()
+        expected = load_policy()
+        Role.objects.all().delete()
+
+        desired = parse_policy(self.document)
+        apply_policy_diff(PolicyDiff(load_policy(), desired))
+
+        self.assertEqual(load_policy(), expected)
+        self.assertFalse(PolicyDiff(load_policy(), desired))
+
+    def test_hierarchy_change_inherits_incompatible_roles(self):
+        self.build_through_api()
+        document = {
+            "roles": self.document["roles"]
+            + [{"name": "intern", "senior_role": "clerk"}]
+        }
+
+        apply_policy_diff(PolicyDiff(load_policy(), parse_policy(document)))
+
+        self.assertEqual(
+            set(
+                Role.objects.get(name="intern").incompatible_roles.values_list(
+                    "name", flat=True
+                )
+            ),
+            {"auditor"},
+        )
+
+    def test_many_permissions_and_incompatibilities(self):
+        content_type = ContentType.objects.get_for_model(Role)
+        Permission.objects.bulk_create(
+            Permission(
+                name="perm %d" % index,
+                content_type=content_type,
+                codename="perm_%d" % index,
+            )
+            for index in range(1500)
+        )
+        perms = ["rbaca.perm_%d" % index for index in range(1500)]
+        others = ["other_%d" % index for index in range(1500)]
+        document = {
+            "roles": [
+                {"name": "role", "permissions": perms, "incompatible_roles": others}
+            ]
+            + [{"name": name} for name in others]
+        }
+
+        apply_policy_diff(PolicyDiff(load_policy(), parse_policy(document)))
+        role = Role.objects.get(name="role")
+        self.assertEqual(role.permissions.count(), 1500)
+        self.assertEqual(role.incompatible_roles.count(), 1500)
+
+        document["roles"][0] = {"name": "role"}
+        apply_policy_diff(PolicyDiff(load_policy(), parse_policy(document)))
+        self.assertFalse(role.permissions.exists())
+        self.assertFalse(role.incompatible_roles.exists())
@@ -0,0 +1,252 @@
+from django.contrib.auth.models import Permission
+from django.db import connection
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+
+from rbaca.api.utils import jwt_payload_handler
+from rbaca.backends import RoleBackend
+from rbaca.cache import policy_changed
+from rbaca.forms import RoleExpirationForm, RoleForm, UserRoleForm
+from rbaca.models import Role, Session, User
+from rbaca.views import RoleDetail, RoleList
+
+SIZES = (1, 10, 50)
+
+
+@override_settings(
+    ROOT_URLCONF="tests.urls",
+    TEMPLATES=[
+        {
+            "BACKEND": "django.template.backends.django.DjangoTemplates",
+            "APP_DIRS": True,
+        }
+    ],
+)
+class TestQueryBudgets(TestCase):
+    """
+    The number of queries of each public entry point must not grow with the data.
+    Every budget is asserted for several data sizes, so an N+1 query fails loudly.
+    """
+
+    def setUp(self):
+        self.permissions = list(Permission.objects.order_by("id"))
+        self.admin = User.objects.create(username="admin")
+        self.viewer = Role.objects.create(name="viewer")
+        self.viewer.permissions.add(*self.permissions)
+        self.admin.roles.add(self.viewer)
+        self.factory = RequestFactory()
+
+    def assertQueryBudget(self, budget, func):
+        """
+        Assert that a function issues exactly `budget` queries, not counting savepoints.
+        """
+        with CaptureQueriesContext(connection) as context:
+            func()
+
+        queries = [
+            query["sql"]
+            for query in context.captured_queries
+            if not query["sql"].startswith(("SAVEPOINT", "RELEASE SAVEPOINT"))
+        ]
+        self.assertEqual(len(queries), budget, "\n".join(queries))
+
+    def create_roles(self, size):
+        roles = Role.objects.bulk_create(
+            [Role(name="role_%d_%d" % (size, index)) for index in range(size)]
+        )
+        return list(Role.objects.filter(name__in=[role.name for role in roles]))
+
+    def get_user(self, user=None):
+        return User.objects.get(pk=(user or self.admin).pk)
+
+    def render(self, view, query=None, **kwargs):
+        request = self.factory.get("/", query)
+        request.user = self.get_user()
+        return lambda: view.as_view()(request, **kwargs).render()
+
+    def test_role_detail(self):
+        senior_role = Role.objects.create(name="senior")
+
+        for size in SIZES:
+            role = Role.objects.create(name="detail_%d" % size, senior_role=senior_role)
+            role.permissions.add(*self.permissions[:size])
+            role.incompatible_roles.add(*self.create_roles(size))
+
+            with self.subTest(size=size):
+                # permission check, role with senior role, incompatible roles, permissions
+                self.assertQueryBudget(4, self.render(RoleDetail, pk=role.pk))
+                # the cached incompatible roles and permissions are not read again
+                self.assertQueryBudget(2, self.render(RoleDetail, pk=role.pk))
+
+    def test_role_list(self):
+        senior_role = Role.objects.create(name="senior")
+
+        for size in SIZES:
+            roles = self.create_roles(size)
+            Role.objects.filter(pk__in=[role.pk for role in roles]).update(
+                senior_role=senior_role
+            )
+            Role.permissions.through.objects.bulk_create(
+                [
+                    Role.permissions.through(role_id=role.pk, permission_id=perm.pk)
+                    for role in roles
+                    for perm in self.permissions[:size]
+                ]
+            )
+            Role.incompatible_roles.through.objects.bulk_create(
+                [
+                    Role.incompatible_roles.through(
+                        from_role_id=role.pk, to_role_id=other.pk
+                    )
+                    for role in roles
+                    for other in roles
+                    if role != other
+                ]
+            )
+            policy_changed()
+
+            with self.subTest(size=size):
+                # permission check, roles with senior role, incompatible roles, permissions
+                self.assertQueryBudget(4, self.render(RoleList))
+                self.assertQueryBudget(1, self.render(RoleList))
+                self.assertQueryBudget(
+                    4,
+                    self.render(RoleList, query={"q": "role", "after": senior_role.pk}),
+                )
+
+    def test_has_perm_repeated(self):
+        for size in SIZES:
+            self.admin.roles.add(*self.create_roles(size))
+            user = self.get_user()
+
+            with self.subTest(size=size):
+                self.assertQueryBudget(
+                    1, lambda: [user.has_perm("rbaca.view_role") for _ in range(100)]
+                )
+                self.assertQueryBudget(
+                    0,
+                    lambda: user.has_perms(
+                        ["rbaca.view_role", "rbaca.add_role", "rbaca.change_role"]
+                    ),
+                )
+
+    def test_has_role_repeated(self):
+        for size in SIZES:
+            self.admin.roles.add(*self.create_roles(size))
+            user = self.get_user()
+
+            with self.subTest(size=size):
+                self.assertQueryBudget(
+                    1, lambda: [user.has_role("viewer") for _ in range(100)]
+                )
+
+    def test_template_tags(self):
+        template = Template(
+            "{% load rbaca_tags %}{% for perm in perms %}"
+            "{% has_perm user perm %}{% has_role user 'viewer' %}"
+            "{% endfor %}"
+        )
+
+        for size in SIZES:
+            perms = [
+                "%s.%s" % (perm.content_type.app_label, perm.codename)
+                for perm in Permission.objects.select_related("content_type")[:size]
+            ]
+            user = self.get_user()
+
+            with self.subTest(size=size):
+                self.assertQueryBudget(
+                    2,
+                    lambda: template.render(Context({"user": user, "perms": perms})),
+                )
+
+    def test_assign_roles(self):
+        for size in SIZES:
+            user = User.objects.create(username="assign_%d" % size)
+            roles = self.create_roles(size)
+            user.roles.add(*roles[: size // 2])
+
+            with self.subTest(size=size):
+                self.assertQueryBudget(5, lambda: user.assign_roles(roles[size // 2 :]))
+
+    def test_deassign_roles(self):
+        for size in SIZES:
+            user = User.objects.create(username="deassign_%d" % size)
+            roles = self.create_roles(size)
+            user.roles.add(*roles)
+
+            with self.subTest(size=size):
+                self.assertQueryBudget(1, lambda: user.deassign_roles(roles))
+
+    def test_role_expiration_form(self):
+        for size in SIZES:
+            user = User.objects.create(username="expiration_%d" % size)
+            roles = self.create_roles(size + 1)
+            user.roles.add(*roles[:size])
+
+            with self.subTest(size=size):
+                self.assertQueryBudget(
+                    8,
+                    lambda: RoleExpirationForm(
+                        user,
+                        allow_superroles=True,
+                        data={"role": roles[-1].pk, "expiration_date": now().date()},
+                    ).is_valid(),
+                )
+
+    def test_user_role_form(self):
+        for size in SIZES:
+            user = User.objects.create(username="user_role_%d" % size)
+            roles = self.create_roles(size)
+
+            with self.subTest(size=size):
+                self.assertQueryBudget(
+                    4,
+                    lambda: UserRoleForm(
+                        instance=user, data={"roles": [role.pk for role in roles]}
+                    ).is_valid(),
+                )
+
+    def test_role_form(self):
+        for size in SIZES:
+            roles = self.create_roles(size)
+
+            with self.subTest(size=size):
+                self.assertQueryBudget(
+                    3,
+                    lambda: RoleForm(
+                        data={
+                            "name": "form_%d" % size,
+                            "permissions": [
+                                perm.pk for perm in self.permissions[:size]
+                            ],
+                            "incompatible_roles": [role.pk for role in roles],
+                        }
+                    ).is_valid(),
+                )
+
+    def test_node_access_and_jwt_payload(self):
+        for size in SIZES:
+            self.admin.roles.add(*self.create_roles(size))
+
+            with self.subTest(size=size):
+                user = self.get_user()
+                self.assertQueryBudget(1, lambda: RoleBackend().get_node_access(user))
+                user = self.get_user()
+                self.assertQueryBudget(1, lambda: jwt_payload_handler(user))
+
+    @override_settings(USE_SESSIONS=True)
+    def test_session_permission_checks(self):
+        for size in SIZES:
+            roles = self.create_roles(size)
+            self.admin.roles.add(*roles)
+            Session.objects.filter(user=self.admin).delete()
+            Session.manage.add_session(self.admin, roles + [self.viewer])
+
+            with self.subTest(size=size):
+                user = self.get_user()
+                self.assertQueryBudget(
+                    2, lambda: [user.has_perm("rbaca.view_role") for _ in range(100)]
+                )
@@ -0,0 +1,118 @@
+from unittest import mock
+
+from django.contrib.auth.models import Permission
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+
+from rbaca.models import Role, User
+from rbaca.views import KeysetPage, RoleDetail, RoleList
+
+
+class TestKeysetPage(TestCase):
+    def setUp(self):
+        self.roles = [Role.objects.create(name="role_%d" % index) for index in range(5)]
+
+    def get_names(self, page):
+        return [role.name for role in page]
+
+    def test_pages(self):
+        page = KeysetPage(Role.objects.all(), 2)
+        self.assertEqual(self.get_names(page), ["role_0", "role_1"])
+        self.assertFalse(page.has_previous)
+        self.assertTrue(page.has_next)
+
+        page = KeysetPage(Role.objects.all(), 2, after=page.next_cursor)
+        self.assertEqual(self.get_names(page), ["role_2", "role_3"])
+        self.assertTrue(page.has_previous)
+        self.assertTrue(page.has_next)
+
+        page = KeysetPage(Role.objects.all(), 2, after=page.next_cursor)
+        self.assertEqual(self.get_names(page), ["role_4"])
+        self.assertFalse(page.has_next)
+        self.assertIsNone(page.next_cursor)
+
+        page = KeysetPage(Role.objects.all(), 2, before=page.previous_cursor)
+        self.assertEqual(self.get_names(page), ["role_2", "role_3"])
+        self.assertTrue(page.has_previous)
+
+        page = KeysetPage(Role.objects.all(), 2, before=page.previous_cursor)
+        self.assertEqual(self.get_names(page), ["role_0", "role_1"])
+        self.assertFalse(page.has_previous)
+
+    def test_lazy(self):
+        with self.assertNumQueries(0):
+            page = KeysetPage(Role.objects.all(), 2)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(len(page), 2)
+            self.assertTrue(page.has_next)
+
+
+@override_settings(
+    ROOT_URLCONF="tests.urls",
+    TEMPLATES=[
+        {
+            "BACKEND": "django.template.backends.django.DjangoTemplates",
+            "APP_DIRS": True,
+        }
+    ],
+)
+class TestRoleViews(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create(username="admin", is_superuser=True)
+        self.senior = Role.objects.create(name="manager")
+        self.role = Role.objects.create(name="clerk", senior_role=self.senior)
+        self.other = Role.objects.create(name="auditor")
+        self.role.incompatible_roles.add(self.other)
+        self.factory = RequestFactory()
+
+    def render(self, view, query=None, **kwargs):
+        request = self.factory.get("/", query)
+        request.user = self.admin
+        return view.as_view()(request, **kwargs).render().content.decode()
+
+    def test_role_list(self):
+        content = self.render(RoleList)
+
+        self.assertIn("clerk", content)
+        self.assertIn("Senior Role:", content)
+        self.assertIn("auditor", content)
+
+    def test_role_list_search(self):
+        content = self.render(RoleList, {"q": "MAN"})
+
+        self.assertIn(">manager<", content)
+        self.assertNotIn("clerk", content)
+
+    def test_role_list_pages(self):
+        with mock.patch.object(RoleList, "page_size", 2):
+            content = self.render(RoleList)
+            self.assertIn("after=%d" % self.role.pk, content)
+            self.assertNotIn("before=", content)
+
+            content = self.render(RoleList, {"after": self.role.pk})
+            self.assertIn(">auditor<", content)
+            self.assertIn("before=%d" % self.other.pk, content)
+            self.assertNotIn("after=", content)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(Http404):
+            self.render(RoleList, {"after": "foo"})
+
+    def test_cache_invalidated_on_policy_change(self):
+        self.assertIn(">auditor<", self.render(RoleList))
+
+        self.other.name = "reviewer"
+        self.other.save()
+
+        content = self.render(RoleList)
+        self.assertIn(">reviewer<", content)
+        self.assertNotIn(">auditor<", content)
+
+    def test_role_detail(self):
+        self.role.permissions.add(Permission.objects.get(codename="view_role"))
+        content = self.render(RoleDetail, pk=self.role.pk)
+
+        self.assertIn("manager", content)
+        self.assertIn("auditor", content)
+        self.assertIn("rbaca.view_role", content)